@@ -0,0 +1,92 @@
+"""
+Recall vs latency for the neighbor-search backends in flask_app.neighbors.
+
+    python -m benchmarks.neighbor_recall --users 50000 --tags 40 --k 5
+    python -m benchmarks.neighbor_recall --from-store     # use the live model store matrix
+
+Recall is measured against the exact (brute force) top-k for the same queries.
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from flask_app.neighbors import BACKENDS, BruteForceIndex
+
+
+def synthetic_vectors(n_users: int, n_tags: int, n_clusters: int = 20, seed: int = 0) -> np.ndarray:
+    """
+    Clustered taste vectors: a few "archetypes" plus noise, some negative (hated tags).
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.gamma(1.0, 2.0, size=(n_clusters, n_tags)) - rng.binomial(1, 0.1, size=(n_clusters, n_tags)) * 5
+    labels = rng.integers(0, n_clusters, size=n_users)
+    return (centers[labels] + rng.normal(0, 1.0, size=(n_users, n_tags))).astype(np.float32)
+
+
+def run(X: np.ndarray, k: int, n_queries: int, backends, seed: int = 0) -> list:
+    rng = np.random.default_rng(seed)
+    queries = X[rng.choice(len(X), size=min(n_queries, len(X)), replace=False)]
+
+    exact = BruteForceIndex(X)
+    truth = [set(exact.query(q, k)[0].tolist()) for q in queries]
+
+    results = []
+    for name in backends:
+        t = time.perf_counter()
+        index = BACKENDS[name](X)
+        build = time.perf_counter() - t
+
+        hits = 0
+        t = time.perf_counter()
+        for q, true_rows in zip(queries, truth):
+            rows, _ = index.query(q, k)
+            hits += len(true_rows & set(rows.tolist()))
+        elapsed = time.perf_counter() - t
+
+        results.append({
+            "backend": name,
+            "users": len(X),
+            "tags": X.shape[1],
+            "k": k,
+            "build_s": round(build, 4),
+            "query_ms": round(1000 * elapsed / len(queries), 4),
+            "recall": round(hits / (k * len(queries)), 4),
+        })
+    return results
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--users", type=int, default=20000)
+    p.add_argument("--tags", type=int, default=30)
+    p.add_argument("--k", type=int, default=5)
+    p.add_argument("--queries", type=int, default=200)
+    p.add_argument("--backends", default=",".join(BACKENDS))
+    p.add_argument("--from-store", action="store_true", help="benchmark the live model store matrix")
+    p.add_argument("--json", action="store_true", help="print JSON lines instead of a table")
+    args = p.parse_args()
+
+    if args.from_store:
+        from flask_app.model_store import get_model
+        model = get_model()
+        if model is None:
+            raise SystemExit("No trained model in MODEL_STORE_DIR")
+        X = np.asarray(model.vectors)
+    else:
+        X = synthetic_vectors(args.users, args.tags)
+
+    results = run(X, args.k, args.queries, args.backends.split(","))
+    if args.json:
+        for r in results:
+            print(json.dumps(r))
+        return
+
+    print(f"{'backend':<10}{'build_s':>10}{'query_ms':>10}{'recall':>8}")
+    for r in results:
+        print(f"{r['backend']:<10}{r['build_s']:>10}{r['query_ms']:>10}{r['recall']:>8}")
+
+
+if __name__ == "__main__":
+    main()
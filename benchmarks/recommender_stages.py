@@ -0,0 +1,239 @@
+"""
+Per-stage timings and peak memory of the recommender hot paths on synthetic data.
+
+    python -m benchmarks.recommender_stages --users 10000 --mongomock
+    python -m benchmarks.recommender_stages --users 100000 --mongo-uri mongodb://localhost:27017 -o after.json
+    python -m benchmarks.recommender_stages --users 100000 --reuse -o after.json --compare before.json
+
+Data comes from benchmarks.synthetic (same --users/--games/--seed -> same data) and is
+written to a scratch database (--db, dropped and refilled unless --reuse). The model store
+goes to a temp directory, never to the app's MODEL_STORE_DIR.
+
+Each stage is timed --repeat times (median reported), then run once more under
+tracemalloc for its peak Python/NumPy allocation (skip with --no-memory, it's slow).
+--compare exits 1 if any stage got slower / bigger than the baseline by more than --threshold.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+STAGES = ["vocab_scan", "vocab", "training_data", "train_model", "catalog_index", "tag_scorer", "knn_library", "knn_pins"]
+
+
+def connect(args):
+    """
+    Point mongoengine's default alias (what the app's models use) at the bench database.
+    """
+    import mongoengine
+
+    if args.mongomock:
+        import mongomock
+        import mongomock.collection
+
+        # pymongo 4.9+ passes sort= to bulk updates, older mongomock doesn't accept it
+        add_update = mongomock.collection.BulkOperationBuilder.add_update
+        mongomock.collection.BulkOperationBuilder.add_update = (
+            lambda self, *a, sort=None, **kw: add_update(self, *a, **kw)
+        )
+        mongoengine.connect(args.db, host="mongodb://localhost", mongo_client_class=mongomock.MongoClient)
+    else:
+        mongoengine.connect(args.db, host=args.mongo_uri)
+    return mongoengine.get_db()
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def measure(fn, repeat: int, memory: bool) -> dict:
+    runs, out = [], None
+    for _ in range(repeat):
+        t = time.perf_counter()
+        out = fn()
+        runs.append(time.perf_counter() - t)
+    result = {"seconds": round(statistics.median(runs), 4), "runs": [round(r, 4) for r in runs]}
+    if memory:
+        tracemalloc.start()
+        fn()
+        result["peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 2**20, 2)
+        tracemalloc.stop()
+    return result, out
+
+
+def stage_functions(sample_users):
+    """
+    name -> zero-arg callable, in STAGES order. Imported late so MODEL_STORE_DIR is set first.
+    """
+    from flask_app.recommender import build_tag_vocab, build_training_data
+    from flask_app.vocab import get_vocab
+    from flask_app.train import train_model
+    from flask_app.catalog_index import get_catalog_index, invalidate_catalog_index
+    from flask_app.recommendation_service import RecommendationService
+
+    service = RecommendationService()
+
+    def per_user(strategy):
+        return lambda: [service.recommend(u, strategy, use_cache=False) for u in sample_users]
+
+    def catalog_index():
+        invalidate_catalog_index()
+        return get_catalog_index()
+
+    return {
+        "vocab_scan": build_tag_vocab,
+        "vocab": get_vocab,
+        "training_data": lambda: build_training_data(get_vocab()),
+        "train_model": train_model,
+        "catalog_index": catalog_index,
+        "tag_scorer": per_user("tags"),
+        "knn_library": per_user("knn_library"),
+        "knn_pins": per_user("knn_pins"),
+    }
+
+
+def run(args) -> dict:
+    db = connect(args)
+
+    from benchmarks.synthetic import populate
+    from flask_app.models import User
+    from flask_app.query_plans import MODELS
+
+    params = {"users": args.users, "games": args.games, "tags": args.tags, "seed": args.seed}
+    meta = db.bench_meta.find_one({"_id": "params"})
+    generate_s = None
+    if not (args.reuse and meta and meta.get("params") == params):
+        t = time.perf_counter()
+        counts = populate(db, args.users, args.games, args.tags, args.seed,
+                          progress=lambda c: print(f"  generated {c['users']} users", file=sys.stderr))
+        generate_s = round(time.perf_counter() - t, 2)
+        db.bench_meta.replace_one({"_id": "params"}, {"params": params, "counts": counts}, upsert=True)
+    counts = db.bench_meta.find_one({"_id": "params"})["counts"]
+    for model in MODELS:
+        model.ensure_indexes()
+
+    rng = np.random.default_rng(args.seed)
+    ids = [d["_id"] for d in db.users.find({}, {"_id": 1})]
+    picked = [ids[i] for i in rng.choice(len(ids), size=min(args.queries, len(ids)), replace=False)]
+    sample_users = list(User.objects(id__in=picked))
+
+    fns = stage_functions(sample_users)
+    wanted = args.stages.split(",") if args.stages else STAGES
+    stages = {}
+    for name in STAGES:
+        if name not in wanted:
+            continue
+        print(f"  {name}...", file=sys.stderr)
+        result, out = measure(fns[name], args.repeat, not args.no_memory)
+        if name.startswith(("tag_", "knn_")):
+            result["per_query_ms"] = round(1000 * result["seconds"] / max(len(sample_users), 1), 3)
+        if name == "train_model":
+            result["breakdown"] = out["timings"]
+        stages[name] = result
+
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "backend": "mongomock" if args.mongomock else "mongod",
+            "neighbor_backend": os.getenv("NEIGHBOR_BACKEND", "brute"),
+            "params": params,
+            "counts": counts,
+            "queries": len(sample_users),
+            "repeat": args.repeat,
+            "generate_s": generate_s,
+        },
+        "stages": stages,
+    }
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> list:
+    """
+    Regressions vs a baseline results file: stages whose median time or peak memory
+    grew by more than threshold (0.2 = 20%). Sub-millisecond stages are ignored (noise).
+    """
+    if current["meta"]["params"] != baseline["meta"]["params"]:
+        print("warning: baseline was run with different parameters "
+              f"({baseline['meta']['params']})", file=sys.stderr)
+    regressions = []
+    for name, now in current["stages"].items():
+        before = baseline["stages"].get(name)
+        if not before:
+            continue
+        for metric, floor in (("seconds", 0.001), ("peak_mb", 0.5)):
+            if metric not in now or metric not in before or before[metric] < floor:
+                continue
+            change = now[metric] / before[metric] - 1
+            if change > threshold:
+                regressions.append({"stage": name, "metric": metric, "before": before[metric],
+                                    "after": now[metric], "change": round(change, 3)})
+    return regressions
+
+
+def print_table(results: dict, baseline: dict = None):
+    print(f"{'stage':<15}{'seconds':>10}{'peak_mb':>10}{'per_query_ms':>14}{'vs base':>10}")
+    for name, r in results["stages"].items():
+        vs = ""
+        if baseline and name in baseline["stages"] and baseline["stages"][name]["seconds"] > 0:
+            vs = f"{r['seconds'] / baseline['stages'][name]['seconds']:.2f}x"
+        print(f"{name:<15}{r['seconds']:>10}{r.get('peak_mb', ''):>10}{r.get('per_query_ms', ''):>14}{vs:>10}")
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--users", type=int, default=10000)
+    p.add_argument("--games", type=int, default=5000)
+    p.add_argument("--tags", type=int, default=120)
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--queries", type=int, default=50, help="users sampled for the per-request stages")
+    p.add_argument("--repeat", type=int, default=3)
+    p.add_argument("--stages", help=f"comma separated subset of {','.join(STAGES)}")
+    p.add_argument("--mongomock", action="store_true", help="in-memory mongomock instead of a server")
+    p.add_argument("--mongo-uri", default=os.getenv("BENCH_MONGO_URI", "mongodb://localhost:27017"))
+    p.add_argument("--db", default="steam_bench", help="scratch database (dropped and refilled)")
+    p.add_argument("--reuse", action="store_true", help="keep existing data if generated with the same parameters")
+    p.add_argument("--no-memory", action="store_true", help="skip the tracemalloc pass")
+    p.add_argument("-o", "--output", help="write results JSON here")
+    p.add_argument("--compare", help="baseline results JSON to check for regressions")
+    p.add_argument("--threshold", type=float, default=0.2)
+    args = p.parse_args()
+
+    # Never train into the app's model store
+    os.environ["MODEL_STORE_DIR"] = tempfile.mkdtemp(prefix="steam_bench_store_")
+    os.environ.setdefault("RETRAIN_ASYNC", "0")
+
+    results = run(args)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    print_table(results, baseline)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if baseline:
+        regressions = compare(results, baseline, args.threshold)
+        for r in regressions:
+            print(f"REGRESSION {r['stage']} {r['metric']}: {r['before']} -> {r['after']} (+{r['change']:.0%})")
+        if regressions:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
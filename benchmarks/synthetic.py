@@ -0,0 +1,136 @@
+"""
+Deterministic synthetic catalog + user base for the benchmarks.
+
+Shapes follow what a real Steam population looks like:
+  - game popularity is Zipf: a few games are in almost every library, most are rare
+  - library sizes are Zipf too (most users own a handful of games, a few own thousands)
+  - playtime is log-normal with a heavy tail, longer for popular games
+  - tags: each game gets 3-20 tags, tag popularity is Zipf over the app's known
+    tags (forms.TAG_CHOICES) followed by a long tail of niche ones
+  - a fraction of owned games is rated 1..10, correlated with playtime
+  - some users have favorite / hated tags and a few pinned games
+
+The same (users, games, seed) always produces the same documents.
+"""
+from __future__ import annotations
+import numpy as np
+from bson import ObjectId
+
+from flask_app.forms import TAG_CHOICES
+
+# Users / rows per insert_many
+INSERT_BATCH = 5000
+
+
+def tag_names(n_tags: int) -> list:
+    head = [t for t, _ in TAG_CHOICES]
+    return (head + [f"Niche Tag {i:03d}" for i in range(n_tags - len(head))])[:n_tags]
+
+
+def zipf_weights(n: int, s: float) -> np.ndarray:
+    w = 1.0 / np.arange(1, n + 1) ** s
+    return w / w.sum()
+
+
+def make_games(n_games: int, n_tags: int = 120, seed: int = 0) -> list:
+    """
+    Game documents; appid order is popularity order (appid 10 is the most owned).
+    """
+    rng = np.random.default_rng(seed)
+    names = tag_names(n_tags)
+    tag_p = zipf_weights(len(names), 1.1)
+    games = []
+    for i in range(n_games):
+        k = int(rng.integers(3, 21))
+        picked = rng.choice(len(names), size=min(k, len(names)), replace=False, p=tag_p)
+        games.append({
+            "appid": 10 * (i + 1),
+            "name": f"Synthetic Game {i + 1}",
+            "tags": [names[t] for t in picked],
+            "global_rating": round(float(np.clip(rng.normal(7.0, 1.5), 0, 10)), 2),
+        })
+    return games
+
+
+def iter_users(n_users: int, n_games: int, n_tags: int = 120, seed: int = 0, max_library: int = 2000):
+    """
+    Yields (user_doc, owned_rows, rating_rows) per user, ids already assigned.
+    """
+    rng = np.random.default_rng(seed + 1)
+    names = tag_names(n_tags)
+    game_p = zipf_weights(n_games, 0.9)
+    appids = 10 * (np.arange(n_games) + 1)
+    max_library = min(max_library, n_games)
+
+    for i in range(n_users):
+        uid = ObjectId(f"{seed:08x}{i:016x}")  # deterministic, insertion ordered
+        size = min(int(rng.zipf(1.6)) * 3, max_library)
+        cols = np.unique(rng.choice(n_games, size=size, p=game_p))
+        # Popular games get played longer; minutes, heavy tailed
+        minutes = rng.lognormal(mean=5.0 - 0.3 * np.log1p(cols / 50), sigma=1.6).astype(np.int64)
+        minutes[rng.random(len(cols)) < 0.15] = 0  # never launched
+
+        rated = rng.random(len(cols)) < 0.1
+        rating = np.clip(np.round(3 + np.log1p(minutes / 60.0) + rng.normal(0, 1.5, len(cols))), 1, 10).astype(int)
+
+        fav = hated = []
+        if rng.random() < 0.5:
+            fav = sorted({names[t] for t in rng.integers(0, min(len(names), 30), size=rng.integers(1, 4))})
+        if rng.random() < 0.2:
+            hated = sorted({names[t] for t in rng.integers(0, min(len(names), 30), size=rng.integers(1, 3))} - set(fav))
+        pinned = [int(appids[c]) for c in cols[:3]] if rng.random() < 0.1 else []
+
+        user = {
+            "_id": uid,
+            "email": f"bench{i}@example.com",
+            "password_hash": "x",
+            "favorite_tags": fav,
+            "hated_tags": hated,
+            "pinned_games": pinned,
+            "game_count": int(len(cols)),
+            "data_version": 0,
+        }
+        owned = [
+            {"user_id": uid, "appid": int(appids[c]), "playtime_forever": int(m)}
+            for c, m in zip(cols, minutes)
+        ]
+        ratings = [
+            {"user_id": uid, "appid": int(appids[c]), "rating": int(r)}
+            for c, r, keep in zip(cols, rating, rated) if keep
+        ]
+        yield user, owned, ratings
+
+
+def populate(db, n_users: int, n_games: int, n_tags: int = 120, seed: int = 0, progress=None) -> dict:
+    """
+    Drop and refill users / games / owned_games / ratings in a pymongo database
+    (and drop the stored tag vocab, so it is re-seeded from the new catalog).
+    Returns document counts.
+    """
+    for name in ("users", "games", "owned_games", "ratings", "tag_vocab"):
+        db.drop_collection(name)
+
+    games = make_games(n_games, n_tags, seed)
+    for start in range(0, len(games), INSERT_BATCH):
+        db.games.insert_many(games[start:start + INSERT_BATCH], ordered=False)
+
+    counts = {"games": len(games), "users": 0, "owned_games": 0, "ratings": 0}
+    users, owned, ratings = [], [], []
+
+    def flush():
+        for coll, docs in (("users", users), ("owned_games", owned), ("ratings", ratings)):
+            if docs:
+                db[coll].insert_many(docs, ordered=False)
+                counts[coll] += len(docs)
+                docs.clear()
+        if progress:
+            progress(counts)
+
+    for user, rows, rates in iter_users(n_users, n_games, n_tags, seed):
+        users.append(user)
+        owned.extend(rows)
+        ratings.extend(rates)
+        if len(users) >= INSERT_BATCH:
+            flush()
+    flush()
+    return counts
@@ -27,15 +27,29 @@ def create_app():
     
     app.config["MONGODB_SETTINGS"] = {"host": mongo_uri}
 
+    from .model_store import check_store_dir
+    check_store_dir()
+
+    # Before db.init_app: the Mongo command listener has to exist before the client does
+    from . import metrics
+    metrics.init_app(app)
+
     db.init_app(app)
     login_manager.init_app(app)
     csrf.init_app(app)
 
-    from .models import User
+    from .jobs import retrainer
+    retrainer.init_app(app)
+
+    from . import cli
+    cli.init_app(app)
+
+    from .user_context import load_user_context
 
     @login_manager.user_loader
     def load_user(user_id):
-        return User.objects(id=user_id).first()
+        # Runs on every request: auth fields only, the profile loads lazily (see user_context.py)
+        return load_user_context(user_id)
 
 
     from .routes import main
@@ -0,0 +1,276 @@
+from __future__ import annotations
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+from scipy import sparse
+from threadpoolctl import threadpool_limits
+
+from .models import User, Rating
+from .model_store import MODEL_STORE_DIR
+from .recommender import load_interactions
+from .library import get_library, owned_appids
+
+# Implicit-feedback ALS (Hu, Koren & Volinsky) hyperparameters
+ALS_FACTORS = int(os.getenv("ALS_FACTORS", "32"))
+ALS_ITERATIONS = int(os.getenv("ALS_ITERATIONS", "10"))
+ALS_REG = float(os.getenv("ALS_REG", "0.1"))
+ALS_ALPHA = float(os.getenv("ALS_ALPHA", "10"))
+# BLAS threads used while training (None = library default, usually all cores)
+ALS_THREADS = int(os.getenv("ALS_THREADS")) if os.getenv("ALS_THREADS") else None
+# Observed cells per batched solve; the block's outer products take ~ cells * factors^2 * 4 bytes
+ALS_BLOCK_NNZ = int(os.getenv("ALS_BLOCK_NNZ", "8192"))
+# Folded-in users whose factors are kept per worker (latest data_version only)
+ALS_FOLD_CACHE_SIZE = int(os.getenv("ALS_FOLD_CACHE_SIZE", "10000"))
+
+_lock = threading.Lock()
+_model: Optional["ALSModel"] = None
+
+
+def _model_path() -> str:
+    return os.path.join(MODEL_STORE_DIR, "als.npz")
+
+
+def _cell(minutes: float = None, rating: float = None):
+    """
+    (preference, confidence weight) for one user/game pair.
+    Ratings override hours: >= 6 is a confident like, <= 5 a confident dislike.
+    """
+    if rating is not None:
+        if rating >= 6:
+            return 1.0, rating / 2.0
+        return 0.0, (6 - rating) / 2.0
+    return 1.0, 0.1 + float(np.log1p(minutes / 60.0))
+
+
+def build_preference_matrices(alpha: float = ALS_ALPHA):
+    """
+    Returns (user_ids, appids, P, C1) as CSR (users x games):
+      P  = preference (0/1) for observed pairs
+      C1 = confidence - 1 = alpha * weight for observed pairs
+    """
+    user_ids, owned, ratings = load_interactions()
+
+    cells: Dict[tuple, tuple] = {}
+    for row, appid, minutes in zip(owned["user"].tolist(), owned["appid"].tolist(), owned["minutes"].tolist()):
+        cells[(row, appid)] = _cell(minutes=minutes)
+    for row, appid, rating in zip(ratings["user"].tolist(), ratings["appid"].tolist(), ratings["rating"].tolist()):
+        cells[(row, appid)] = _cell(rating=rating)
+
+    rows = np.fromiter((k[0] for k in cells), dtype=np.int64, count=len(cells))
+    raw_appids = np.fromiter((k[1] for k in cells), dtype=np.int64, count=len(cells))
+    prefs = np.fromiter((v[0] for v in cells.values()), dtype=np.float32, count=len(cells))
+    weights = np.fromiter((v[1] for v in cells.values()), dtype=np.float32, count=len(cells))
+
+    appids, cols = np.unique(raw_appids, return_inverse=True)
+    shape = (len(user_ids), len(appids))
+
+    # Build both CSRs from one sorted layout so their .data arrays line up entry for entry
+    # (and P keeps its explicit zeros for disliked games)
+    order = np.lexsort((cols, rows))
+    indptr = np.concatenate([[0], np.cumsum(np.bincount(rows, minlength=shape[0]))])
+    indices = cols[order]
+    P = sparse.csr_matrix((prefs[order], indices, indptr), shape=shape)
+    C1 = sparse.csr_matrix(((alpha * weights)[order], indices.copy(), indptr.copy()), shape=shape)
+    return user_ids, appids, P, C1
+
+
+def _transpose_aligned(P: sparse.csr_matrix, C1: sparse.csr_matrix):
+    """
+    Transpose both matrices with the same permutation (scipy may drop P's explicit zeros otherwise).
+    """
+    rows = np.repeat(np.arange(P.shape[0]), np.diff(P.indptr))
+    cols = P.indices
+    order = np.lexsort((rows, cols))
+    indptr = np.concatenate([[0], np.cumsum(np.bincount(cols, minlength=P.shape[1]))])
+    shape = (P.shape[1], P.shape[0])
+    PT = sparse.csr_matrix((P.data[order], rows[order], indptr), shape=shape)
+    C1T = sparse.csr_matrix((C1.data[order], rows[order].copy(), indptr.copy()), shape=shape)
+    return PT, C1T
+
+
+def _solve_row(Y: np.ndarray, YtY: np.ndarray, idx: np.ndarray, c1: np.ndarray, p: np.ndarray, reg: float) -> np.ndarray:
+    """
+    x = (YtY + Y_u^T (C_u - I) Y_u + reg I)^-1  Y_u^T C_u p_u
+    Only the observed rows of Y enter the correction term, so this is cheap per user.
+    """
+    f = Y.shape[1]
+    if len(idx) == 0:
+        return np.zeros(f, dtype=np.float32)
+    Yu = Y[idx]
+    A = YtY + (Yu.T * c1) @ Yu + reg * np.eye(f, dtype=Y.dtype)
+    b = Yu.T @ ((1.0 + c1) * p)
+    return np.linalg.solve(A, b).astype(np.float32)
+
+
+def _solve_block(Y: np.ndarray, YtY: np.ndarray, rows: np.ndarray, P: sparse.csr_matrix,
+                 C1: sparse.csr_matrix, reg: float) -> np.ndarray:
+    """
+    _solve_row for many rows at once. Their cells are padded to the longest row (padding
+    gets zero confidence and preference, so it adds nothing), the correction terms come out
+    of one batched matmul and the stacked f x f systems out of one batched np.linalg.solve.
+    """
+    f = Y.shape[1]
+    lo, counts = P.indptr[rows], np.diff(P.indptr)[rows]
+    width = np.arange(counts.max())
+    mask = width[None, :] < counts[:, None]
+    pos = np.where(mask, lo[:, None] + width[None, :], 0)
+
+    Yu = Y[P.indices[pos]]                      # rows x width x f
+    c1 = np.where(mask, C1.data[pos], 0.0).astype(Y.dtype)
+    p = np.where(mask, P.data[pos], 0.0).astype(Y.dtype)
+    A = np.matmul((Yu * c1[:, :, None]).transpose(0, 2, 1), Yu)
+    A += YtY + reg * np.eye(f, dtype=Y.dtype)
+    b = np.matmul(((1.0 + c1) * p)[:, None, :], Yu)[:, 0, :]
+    return np.linalg.solve(A, b[:, :, None])[:, :, 0].astype(np.float32)
+
+
+def _solve_all(Y: np.ndarray, P: sparse.csr_matrix, C1: sparse.csr_matrix, reg: float) -> np.ndarray:
+    YtY = Y.T @ Y
+    out = np.zeros((P.shape[0], Y.shape[1]), dtype=np.float32)
+    counts = np.diff(P.indptr)
+
+    # Rows with more cells than a whole block (e.g. huge libraries) are one GEMM each anyway
+    for r in np.flatnonzero(counts > ALS_BLOCK_NNZ):
+        lo, hi = P.indptr[r], P.indptr[r + 1]
+        out[r] = _solve_row(Y, YtY, P.indices[lo:hi], C1.data[lo:hi], P.data[lo:hi], reg)
+
+    # The rest in blocks of about ALS_BLOCK_NNZ padded cells. Rows are grouped by length
+    # rounded up to a power of two, so padding never more than doubles a block; empty rows stay zero
+    rows = np.flatnonzero((counts > 0) & (counts <= ALS_BLOCK_NNZ))
+    width = 2 ** np.ceil(np.log2(counts[rows])).astype(np.int64)
+    for w in np.unique(width):
+        group = rows[width == w]
+        per_block = max(1, ALS_BLOCK_NNZ // int(w))
+        for start in range(0, len(group), per_block):
+            block = group[start:start + per_block]
+            out[block] = _solve_block(Y, YtY, block, P, C1, reg)
+    return out
+
+
+def train_als(factors: int = ALS_FACTORS, iterations: int = ALS_ITERATIONS, reg: float = ALS_REG,
+              alpha: float = ALS_ALPHA, seed: int = 0) -> dict:
+    """
+    Alternate exact least-squares solves for user and item factors, then persist them.
+    """
+    t = time.perf_counter()
+    # Remember which data each user's factors are trained on, so later changes trigger a fold-in.
+    # Read before the interactions: a change landing in between then shows up as stale and gets
+    # folded in, instead of being stamped as already trained on
+    versions = {str(u.id): u.data_version or 0 for u in User.objects.only("data_version")}
+    user_ids, appids, P, C1 = build_preference_matrices(alpha)
+    PT, C1T = _transpose_aligned(P, C1)
+
+    rng = np.random.default_rng(seed)
+    X = (rng.standard_normal((len(user_ids), factors)) * 0.01).astype(np.float32)
+    Y = (rng.standard_normal((len(appids), factors)) * 0.01).astype(np.float32)
+
+    with threadpool_limits(limits=ALS_THREADS):
+        for _ in range(iterations if len(appids) else 0):
+            X = _solve_all(Y, P, C1, reg)
+            Y = _solve_all(X, PT, C1T, reg)
+        # Final user pass so stored user factors match the final item factors (same as a fold-in)
+        if len(appids):
+            X = _solve_all(Y, P, C1, reg)
+
+    user_versions = np.array([versions.get(uid, -1) for uid in user_ids], dtype=np.int64)
+
+    os.makedirs(MODEL_STORE_DIR, exist_ok=True)
+    tmp = _model_path() + ".tmp.npz"
+    np.savez(tmp, user_ids=np.array(user_ids, dtype=str), user_versions=user_versions,
+             appids=appids, user_factors=X, item_factors=Y, reg=reg, alpha=alpha)
+    os.replace(tmp, _model_path())
+
+    return {"users": len(user_ids), "games": len(appids), "factors": factors,
+            "iterations": iterations, "seconds": round(time.perf_counter() - t, 4)}
+
+
+class ALSModel:
+    def __init__(self, f, mtime: float):
+        self.user_ids = [str(u) for u in f["user_ids"]]
+        self.row_of = {uid: i for i, uid in enumerate(self.user_ids)}
+        self.user_versions = f["user_versions"]
+        self.appids = f["appids"]
+        self.pos_of = {int(a): i for i, a in enumerate(self.appids)}
+        self.user_factors = f["user_factors"]
+        self.item_factors = f["item_factors"]
+        self.YtY = self.item_factors.T @ self.item_factors
+        self.reg = float(f["reg"])
+        self.alpha = float(f["alpha"])
+        self.mtime = mtime
+        self.folded = OrderedDict()  # user_id -> (data_version, factors), least recently used first
+        self.folded_lock = threading.Lock()
+
+    def fold_in(self, user) -> np.ndarray:
+        """
+        Solve for one user's factors against the fixed item factors, from their current
+        library and ratings. No retraining; one small linear solve.
+        """
+        cells = {}
+        for g in get_library(user.id):
+            if g["appid"] in self.pos_of:
+                cells[g["appid"]] = _cell(minutes=g.get("playtime_forever", 0) or 0)
+        for r in Rating.objects(user_id=user.id).only("appid", "rating"):
+            if r.appid in self.pos_of:
+                cells[r.appid] = _cell(rating=r.rating)
+
+        idx = np.array([self.pos_of[a] for a in cells], dtype=np.int64)
+        p = np.array([v[0] for v in cells.values()], dtype=np.float32)
+        c1 = np.array([self.alpha * v[1] for v in cells.values()], dtype=np.float32)
+        return _solve_row(self.item_factors, self.YtY, idx, c1, p, self.reg)
+
+    def user_vector(self, user) -> np.ndarray:
+        uid = str(user.id)
+        version = user.data_version or 0
+        i = self.row_of.get(uid)
+        if i is not None and self.user_versions[i] == version:
+            return self.user_factors[i]
+
+        with self.folded_lock:
+            entry = self.folded.get(uid)
+            if entry and entry[0] == version:
+                self.folded.move_to_end(uid)
+                return entry[1]
+
+        factors = self.fold_in(user)
+        with self.folded_lock:
+            # Replaces any older version of this user
+            self.folded[uid] = (version, factors)
+            self.folded.move_to_end(uid)
+            while len(self.folded) > ALS_FOLD_CACHE_SIZE:
+                self.folded.popitem(last=False)
+        return factors
+
+    def recommend(self, user, k: int = 10) -> List[tuple]:
+        """
+        Top k (appid, score): one dot product of the user's factors against every item.
+        """
+        if len(self.appids) == 0:
+            return []
+        scores = self.item_factors @ self.user_vector(user)
+
+        exclude = owned_appids(user.id) | set(user.pinned_games or [])
+        m = min(len(scores), k + len(exclude))
+        part = np.argpartition(-scores, m - 1)[:m]
+        part = part[np.argsort(-scores[part], kind="stable")]
+        return [(int(self.appids[i]), float(scores[i])) for i in part if int(self.appids[i]) not in exclude][:k]
+
+
+def get_als_model() -> Optional[ALSModel]:
+    """
+    Lazily load the persisted factors for this worker; reloads after a retrain.
+    """
+    global _model
+    try:
+        mtime = os.path.getmtime(_model_path())
+    except OSError:
+        return None
+
+    with _lock:
+        if _model is None or _model.mtime != mtime:
+            with np.load(_model_path()) as f:
+                _model = ALSModel(f, mtime)
+        return _model
@@ -0,0 +1,147 @@
+from __future__ import annotations
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Dict, Iterable, List, Tuple
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from .models import Game
+from .catalog_index import invalidate_catalog_index
+from .tags import normalize_tags
+from .vocab import extend_vocab
+from .steam_store_api import fetch_app_details, fetch_many_app_details, lookup_cached, MAX_WORKERS
+
+log = logging.getLogger(__name__)
+
+# How many owned appids one library sync will try to enrich
+SYNC_ENRICH_LIMIT = int(os.getenv("STEAM_SYNC_ENRICH_LIMIT", "200"))
+
+# How long a page will wait (seconds) for Store API lookups before rendering placeholders
+FETCH_DEADLINE = float(os.getenv("STEAM_FETCH_DEADLINE", "2"))
+
+# Long-lived pool so lookups that miss the deadline keep running after the request returns
+_fetch_pool = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="appdetails")
+
+
+def save_games(details: Iterable[dict]) -> int:
+    """
+    Insert new Game docs (from fetch_app_details results) in one insert_many.
+    Appids that already exist (e.g. inserted by a concurrent request) are skipped.
+    Returns how many were inserted.
+    """
+    docs = [
+        {"appid": d["appid"], "name": d["name"], "tags": normalize_tags(d.get("tags", [])), "global_rating": 0.0}
+        for d in details
+        if d
+    ]
+    if not docs:
+        return 0
+
+    try:
+        res = Game._get_collection().insert_many(docs, ordered=False)
+        inserted = len(res.inserted_ids)
+    except BulkWriteError as e:
+        # Duplicate appids are fine; anything else is a real error
+        if any(err.get("code") != 11000 for err in e.details.get("writeErrors", [])):
+            raise
+        inserted = e.details.get("nInserted", 0)
+
+    if inserted:
+        invalidate_catalog_index()
+        extend_vocab(t for d in docs for t in d["tags"])
+    return inserted
+
+
+def normalize_catalog_tags(batch_size: int = 1000) -> dict:
+    """
+    One-off pass that rewrites stored tags into their normalized spelling
+    (for games saved before tags were normalized at ingest).
+    """
+    coll = Game._get_collection()
+    ops, seen, changed = [], 0, 0
+    new_spellings = set()
+    for doc in coll.find({}, {"tags": 1}):
+        seen += 1
+        tags = normalize_tags(doc.get("tags") or [])
+        if tags != (doc.get("tags") or []):
+            ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"tags": tags}}))
+            new_spellings.update(tags)
+        if len(ops) >= batch_size:
+            changed += coll.bulk_write(ops, ordered=False).modified_count
+            ops = []
+    if ops:
+        changed += coll.bulk_write(ops, ordered=False).modified_count
+    if changed:
+        invalidate_catalog_index()
+        extend_vocab(sorted(new_spellings))
+    return {"games": seen, "updated": changed}
+
+
+def enrich_games(appids: Iterable[int]) -> List[dict]:
+    """
+    Make sure every appid has a Game doc: look up which are missing, fetch those
+    from the Store API concurrently, and bulk insert the results.
+    Returns the details that were inserted.
+    """
+    appids = [a for a in dict.fromkeys(appids) if a is not None]
+    if not appids:
+        return []
+
+    existing = set(Game.objects(appid__in=appids).scalar("appid"))
+    missing = [a for a in appids if a not in existing]
+    if not missing:
+        return []
+
+    fetched = [d for d in fetch_many_app_details(missing).values() if d]
+    save_games(fetched)
+    return fetched
+
+
+def _safe_fetch(appid: int):
+    try:
+        return fetch_app_details(appid)
+    except Exception:
+        log.warning("appdetails failed for %s", appid, exc_info=True)
+        return None
+
+
+def _backfill(futures) -> None:
+    """
+    Wait for lookups that missed a page's deadline and insert whatever came back.
+    """
+    wait(futures)
+    save_games(f.result() for f in futures)
+
+
+def fetch_games_with_deadline(appids: Iterable[int], timeout: float = FETCH_DEADLINE) -> Tuple[Dict[int, dict], List[int]]:
+    """
+    Look up Game details for appids we don't have yet, without letting a slow
+    Store API hold the page hostage:
+      - cached answers (including known misses) come back immediately
+      - the rest are fetched concurrently; whatever finishes within `timeout` is
+        bulk inserted and returned
+      - stragglers keep going in the background and are inserted when they finish
+    Returns ({appid: details} for found games, [appids still pending]).
+    """
+    cached, todo = lookup_cached(appids)
+    found = {a: d for a, d in cached.items() if d}
+    # Cached details may belong to games that were never saved (e.g. a failed insert)
+    save_games(found.values())
+
+    if not todo:
+        return found, []
+
+    futures = {appid: _fetch_pool.submit(_safe_fetch, appid) for appid in todo}
+    done, not_done = wait(futures.values(), timeout=timeout)
+
+    fetched = {a: f.result() for a, f in futures.items() if f in done and f.result()}
+    save_games(fetched.values())
+    found.update(fetched)
+
+    pending = [a for a, f in futures.items() if f in not_done]
+    if pending:
+        threading.Thread(target=_backfill, args=([futures[a] for a in pending],), daemon=True).start()
+    return found, pending
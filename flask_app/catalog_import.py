@@ -0,0 +1,284 @@
+from __future__ import annotations
+import csv
+import json
+import os
+import time
+from typing import Iterator, Optional
+
+from pymongo import UpdateOne
+
+from .models import Game
+from .catalog_index import invalidate_catalog_index
+from .tags import normalize_tags
+from .vocab import extend_vocab
+
+# Records per bulk_write (and per checkpoint)
+IMPORT_BATCH = int(os.getenv("CATALOG_IMPORT_BATCH", "1000"))
+# Bytes read per chunk by the streaming JSON reader
+READ_CHUNK = 1 << 16
+
+MAX_APPID = 2_147_483_647
+
+
+# ---- streaming readers (one record dict at a time, constant memory) ----
+
+def iter_jsonl(path: str) -> Iterator[dict]:
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def iter_csv(path: str) -> Iterator[dict]:
+    with open(path, encoding="utf-8", newline="") as f:
+        yield from csv.DictReader(f)
+
+
+def iter_json(path: str) -> Iterator[dict]:
+    """
+    Incremental parse of a top-level JSON array of objects, or of an object mapping
+    appid -> record (the SteamSpy "all" dump shape). Only one chunk plus the current
+    record is held in memory.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, encoding="utf-8") as f:
+        buf, pos, eof = "", 0, False
+
+        def fill(need_more: bool = False):
+            # Read another chunk when running low; consumed text is only dropped then,
+            # so the buffer is copied once per chunk rather than once per record
+            nonlocal buf, pos, eof
+            if (need_more or len(buf) - pos < READ_CHUNK) and not eof:
+                chunk = f.read(READ_CHUNK)
+                eof = not chunk
+                buf = buf[pos:] + chunk
+                pos = 0
+
+        def skip_ws():
+            nonlocal pos
+            while True:
+                while pos < len(buf) and buf[pos] in " \t\r\n":
+                    pos += 1
+                if pos < len(buf) or eof:
+                    return
+                fill(True)
+
+        def value():
+            nonlocal pos
+            while True:
+                try:
+                    obj, end = decoder.raw_decode(buf, pos)
+                    # A number at the very end of the buffer may continue in the next chunk
+                    if end == len(buf) and not eof:
+                        raise ValueError("truncated")
+                    pos = end
+                    return obj
+                except ValueError:
+                    if eof:
+                        raise
+                    fill(True)
+
+        def expect(chars: str) -> str:
+            nonlocal pos
+            skip_ws()
+            if pos >= len(buf) or buf[pos] not in chars:
+                raise ValueError(f"Malformed JSON dump near: {buf[pos:pos + 40]!r}")
+            pos += 1
+            return buf[pos - 1]
+
+        fill()
+        opener = expect("[{")
+        closer = "]" if opener == "[" else "}"
+        skip_ws()
+        if pos < len(buf) and buf[pos] == closer:
+            return
+
+        while True:
+            fill()
+            skip_ws()
+            if opener == "[":
+                record = value()
+            else:
+                key = value()
+                expect(":")
+                skip_ws()
+                record = value()
+                if isinstance(record, dict):
+                    record.setdefault("appid", key)
+            yield record
+            if expect("," + closer) == closer:
+                return
+
+
+READERS = {".jsonl": iter_jsonl, ".ndjson": iter_jsonl, ".csv": iter_csv, ".json": iter_json}
+
+
+def detect_format(path: str) -> str:
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in READERS:
+        raise ValueError(f"Unsupported dump format {ext!r}; use one of {sorted(READERS)}")
+    return ext
+
+
+# ---- validation ----
+
+def _split_tags(raw) -> list:
+    """
+    Tags/genres come as a list, a {tag: votes} dict (most voted first),
+    Store-style [{"description": ...}] lists, or a comma / semicolon separated string.
+    """
+    if not raw:
+        return []
+    if isinstance(raw, dict):
+        return [t for t, _ in sorted(raw.items(), key=lambda kv: -(kv[1] if isinstance(kv[1], (int, float)) else 0))]
+    if isinstance(raw, str):
+        return [t.strip() for t in raw.replace(";", ",").split(",") if t.strip()]
+    out = []
+    for t in raw:
+        if isinstance(t, dict):
+            t = t.get("description") or t.get("name")
+        if t:
+            out.append(str(t).strip())
+    return out
+
+
+def _rating(record: dict) -> float:
+    """
+    0..10 global rating from an explicit rating, or from positive/negative review counts.
+    0..100 scales are divided down.
+    """
+    for field in ("global_rating", "rating", "score"):
+        raw = record.get(field)
+        if raw not in (None, ""):
+            r = float(raw)
+            return round(r / 10.0 if r > 10 else r, 2)
+
+    pos, neg = record.get("positive"), record.get("negative")
+    if pos not in (None, "") and neg not in (None, ""):
+        pos, neg = float(pos), float(neg)
+        if pos + neg > 0:
+            return round(10.0 * pos / (pos + neg), 2)
+    return 0.0
+
+
+def normalize_record(record) -> Optional[dict]:
+    """
+    Dump record -> {"appid", "name", "tags", "global_rating"}, or None if it isn't usable.
+    """
+    if not isinstance(record, dict):
+        return None
+    try:
+        appid = int(record.get("appid") or record.get("steam_appid") or record.get("app_id") or 0)
+    except (TypeError, ValueError):
+        return None
+    name = str(record.get("name") or "").strip()
+    if appid <= 0 or appid > MAX_APPID or not name:
+        return None
+
+    tags = normalize_tags(_split_tags(record.get("tags")) + _split_tags(record.get("genres")))
+
+    try:
+        rating = _rating(record)
+    except (TypeError, ValueError):
+        rating = 0.0
+    return {"appid": appid, "name": name, "tags": tags, "global_rating": rating}
+
+
+# ---- checkpoints ----
+
+def _checkpoint_path(path: str) -> str:
+    return path + ".checkpoint"
+
+
+def _fingerprint(path: str) -> list:
+    st = os.stat(path)
+    return [st.st_size, int(st.st_mtime)]
+
+
+def _read_checkpoint(path: str) -> int:
+    """
+    Records already imported from this file, or 0 if there's no checkpoint
+    (or the file changed since it was written).
+    """
+    try:
+        with open(_checkpoint_path(path)) as f:
+            cp = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return 0
+    if cp.get("file") != _fingerprint(path):
+        return 0
+    return int(cp.get("records", 0))
+
+
+def _write_checkpoint(path: str, records: int) -> None:
+    tmp = _checkpoint_path(path) + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump({"records": records, "file": _fingerprint(path), "updated_at": time.time()}, f)
+    os.replace(tmp, _checkpoint_path(path))
+
+
+# ---- import ----
+
+def import_catalog(path: str, batch_size: int = IMPORT_BATCH, resume: bool = True, progress=None) -> dict:
+    """
+    Stream a dump into the games collection as batched upserts (keyed on appid).
+    After every committed batch the number of records consumed is checkpointed next to
+    the dump, so an interrupted import resumes where it stopped (re-running a batch is
+    harmless, upserts are idempotent). The checkpoint is removed once the file is done.
+    """
+    reader = READERS[detect_format(path)]
+    start_at = _read_checkpoint(path) if resume else 0
+    coll = Game._get_collection()
+
+    stats = {"file": path, "resumed_at": start_at, "read": 0, "invalid": 0,
+             "upserted": 0, "modified": 0, "batches": 0}
+    t0 = time.perf_counter()
+    ops = []
+    batch_tags = {}  # insertion ordered set
+    consumed = 0
+
+    def flush():
+        if ops:
+            res = coll.bulk_write(ops, ordered=False)
+            stats["upserted"] += res.upserted_count
+            stats["modified"] += res.modified_count
+            stats["batches"] += 1
+            ops.clear()
+            # Before the checkpoint, so a resumed import never skips a batch's new tags
+            extend_vocab(batch_tags)
+            batch_tags.clear()
+        _write_checkpoint(path, consumed)
+        if progress:
+            progress(consumed, time.perf_counter() - t0)
+
+    for record in reader(path):
+        consumed += 1
+        if consumed <= start_at:
+            continue  # already imported before the interruption
+        stats["read"] += 1
+
+        doc = normalize_record(record)
+        if doc is None:
+            stats["invalid"] += 1
+        else:
+            ops.append(UpdateOne({"appid": doc["appid"]}, {"$set": doc}, upsert=True))
+            batch_tags.update(dict.fromkeys(doc["tags"]))
+
+        if stats["read"] % batch_size == 0:
+            flush()
+    flush()
+
+    try:
+        os.remove(_checkpoint_path(path))
+    except FileNotFoundError:
+        pass
+    # Also after a resume: the interrupted run may have written batches without getting to this
+    # point, and re-applying them now reports nothing upserted or modified
+    if start_at or stats["batches"]:
+        invalidate_catalog_index()
+
+    elapsed = time.perf_counter() - t0
+    stats["seconds"] = round(elapsed, 3)
+    stats["records_per_sec"] = round(stats["read"] / elapsed, 1) if elapsed > 0 else 0.0
+    return stats
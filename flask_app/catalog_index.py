@@ -0,0 +1,178 @@
+from __future__ import annotations
+import hashlib
+import os
+import threading
+import time
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from .models import Game
+from .tags import tag_key
+from .metrics import stage
+
+# Rebuild the in-memory index at least this often (seconds), so games inserted
+# by other workers show up even if nobody invalidated this worker's copy.
+CATALOG_INDEX_TTL = float(os.getenv("CATALOG_INDEX_TTL", "300"))
+
+
+class CatalogIndex:
+    """
+    In-memory snapshot of the Games collection for tag-based scoring and genre pages.
+
+    Games are stored in one array order sorted by (-global_rating, appid), and every tag
+    has a posting list of positions into that order (so each list is already sorted by
+    rating). Scoring the whole catalog is a handful of NumPy scatter-adds, and a genre
+    page is a slice of one posting list.
+    """
+
+    def __init__(self, games: Iterable):
+        games = sorted(games, key=lambda g: (-(g.global_rating or 0.0), g.appid))
+        self.appids = np.array([g.appid for g in games], dtype=np.int64)
+        self.ratings = np.array([g.global_rating or 0.0 for g in games], dtype=np.float64)
+        self.neg_ratings = -self.ratings  # ascending, for keyset lookups
+        self.names = [g.name for g in games]
+        self.tags = [list(g.tags or []) for g in games]
+        self.pos_of = {int(a): i for i, a in enumerate(self.appids)}
+
+        postings: Dict[str, List[int]] = {}
+        by_key: Dict[str, List[int]] = {}
+        spellings: Dict[str, Counter] = {}
+        for i, tags in enumerate(self.tags):
+            for t in set(tags):
+                postings.setdefault(t, []).append(i)
+            for k in {tag_key(t) for t in tags}:
+                by_key.setdefault(k, []).append(i)
+            for t in tags:
+                spellings.setdefault(tag_key(t), Counter())[t] += 1
+        self.postings = {t: np.array(p, dtype=np.int64) for t, p in postings.items()}
+        # Genre rankings, case-insensitive: tag_key -> positions, plus the most used spelling
+        self.genre_postings = {k: np.array(p, dtype=np.int64) for k, p in by_key.items()}
+        self.genre_names = {k: c.most_common(1)[0][0] for k, c in spellings.items()}
+
+        # Same catalog -> same version in every worker (used for ETags and result caching)
+        h = hashlib.sha1()
+        h.update(self.appids.tobytes())
+        h.update(self.ratings.tobytes())
+        h.update(repr((self.names, self.tags)).encode("utf-8"))
+        self.version = h.hexdigest()[:16]
+        self.built_at = time.monotonic()
+
+    def __len__(self) -> int:
+        return len(self.appids)
+
+    def score(self, fav: Iterable[str], hate: Iterable[str]) -> np.ndarray:
+        """
+        3 * fav_overlap - 5 * hate_overlap + rating / 2, for every game in the catalog.
+        """
+        s = self.ratings / 2
+        for t in set(fav):
+            p = self.postings.get(t)
+            if p is not None:
+                s[p] += 3
+        for t in set(hate):
+            p = self.postings.get(t)
+            if p is not None:
+                s[p] -= 5
+        return s
+
+    def top_k(self, fav, hate, exclude=frozenset(), k: int = 10) -> List[dict]:
+        """
+        Best k games by tag score over the full catalog, skipping appids in `exclude`.
+        Ties go to the higher rated game, then the lower appid.
+        """
+        n = len(self.appids)
+        if n == 0 or k <= 0:
+            return []
+
+        fav, hate = set(fav or []), set(hate or [])
+        exclude = set(exclude or ())
+        scores = self.score(fav, hate)
+
+        # Only need k plus however many excluded games could crowd the top
+        m = min(n, k + sum(1 for a in exclude if a in self.pos_of))
+        if m < n:
+            part = np.argpartition(-scores, m - 1)[:m]
+        else:
+            part = np.arange(n)
+        part = part[np.lexsort((part, -scores[part]))]
+
+        out = []
+        for i in part:
+            appid = int(self.appids[i])
+            if appid in exclude:
+                continue
+            tags = set(self.tags[i])
+            out.append({
+                "appid": appid,
+                "name": self.names[i],
+                "tags": self.tags[i],
+                "global_rating": float(self.ratings[i]),
+                "score": round(float(scores[i]), 2),
+                "fav_overlap": list(tags & fav),
+                "hate_overlap": list(tags & hate),
+            })
+            if len(out) == k:
+                break
+        return out
+
+    def genre_page(self, tag: str, after: Optional[Tuple[float, int]] = None, limit: int = 50):
+        """
+        One page of a tag's ranking (rating desc, appid asc), case-insensitive.
+        Keyset pagination: `after` is the (global_rating, appid) of the previous page's
+        last game, found by binary search, so every page costs the same.
+        Returns (games, next_cursor or None, canonical tag name or None).
+        """
+        key = tag_key(tag)
+        postings = self.genre_postings.get(key)
+        if postings is None:
+            return [], None, None
+
+        start = 0
+        if after is not None:
+            # First global position strictly after (-rating, appid) in the sort order
+            neg, appid = -float(after[0]), int(after[1])
+            lo = int(np.searchsorted(self.neg_ratings, neg, side="left"))
+            hi = int(np.searchsorted(self.neg_ratings, neg, side="right"))
+            pos = lo + int(np.searchsorted(self.appids[lo:hi], appid, side="right"))
+            start = int(np.searchsorted(postings, pos, side="left"))
+
+        page = postings[start:start + limit]
+        games = [
+            {
+                "appid": int(self.appids[i]),
+                "name": self.names[i],
+                "tags": self.tags[i],
+                "global_rating": float(self.ratings[i]),
+            }
+            for i in page
+        ]
+        more = start + limit < len(postings)
+        cursor = (games[-1]["global_rating"], games[-1]["appid"]) if games and more else None
+        return games, cursor, self.genre_names[key]
+
+
+_lock = threading.Lock()
+_index: Optional[CatalogIndex] = None
+
+
+def get_catalog_index() -> CatalogIndex:
+    """
+    Lazily build (or rebuild when stale / invalidated) this worker's catalog index.
+    """
+    global _index
+    with _lock:
+        if _index is None or time.monotonic() - _index.built_at > CATALOG_INDEX_TTL:
+            with stage("catalog_index_build"):
+                _index = CatalogIndex(Game.objects.only("appid", "name", "tags", "global_rating"))
+        return _index
+
+
+def invalidate_catalog_index() -> None:
+    """
+    Call after inserting/updating games so the next lookup rebuilds.
+    """
+    global _index
+    with _lock:
+        _index = None
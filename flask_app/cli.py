@@ -0,0 +1,116 @@
+import json
+import os
+
+import click
+from flask.cli import AppGroup
+
+from .library import migrate_embedded_libraries, sync_steam_library
+from .catalog_import import import_catalog, IMPORT_BATCH
+from .query_plans import explain_route_queries
+from .catalog import normalize_catalog_tags
+from .vocab import rebuild_vocab
+from .jobs import retrainer
+from .train import train_model
+from .models import User
+from .steam_api import get_owned_games, resolve_to_steamid64
+
+# `flask --app run library ...`
+library_cli = AppGroup("library", help="Steam library storage.")
+catalog_cli = AppGroup("catalog", help="Game catalog maintenance.")
+db_cli = AppGroup("db", help="Database indexes and query plans.")
+
+
+@library_cli.command("migrate")
+@click.option("--batch-size", default=200, show_default=True, help="Users read per batch.")
+def migrate_libraries(batch_size):
+    """
+    Move embedded users.owned_games lists into the owned_games collection.
+    """
+    report = migrate_embedded_libraries(batch_size=batch_size)
+    click.echo(f"Migrated {report['users_migrated']} users ({report['rows_written']} library rows).")
+
+
+@library_cli.command("sync")
+@click.argument("email")
+@click.option("--steam-id", help="Steam ID / vanity / profile URL (defaults to the user's saved one).")
+@click.option("--fixtures", type=click.Path(file_okay=False), help="Replay recorded Steam API responses from this folder (offline).")
+@click.option("--enrich/--no-enrich", default=True, show_default=True, help="Look up new games on the Store API.")
+def sync_library_command(email, steam_id, fixtures, enrich):
+    """
+    Delta-sync one user's Steam library and print what changed.
+    """
+    if fixtures:
+        os.environ["STEAM_API_FIXTURES"] = fixtures
+
+    user = User.objects(email=email.lower()).first()
+    if user is None:
+        raise click.ClickException(f"No user with email {email}")
+    if not (steam_id or user.steam_id):
+        raise click.ClickException("User has no Steam ID; pass --steam-id")
+
+    steamid64 = resolve_to_steamid64(steam_id or user.steam_id)
+    report = sync_steam_library(user, steamid64, get_owned_games(steamid64), enrich=enrich)
+    # The retrain it queued would otherwise die with this process
+    retrainer.flush()
+    click.echo(json.dumps(report, indent=1))
+
+
+@catalog_cli.command("import")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--batch-size", default=IMPORT_BATCH, show_default=True, help="Upserts per bulk_write / checkpoint.")
+@click.option("--restart", is_flag=True, help="Ignore an existing checkpoint and start from the top.")
+def import_catalog_command(path, batch_size, restart):
+    """
+    Stream a JSON / JSONL / CSV app metadata dump into the games collection.
+    """
+    def progress(records, elapsed):
+        click.echo(f"  {records} records, {records / elapsed if elapsed else 0:.0f}/s", err=True)
+
+    report = import_catalog(path, batch_size=batch_size, resume=not restart, progress=progress)
+    click.echo(json.dumps(report, indent=1))
+
+
+@catalog_cli.command("normalize-tags")
+def normalize_tags_command():
+    """
+    Rewrite stored game tags into their normalized spelling.
+    """
+    report = normalize_catalog_tags()
+    click.echo(f"Checked {report['games']} games, updated {report['updated']}.")
+
+
+@catalog_cli.command("rebuild-vocab")
+def rebuild_vocab_command():
+    """
+    Rebuild the tag vocabulary from the catalog (drops unused tags) and retrain every vector.
+    """
+    vocab = rebuild_vocab()
+    click.echo(f"Vocabulary v{vocab.version}: {len(vocab)} tags. Retraining...", err=True)
+    # Not through the retrainer: its background thread would die with this process
+    report = train_model()
+    click.echo(json.dumps(report, indent=1, default=str))
+
+
+@db_cli.command("explain")
+@click.option("--ensure-indexes/--no-ensure-indexes", default=True, show_default=True,
+              help="Create the declared indexes before explaining.")
+@click.option("--strict-sort", is_flag=True, help="Also fail on in-memory sorts.")
+def explain_command(ensure_indexes, strict_sort):
+    """
+    explain() every query the routes issue; exits 1 if any of them scans a whole collection.
+    """
+    failed = 0
+    for r in explain_route_queries(ensure_indexes=ensure_indexes):
+        bad = r["collscan"] or (strict_sort and r["in_memory_sort"])
+        failed += bad
+        flag = "FAIL" if bad else ("sort" if r["in_memory_sort"] else "ok")
+        click.echo(f"{flag:>4}  {r['collection']:<22} {r['query']:<34} {' <- '.join(r['stages'])}  ({r['mode']})")
+
+    if failed:
+        raise click.ClickException(f"{failed} route queries scan a whole collection")
+
+
+def init_app(app):
+    app.cli.add_command(library_cli)
+    app.cli.add_command(catalog_cli)
+    app.cli.add_command(db_cli)
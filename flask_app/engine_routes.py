@@ -1,10 +1,14 @@
 from flask import Blueprint, render_template, redirect, url_for, request
 from flask_login import login_required, current_user
-from .models import Game, User, Rating
+from .models import Game
 from flask_wtf import FlaskForm
-from sklearn.neighbors import NearestNeighbors
-from .recommender import build_tag_vocab, build_training_data, user_to_vector
-from .steam_store_api import fetch_app_details
+from .train import train_model as run_training, train_collaborative
+from .catalog_index import invalidate_catalog_index
+from .recommendation_service import recommendation_service
+from .jobs import retrainer
+from .model_store import model_status
+from .item_similarity import get_item_similarity, because_you_played
+from .als import get_als_model
 
 engine = Blueprint("engine", __name__, url_prefix="/engine")
 
@@ -14,38 +18,8 @@ class EmptyForm(FlaskForm):
 @engine.route("/recommendations")
 @login_required
 def recommendations():
-    owned = current_user.owned_games or []
-    owned_ids = {g.get("appid") for g in owned if g.get("appid") is not None}
-
-    fav = set(current_user.favorite_tags or [])
-    hate = set(current_user.hated_tags or [])
-
-    # Pull candidates from DB (exclude owned)
-    candidates = Game.objects(appid__nin=list(owned_ids))[:200]  # cap to keep it fast
-
-    scored = []
-    for game in candidates:
-        tags = set(game.tags or [])
-        # simple scoring
-        score = 0
-        score += 3 * len(tags & fav)      # reward favorite overlap
-        score -= 5 * len(tags & hate)     # penalize hated overlap
-        score += (game.global_rating or 0) / 2  # rating influence (tweak anytime)
-
-        scored.append({
-            "appid": game.appid,
-            "name": game.name,
-            "tags": game.tags,
-            "global_rating": game.global_rating,
-            "score": round(score, 2),
-            "fav_overlap": list(tags & fav),
-            "hate_overlap": list(tags & hate),
-        })
-
-    scored.sort(key=lambda x: x["score"], reverse=True)
-    top = scored[:10]
-
-    return {"recommendations": top, "count_considered": len(scored)}
+    result = recommendation_service.recommend(current_user, "tags")
+    return {"recommendations": result["recommendations"], "count_considered": result["considered"]}
 
 @engine.route("/seed-games")
 @login_required
@@ -65,37 +39,13 @@ def seed_games():
         res = Game.objects(appid=g["appid"]).modify(upsert=True, new=True, **g)
         upserted += 1
 
+    invalidate_catalog_index()
     return {"seeded": upserted}
 
 @engine.route("/recommendations-page", methods=["GET"])
 @login_required
 def recommendations_page():
-    owned = current_user.owned_games or []
-    owned_ids = {g.get("appid") for g in owned if g.get("appid") is not None}
-
-    fav = set(current_user.favorite_tags or [])
-    hate = set(current_user.hated_tags or [])
-
-    candidates = Game.objects(appid__nin=list(owned_ids))[:200]
-
-    scored = []
-    for game in candidates:
-        tags = set(game.tags or [])
-        score = 0
-        score += 3 * len(tags & fav)
-        score -= 5 * len(tags & hate)
-        score += (game.global_rating or 0) / 2
-
-        scored.append({
-            "appid": game.appid,
-            "name": game.name,
-            "tags": game.tags,
-            "global_rating": game.global_rating,
-            "score": round(score, 2),
-        })
-
-    scored.sort(key=lambda x: x["score"], reverse=True)
-    top = scored[:10]
+    top = recommendation_service.recommend(current_user, "tags")["recommendations"]
 
     form = EmptyForm()
     pinned = set(current_user.pinned_games or [])
@@ -110,6 +60,7 @@ def pin(appid):
         if appid not in (current_user.pinned_games or []):
             current_user.pinned_games.append(appid)
             current_user.save()
+            current_user.bump_data_version()
     return redirect(url_for("engine.recommendations_page"))
 
 @engine.route("/unpin/<int:appid>", methods=["POST"])
@@ -119,6 +70,7 @@ def unpin(appid):
     if form.validate_on_submit():
         current_user.pinned_games = [x for x in (current_user.pinned_games or []) if x != appid]
         current_user.save()
+        current_user.bump_data_version()
     return redirect(url_for("engine.wishlist"))
 
 @engine.route("/wishlist", methods=["GET"])
@@ -137,182 +89,98 @@ def wishlist():
 @engine.route("/train_model")
 @login_required
 def train_model():
-    vocab = build_tag_vocab()
-    user_ids, X = build_training_data(vocab)
+    report = run_training()
+    report["collaborative"] = train_collaborative()
+    report["note"] = "Vectors stored in users.calculated_vector and the model store."
+    return report
 
-    # Save each user's calculated_vector in MongoDB (so you can show you computed it)
-    # Recompute per user so it matches same vocab
-    for uid in user_ids:
-        u = User.objects(id=uid).first()
-        if u:
-            u.calculated_vector = user_to_vector(u, vocab)
-            u.save()
+@engine.route("/train_status")
+@login_required
+def train_status():
+    status = retrainer.status()
+    status["model"] = model_status()
+    return status
+
+def _game_cards(pairs, score_field="similarity"):
+    """
+    [(appid, score)] -> list of dicts with game details (one bulk lookup).
+    """
+    by_id = {g.appid: g for g in Game.objects(appid__in=[a for a, _ in pairs]).only("appid", "name", "tags", "global_rating")}
+    return [
+        {
+            "appid": appid,
+            "name": by_id[appid].name if appid in by_id else f"AppID {appid}",
+            "tags": by_id[appid].tags if appid in by_id else [],
+            score_field: round(score, 3),
+        }
+        for appid, score in pairs
+    ]
+
+@engine.route("/similar/<int:appid>")
+@login_required
+def similar_games(appid):
+    table = get_item_similarity()
+    if table is None:
+        return {"error": "Item similarity table not built yet. Run /engine/train_model."}
+    return {"appid": appid, "similar": _game_cards(table.similar(appid, n=10))}
 
+@engine.route("/because-you-played")
+@login_required
+def because_you_played_recs():
+    groups = because_you_played(current_user)
+    seeds = {g.appid: g.name for g in Game.objects(appid__in=[grp["seed"] for grp in groups]).only("appid", "name")}
     return {
-        "tags_in_vocab": len(vocab),
-        "users_trained": len(user_ids),
-        "note": "Vectors stored in users.calculated_vector. KNN fitting happens in recommendations route."
+        "groups": [
+            {
+                "because_you_played": {"appid": grp["seed"], "name": seeds.get(grp["seed"], f"AppID {grp['seed']}")},
+                "recommendations": _game_cards(grp["recommendations"]),
+            }
+            for grp in groups
+        ]
     }
 
+@engine.route("/als")
+@login_required
+def als_recommendations():
+    model = get_als_model()
+    if model is None:
+        return {"error": "ALS model not trained yet. Run /engine/train_model."}
+    return {"recommendations": _game_cards(model.recommend(current_user), score_field="score")}
+
 @engine.route("/knn_recommendations")
 @login_required
 def knn_recommendations():
-    vocab = build_tag_vocab()
-    user_ids, X = build_training_data(vocab)
+    result = recommendation_service.recommend(current_user, "knn_pins")
+
+    if result.get("training"):
+        return {"error": result["error"], "training": True}
 
     # Need at least 2 users for "neighbors"
-    if len(user_ids) < 2:
+    if result["error"]:
         return {
             "error": "Need at least 2 users with preference data to run KNN. Create another account and set preferences.",
-            "users_trained": len(user_ids)
+            "users_trained": result["users_trained"]
         }
 
-    # Fit KNN (cosine distance)
-    knn = NearestNeighbors(n_neighbors=min(5, len(user_ids)), metric="cosine")
-    knn.fit(X)
-
-    me_vec = user_to_vector(current_user, vocab)
-    distances, indices = knn.kneighbors([me_vec], n_neighbors=min(5, len(user_ids)))
-
-    # Map neighbor indices -> User docs (skip yourself)
-    neighbor_ids = []
-    for i in indices[0]:
-        uid = user_ids[i]
-        if uid != str(current_user.id):
-            neighbor_ids.append(uid)
-
-    neighbors = list(User.objects(id__in=neighbor_ids))
-
-    # Recommend games neighbors pinned (simple + demo-friendly)
-    my_owned_ids = {g.get("appid") for g in (current_user.owned_games or []) if g.get("appid") is not None}
-    my_pins = set(current_user.pinned_games or [])
-
-    candidate_scores = {}  # appid -> score
-    for n in neighbors:
-        for appid in (n.pinned_games or []):
-            if appid in my_owned_ids or appid in my_pins:
-                continue
-            candidate_scores[appid] = candidate_scores.get(appid, 0) + 1
-
-    # Look up game details
-    rec_ids = sorted(candidate_scores.keys(), key=lambda a: candidate_scores[a], reverse=True)[:10]
-    games = list(Game.objects(appid__in=rec_ids))
-    by_id = {g.appid: g for g in games}
-
-    recs = []
-    for appid in rec_ids:
-        g = by_id.get(appid)
-        if g:
-            recs.append({
-                "appid": appid,
-                "name": g.name,
-                "tags": g.tags,
-                "global_rating": g.global_rating,
-                "neighbor_votes": candidate_scores[appid],
-            })
-
     return {
-        "neighbors_used": [str(n.email) for n in neighbors],
-        "recommendations": recs
+        "neighbors_used": [n["email"] for n in result["neighbors"] if n.get("email")],
+        "recommendations": result["recommendations"]
     }
 
 @engine.route("/knn", methods=["GET"])
 @login_required
 def knn_page():
-    vocab = build_tag_vocab()
-    user_ids, X = build_training_data(vocab)
-
-    if len(user_ids) < 2:
-        return render_template("knn.html", error="Need at least 2 users with preferences.", neighbors=[], recs=[], form=EmptyForm())
-
-    knn = NearestNeighbors(n_neighbors=min(5, len(user_ids)), metric="cosine")
-    knn.fit(X)
-
-    me_vec = user_to_vector(current_user, vocab)
-    distances, indices = knn.kneighbors([me_vec], n_neighbors=min(5, len(user_ids)))
-
-    neighbors_info = []
-    neighbor_ids = []
-    for dist, idx in zip(distances[0], indices[0]):
-        uid = user_ids[idx]
-        if uid == str(current_user.id):
-            continue
-        neighbor_ids.append(uid)
-        neighbors_info.append({"user_id": uid, "distance": float(dist), "similarity": round(1 - float(dist), 3)})
-
-    neighbors = list(User.objects(id__in=neighbor_ids).only("steam_id", "owned_games", "pinned_games"))
-    by_id = {str(u.id): u for u in neighbors}
-
-    # Preload ratings for neighbors to avoid querying inside loops
-    neighbor_obj_ids = [u.id for u in neighbors]
-    ratings_lookup = {}  # (user_id_str, appid) -> rating_int
-
-    for r in Rating.objects(user_id__in=neighbor_obj_ids).only("user_id", "appid", "rating"):
-        ratings_lookup[(str(r.user_id), r.appid)] = r.rating
+    result = recommendation_service.recommend(current_user, "knn_library")
 
-    # Recommend from neighbors' owned libraries (not just pins)
-    my_owned_ids = {g.get("appid") for g in (current_user.owned_games or []) if g.get("appid") is not None}
-    my_pins = set(current_user.pinned_games or [])
-
-    scores = {}  # appid -> float score
-
-    for info in neighbors_info:
-        u = by_id.get(info["user_id"])
-        if not u:
-            continue
-
-        sim = info["similarity"]  # 0..1
-        for og in (u.owned_games or []):
-            appid = og.get("appid")
-            if appid is None:
-                continue
-            if appid in my_owned_ids or appid in my_pins:
-                continue
-
-            hours = (og.get("playtime_forever", 0) or 0) / 60.0
-
-            # Score contribution: similarity-weighted hours (cap hours so one game doesn't dominate)
-            contrib = sim * min(hours, 100)
-
-            # If neighbor rated this game, adjust contribution
-            rating = ratings_lookup.get((str(u.id), appid))
-            if rating is not None:
-                # map rating 1..10 -> multiplier 0.6..1.4 (gentle, safe)
-                rating_factor = 0.6 + (rating / 12.5)  # 1->0.68, 10->1.4
-                contrib *= rating_factor
-
-            scores[appid] = scores.get(appid, 0.0) + contrib
-
-    rec_ids = sorted(scores.keys(), key=lambda a: scores[a], reverse=True)[:10]
-    missing = [appid for appid in rec_ids if not Game.objects(appid=appid).first()]
-    for appid in missing:
-        details = fetch_app_details(appid)
-        if details:
-            Game(appid=details["appid"], name=details["name"], tags=details["tags"], global_rating=0.0).save()
-    games = list(Game.objects(appid__in=rec_ids))
-    by_game = {g.appid: g for g in games}
-
-    recs = []
-    for appid in rec_ids:
-        g = by_game.get(appid)
-        recs.append({
-            "appid": appid,
-            "name": g.name if g else f"AppID {appid}",
-            "tags": g.tags if g else [],
-            "score": round(scores[appid], 2),
-        })
-
-    # Add neighbor emails
-    for info in neighbors_info:
-        u = by_id.get(info["user_id"])
-        info["steam_id"] = u.steam_id if (u and u.steam_id) else None
+    if result["error"]:
+        error = result["error"] if result.get("training") else "Need at least 2 users with preferences."
+        return render_template("knn.html", error=error, neighbors=[], recs=[], form=EmptyForm())
 
     return render_template(
         "knn.html",
         error=None,
-        neighbors=neighbors_info,
-        recs=recs,
+        neighbors=result["neighbors"],
+        recs=result["recommendations"],
         pinned=set(current_user.pinned_games or []),
         form=EmptyForm()
     )
-
@@ -1,9 +1,15 @@
-from flask import Blueprint, render_template, abort
-from flask_login import login_required
+import hashlib
+import os
+from flask import Blueprint, render_template, abort, request, make_response
+from flask_login import login_required, current_user
 from .models import Game
+from .catalog_index import get_catalog_index
+from .tags import tag_key
 
 explore = Blueprint("explore", __name__, url_prefix="/explore")
 
+GENRE_PAGE_SIZE = int(os.getenv("GENRE_PAGE_SIZE", "50"))
+
 @explore.route("/game/<int:appid>")
 @login_required
 def game_detail(appid):
@@ -12,9 +18,37 @@ def game_detail(appid):
         abort(404)
     return render_template("game_detail.html", game=game)
 
+def _parse_cursor(raw):
+    """
+    "rating:appid" -> (float, int); None if absent, 400 if garbled.
+    """
+    if not raw:
+        return None
+    try:
+        rating, appid = raw.rsplit(":", 1)
+        return float(rating), int(appid)
+    except ValueError:
+        abort(400)
+
 @explore.route("/genre/<tag>")
 @login_required
 def genre_page(tag):
-    # Case-sensitive tags can be annoying; keep it simple for now.
-    games = list(Game.objects(tags=tag).order_by("-global_rating")[:50])
-    return render_template("genre.html", tag=tag, games=games)
+    # Served from the catalog index's per-tag ranking (tags are normalized at ingest,
+    # lookups are case-insensitive), one keyset page at a time
+    after = request.args.get("after")
+    cursor = _parse_cursor(after)
+    index = get_catalog_index()
+
+    # Same catalog + same page + same viewer -> same HTML, so repeat views can be a 304
+    raw = f"{index.version}|{tag_key(tag)}|{after}|{GENRE_PAGE_SIZE}|{current_user.get_id()}"
+    etag = hashlib.sha1(raw.encode("utf-8")).hexdigest()[:20]
+    if request.if_none_match.contains(etag):
+        resp = make_response("", 304)
+    else:
+        games, next_cursor, name = index.genre_page(tag, after=cursor, limit=GENRE_PAGE_SIZE)
+        next_after = f"{next_cursor[0]!r}:{next_cursor[1]}" if next_cursor else None
+        resp = make_response(render_template("genre.html", tag=name or tag, games=games, next_after=next_after))
+
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "private, no-cache"  # always revalidate, usually for free
+    return resp
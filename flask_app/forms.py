@@ -36,7 +36,7 @@ class LoginForm(FlaskForm):
     submit = SubmitField("Log in")
 
 class FriendCompareForm(FlaskForm):
-    friend_steam = StringField("Friend Steam ID / vanity / URL", validators=[DataRequired(), Length(min=3, max=200)])
+    friend_steam = StringField("Friend Steam IDs / vanities / URLs (comma separated)", validators=[DataRequired(), Length(min=3, max=4000)])
     submit = SubmitField("Compare")
 
 class SteamIdForm(FlaskForm):
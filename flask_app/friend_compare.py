@@ -0,0 +1,126 @@
+from __future__ import annotations
+import logging
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from typing import Dict, List
+
+import numpy as np
+from scipy import sparse
+
+from .library import get_library
+from .recommender import build_user_matrix
+from .steam_api import get_owned_games, resolve_to_steamid64
+from .vocab import get_vocab
+
+log = logging.getLogger(__name__)
+
+# Most friends compared in one request, and how many Steam API calls run at once
+FRIEND_COMPARE_MAX = int(os.getenv("FRIEND_COMPARE_MAX", "20"))
+FRIEND_FETCH_WORKERS = int(os.getenv("FRIEND_FETCH_WORKERS", "8"))
+
+
+def parse_steam_inputs(raw: str) -> List[str]:
+    """
+    Comma / whitespace separated Steam IDs, vanity names or profile URLs, deduplicated.
+    """
+    return list(dict.fromkeys(p for p in re.split(r"[\s,;]+", raw or "") if p))[:FRIEND_COMPARE_MAX]
+
+
+def _fetch_friend(steam_input: str) -> dict:
+    try:
+        steamid64 = resolve_to_steamid64(steam_input)
+        games = get_owned_games(steamid64)
+    except Exception as e:
+        log.info("friend compare lookup failed for %s: %s", steam_input, e)
+        return {"input": steam_input, "steamid64": None, "error": str(e) or "lookup failed"}
+    library = {g["appid"]: g.get("playtime_forever", 0) or 0 for g in games if g.get("appid") is not None}
+    return {"input": steam_input, "steamid64": steamid64, "library": library, "error": None}
+
+
+def fetch_friend_libraries(steam_inputs: List[str]) -> List[dict]:
+    """
+    Resolve + fetch every friend's library concurrently (order preserved).
+    """
+    if not steam_inputs:
+        return []
+    with ThreadPoolExecutor(max_workers=min(FRIEND_FETCH_WORKERS, len(steam_inputs))) as pool:
+        return list(pool.map(_fetch_friend, steam_inputs))
+
+
+def _cosine_matrix(X: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(X, axis=1)
+    Xn = X / np.where(norms > 0, norms, 1.0)[:, None]
+    S = Xn @ Xn.T
+    S[norms == 0, :] = 0.0
+    S[:, norms == 0] = 0.0
+    return S
+
+
+def _overlap_matrices(libraries: List[Dict[int, int]]):
+    """
+    Shared-game counts and Jaccard overlap between every pair of libraries,
+    from one sparse (members x games) 0/1 product.
+    """
+    appids = sorted({a for lib in libraries for a in lib})
+    col = {a: i for i, a in enumerate(appids)}
+    rows = [r for r, lib in enumerate(libraries) for _ in lib]
+    cols = [col[a] for lib in libraries for a in lib]
+    B = sparse.csr_matrix((np.ones(len(rows), dtype=np.float32), (rows, cols)),
+                          shape=(len(libraries), len(appids)))
+    shared = (B @ B.T).toarray()
+    sizes = np.array([len(lib) for lib in libraries], dtype=np.float64)
+    union = sizes[:, None] + sizes[None, :] - shared
+    jaccard = np.divide(shared, union, out=np.zeros_like(shared, dtype=np.float64), where=union > 0)
+    return shared.astype(np.int64), jaccard
+
+
+def compare_with_friends(user, steam_inputs: List[str]) -> dict:
+    """
+    Compare the user with any number of Steam accounts in one pass:
+      - friends' libraries are fetched concurrently
+      - everyone is vectorized in one build_user_matrix call (one Game query for all)
+      - taste similarity = cosine matrix over those vectors, overlap = Jaccard matrix
+    Returns {"members", "similarity", "overlap", "shared", "ranked", "errors"};
+    members[0] is the user, matrices are indexed like members, ranked is friends by similarity to the user.
+    """
+    fetched = fetch_friend_libraries(steam_inputs)
+    friends = [f for f in fetched if f["error"] is None]
+    errors = [{"input": f["input"], "error": f["error"]} for f in fetched if f["error"] is not None]
+
+    my_library = {g["appid"]: g["playtime_forever"] for g in get_library(user.id)}
+    libraries = [my_library] + [f["library"] for f in friends]
+
+    # Friends are vectorized from their libraries only (no stated preferences)
+    members = [user] + [SimpleNamespace(id=None, favorite_tags=[], hated_tags=[]) for _ in friends]
+    X = build_user_matrix(members, get_vocab(), libraries)
+    similarity = _cosine_matrix(X)
+    shared, jaccard = _overlap_matrices(libraries)
+
+    labels = [{"label": "You", "steamid64": getattr(user, "steam_id", None), "games": len(my_library)}]
+    labels += [{"label": f["input"], "steamid64": f["steamid64"], "games": len(f["library"])} for f in friends]
+
+    ranked = sorted(
+        (
+            {
+                "label": labels[i]["label"],
+                "steamid64": labels[i]["steamid64"],
+                "similarity": round(float(similarity[0, i]), 3),
+                "overlap_percent": round(float(jaccard[0, i]) * 100, 2),
+                "shared_count": int(shared[0, i]),
+                "friend_count": labels[i]["games"],
+            }
+            for i in range(1, len(labels))
+        ),
+        key=lambda r: (-r["similarity"], -r["overlap_percent"]),
+    )
+
+    return {
+        "members": labels,
+        "similarity": np.round(similarity.astype(np.float64), 3).tolist(),
+        "overlap": np.round(jaccard * 100, 2).tolist(),
+        "shared": shared.tolist(),
+        "ranked": ranked,
+        "errors": errors,
+    }
@@ -0,0 +1,187 @@
+from __future__ import annotations
+import os
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+from scipy import sparse
+
+from .recommender import load_interactions
+from .model_store import MODEL_STORE_DIR
+from .library import get_library
+
+# Neighbors kept per game, and which similarity to use (cosine | jaccard)
+ITEM_TOP_N = int(os.getenv("ITEM_SIM_TOP_N", "20"))
+ITEM_METRIC = os.getenv("ITEM_SIM_METRIC", "cosine")
+# Columns processed per block when computing similarities (bounds memory)
+BLOCK_SIZE = 512
+
+_lock = threading.Lock()
+_table: Optional["ItemSimilarity"] = None
+
+
+def _table_path() -> str:
+    return os.path.join(MODEL_STORE_DIR, "item_similarity.npz")
+
+
+def build_interaction_matrix():
+    """
+    Sparse (users x games) implicit-feedback matrix from owned games and ratings.
+      - owned game: 1 + log1p(hours)
+      - rated game (owned or not): rating / 5 for ratings >= 6, dropped for ratings <= 5
+    Returns (matrix as CSC, appids array for the columns).
+    """
+    user_ids, owned, ratings = load_interactions()
+
+    cells: Dict[tuple, float] = {}
+    for row, appid, minutes in zip(owned["user"].tolist(), owned["appid"].tolist(), owned["minutes"].tolist()):
+        cells[(row, appid)] = 1.0 + float(np.log1p(minutes / 60.0))
+    for row, appid, rating in zip(ratings["user"].tolist(), ratings["appid"].tolist(), ratings["rating"].tolist()):
+        if rating >= 6:
+            cells[(row, appid)] = rating / 5.0
+        else:
+            cells.pop((row, appid), None)
+
+    if not cells:
+        return sparse.csc_matrix((0, 0), dtype=np.float32), np.zeros(0, dtype=np.int64)
+
+    rows = np.fromiter((k[0] for k in cells), dtype=np.int64, count=len(cells))
+    raw_appids = np.fromiter((k[1] for k in cells), dtype=np.int64, count=len(cells))
+    vals = np.fromiter(cells.values(), dtype=np.float32, count=len(cells))
+
+    appids, cols = np.unique(raw_appids, return_inverse=True)
+    C = sparse.csc_matrix((vals, (rows, cols)), shape=(len(user_ids), len(appids)))
+    return C, appids
+
+
+def compute_top_neighbors(C: sparse.csc_matrix, top_n: int = ITEM_TOP_N, metric: str = ITEM_METRIC):
+    """
+    Column-column similarity, keeping only the top_n neighbors per column.
+    Works block by block so the full games x games matrix is never materialized.
+    Returns (neighbors int32 [games, top_n] with -1 padding, scores float32 [games, top_n]).
+    """
+    n_games = C.shape[1]
+    neighbors = np.full((n_games, top_n), -1, dtype=np.int32)
+    scores = np.zeros((n_games, top_n), dtype=np.float32)
+    if n_games == 0:
+        return neighbors, scores
+
+    if metric == "jaccard":
+        B = C.copy()
+        B.data = np.ones_like(B.data)
+        M = B
+        degree = np.asarray(B.sum(axis=0)).ravel()
+    elif metric == "cosine":
+        norms = np.sqrt(np.asarray(C.multiply(C).sum(axis=0)).ravel())
+        M = C @ sparse.diags(np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0))
+        M = M.tocsc()
+    else:
+        raise ValueError(f"Unknown item similarity metric {metric!r}")
+
+    MT = M.T.tocsr()
+    for start in range(0, n_games, BLOCK_SIZE):
+        end = min(start + BLOCK_SIZE, n_games)
+        block = (MT @ M[:, start:end]).tocsc()  # games x block
+
+        for j in range(end - start):
+            col = start + j
+            lo, hi = block.indptr[j], block.indptr[j + 1]
+            idx = block.indices[lo:hi]
+            sim = block.data[lo:hi].astype(np.float32)
+            if metric == "jaccard":
+                sim = sim / (degree[idx] + degree[col] - sim)
+
+            keep = idx != col
+            idx, sim = idx[keep], sim[keep]
+            if len(idx) == 0:
+                continue
+            if len(idx) > top_n:
+                part = np.argpartition(-sim, top_n - 1)[:top_n]
+                idx, sim = idx[part], sim[part]
+            order = np.lexsort((idx, -sim))
+            neighbors[col, :len(order)] = idx[order]
+            scores[col, :len(order)] = sim[order]
+
+    return neighbors, scores
+
+
+class ItemSimilarity:
+    """
+    Precomputed top-N similar games per game, stored as fixed-width arrays.
+    Lookups are a dict hit plus one row slice.
+    """
+
+    def __init__(self, appids: np.ndarray, neighbors: np.ndarray, scores: np.ndarray, mtime: float = 0.0):
+        self.appids = appids
+        self.neighbors = neighbors
+        self.scores = scores
+        self.pos_of = {int(a): i for i, a in enumerate(appids)}
+        self.mtime = mtime
+
+    def similar(self, appid: int, n: int = ITEM_TOP_N) -> List[tuple]:
+        i = self.pos_of.get(appid)
+        if i is None:
+            return []
+        out = []
+        for j, s in zip(self.neighbors[i], self.scores[i]):
+            if j < 0 or len(out) == n:
+                break
+            out.append((int(self.appids[j]), float(s)))
+        return out
+
+
+def build_item_similarity(top_n: int = ITEM_TOP_N, metric: str = ITEM_METRIC) -> dict:
+    """
+    Offline build: interaction matrix -> top-N neighbors per game -> npz in the model store dir.
+    """
+    C, appids = build_interaction_matrix()
+    neighbors, scores = compute_top_neighbors(C, top_n, metric)
+
+    os.makedirs(MODEL_STORE_DIR, exist_ok=True)
+    tmp = _table_path() + ".tmp.npz"
+    np.savez(tmp, appids=appids, neighbors=neighbors, scores=scores)
+    os.replace(tmp, _table_path())
+
+    return {"games": len(appids), "users": C.shape[0], "top_n": top_n, "metric": metric}
+
+
+def get_item_similarity() -> Optional[ItemSimilarity]:
+    """
+    Lazily load the table for this worker; reloads when a rebuild replaced the file.
+    """
+    global _table
+    try:
+        mtime = os.path.getmtime(_table_path())
+    except OSError:
+        return None
+
+    with _lock:
+        if _table is None or _table.mtime != mtime:
+            with np.load(_table_path()) as f:
+                _table = ItemSimilarity(f["appids"], f["neighbors"], f["scores"], mtime)
+        return _table
+
+
+def because_you_played(user, n_seeds: int = 3, k: int = 10) -> List[dict]:
+    """
+    For the user's most played games, the most similar games they don't own or have pinned.
+    Returns [{"seed": appid, "recommendations": [(appid, score), ...]}, ...].
+    """
+    table = get_item_similarity()
+    if table is None:
+        return []
+
+    owned = get_library(user.id)
+    exclude = {g["appid"] for g in owned} | set(user.pinned_games or [])
+    seeds = sorted(
+        (g for g in owned if g["appid"] in table.pos_of),
+        key=lambda g: g["playtime_forever"],
+        reverse=True,
+    )[:n_seeds]
+
+    groups = []
+    for g in seeds:
+        recs = [(a, s) for a, s in table.similar(g["appid"]) if a not in exclude][:k]
+        if recs:
+            groups.append({"seed": g["appid"], "recommendations": recs})
+    return groups
@@ -0,0 +1,182 @@
+from __future__ import annotations
+import logging
+import os
+import threading
+import time
+from contextlib import nullcontext
+from datetime import datetime
+from typing import Iterable, Optional
+
+from .model_store import SERVERLESS
+
+log = logging.getLogger(__name__)
+
+
+class RetrainScheduler:
+    """
+    Debounced background retraining.
+
+    Request handlers call mark_dirty() and return right away. A single worker thread
+    waits until no new changes have arrived for `debounce` seconds, then runs one job:
+      - a partial retrain (only the dirty users' vectors) when the catalog didn't change
+      - a full retrain when someone asked for it (new games / tags)
+    Bursts of changes coalesce into that one job.
+
+    The collaborative models (item similarity, ALS) are a separate job, queued by full
+    retrains (or collab=True) and run after the vectors are live, at most once every
+    `collab_interval` seconds.
+    """
+
+    def __init__(self, debounce: float = 2.0, run_async: bool = True, collab_interval: float = 600.0):
+        self.debounce = debounce
+        self.run_async = run_async
+        self.collab_interval = collab_interval
+        self.app = None
+
+        self._cond = threading.Condition()
+        self._dirty = set()
+        self._full = False
+        self._collab = False
+        self._collab_after = 0.0  # monotonic time the next collab job may start
+        self._due: Optional[float] = None
+        self._thread: Optional[threading.Thread] = None
+
+        self._status = {
+            "state": "idle",        # idle | pending | running
+            "last_started": None,
+            "last_finished": None,
+            "last_kind": None,      # full | partial
+            "last_report": None,
+            "last_error": None,
+            "runs": 0,
+            "collab_last_finished": None,
+            "collab_last_report": None,
+            "collab_last_error": None,
+        }
+
+    def init_app(self, app) -> None:
+        self.app = app
+        self.debounce = app.config.get("RETRAIN_DEBOUNCE_SECONDS", self.debounce)
+        self.run_async = app.config.get("RETRAIN_ASYNC", self.run_async)
+        self.collab_interval = app.config.get("COLLAB_RETRAIN_SECONDS", self.collab_interval)
+
+    def mark_dirty(self, user_ids: Iterable = (), full: bool = False, collab: bool = None) -> None:
+        """
+        Record that these users' vectors (or, with full=True, everything) need retraining.
+        collab (default: same as full) also queues the collaborative models.
+        """
+        collab = full if collab is None else collab
+        if not self.run_async:
+            # Default on serverless deployments, where background threads get frozen
+            self._run_job({str(u) for u in user_ids}, full)
+            if collab:
+                self._run_collab()
+            return
+
+        with self._cond:
+            self._dirty.update(str(u) for u in user_ids)
+            self._full = self._full or full
+            self._collab = self._collab or collab
+            self._due = time.monotonic() + self.debounce
+            if self._status["state"] == "idle":
+                self._status["state"] = "pending"
+
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, name="retrain-scheduler", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def flush(self) -> None:
+        """
+        Run whatever is queued now, in the calling thread. For short-lived processes
+        (CLI commands) whose exit would kill the background thread before its deadline.
+        """
+        with self._cond:
+            dirty, full, collab = self._dirty, self._full, self._collab
+            self._dirty, self._full, self._collab, self._due = set(), False, False, None
+
+        self._run_job(dirty, full)
+        if collab:
+            self._run_collab()
+
+        with self._cond:
+            if self._status["state"] == "pending" and self._due is None:
+                self._status["state"] = "idle"
+
+    def status(self) -> dict:
+        with self._cond:
+            s = dict(self._status)
+            s["pending_users"] = len(self._dirty)
+            s["pending_full"] = self._full
+            s["pending_collab"] = self._collab
+            return s
+
+    def _loop(self) -> None:
+        while True:
+            with self._cond:
+                while self._due is None:
+                    self._cond.wait()
+                # Keep pushing the deadline back while changes keep arriving
+                wait = self._due - time.monotonic()
+                if wait > 0:
+                    self._cond.wait(wait)
+                    continue
+
+                dirty, full = self._dirty, self._full
+                self._dirty, self._full, self._due = set(), False, None
+                collab = self._collab and time.monotonic() >= self._collab_after
+                if collab:
+                    self._collab = False
+                elif self._collab:
+                    # Too soon after the last one; wake up again when it's allowed
+                    self._due = self._collab_after
+                self._status["state"] = "running"
+
+            self._run_job(dirty, full)
+            if collab:
+                self._run_collab()
+
+            with self._cond:
+                self._status["state"] = "pending" if self._due is not None else "idle"
+
+    def _run_job(self, dirty: set, full: bool) -> None:
+        from .train import train_model, retrain_users
+
+        if not dirty and not full:
+            return
+
+        self._status["last_started"] = datetime.utcnow()
+        self._status["last_kind"] = "full" if full else "partial"
+        try:
+            ctx = self.app.app_context() if self.app is not None else nullcontext()
+            with ctx:
+                report = train_model() if full else retrain_users(dirty)
+            self._status["last_report"] = report
+            self._status["last_error"] = None
+        except Exception as e:
+            log.exception("Background retrain failed")
+            self._status["last_error"] = str(e)
+        self._status["last_finished"] = datetime.utcnow()
+        self._status["runs"] += 1
+
+    def _run_collab(self) -> None:
+        from .train import train_collaborative
+
+        try:
+            ctx = self.app.app_context() if self.app is not None else nullcontext()
+            with ctx:
+                self._status["collab_last_report"] = train_collaborative()
+            self._status["collab_last_error"] = None
+        except Exception as e:
+            log.exception("Collaborative model retrain failed")
+            self._status["collab_last_error"] = str(e)
+        self._status["collab_last_finished"] = datetime.utcnow()
+        self._collab_after = time.monotonic() + self.collab_interval
+
+
+retrainer = RetrainScheduler(
+    debounce=float(os.getenv("RETRAIN_DEBOUNCE_SECONDS", "2")),
+    # Threads are frozen between requests on serverless hosts, so retrain inline there
+    run_async=os.getenv("RETRAIN_ASYNC", "0" if SERVERLESS else "1") != "0",
+    collab_interval=float(os.getenv("COLLAB_RETRAIN_SECONDS", "600")),
+)
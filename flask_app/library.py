@@ -0,0 +1,208 @@
+from __future__ import annotations
+import os
+from datetime import datetime
+from typing import Dict, Iterable, List, Set
+
+from bson import ObjectId
+from pymongo import DeleteMany, InsertOne, UpdateOne
+
+from .models import OwnedGame, User, Rating
+from .user_context import request_memo, forget_request_memo
+from .catalog import enrich_games, SYNC_ENRICH_LIMIT
+from .jobs import retrainer
+
+# Rows per insert batch when replacing / migrating a library
+WRITE_BATCH = 1000
+# A sync only queues a retrain when the user's vector signal moved by at least this
+# fraction (sum of |weight change| / sum of |weights| before the sync)
+SYNC_SIGNAL_THRESHOLD = float(os.getenv("SYNC_SIGNAL_THRESHOLD", "0.02"))
+
+
+def _oid(user_id) -> ObjectId:
+    return user_id if isinstance(user_id, ObjectId) else ObjectId(str(user_id))
+
+
+def replace_library(user_id, games: Iterable[dict]) -> int:
+    """
+    Store a freshly synced library: {appid, playtime_forever} rows for this user,
+    replacing whatever was there. Keeps User.game_count in step. Returns the row count.
+    """
+    uid = _oid(user_id)
+    rows = {}
+    for g in games:
+        appid = g.get("appid")
+        if appid is not None:
+            rows[int(appid)] = int(g.get("playtime_forever", 0) or 0)
+
+    coll = OwnedGame._get_collection()
+    ops = [DeleteMany({"user_id": uid})]
+    ops += [InsertOne({"user_id": uid, "appid": a, "playtime_forever": m}) for a, m in rows.items()]
+    for start in range(0, len(ops), WRITE_BATCH):
+        coll.bulk_write(ops[start:start + WRITE_BATCH], ordered=True)
+
+    User.objects(id=uid).update_one(set__game_count=len(rows))
+    forget_request_memo(("library", str(uid)), ("owned", str(uid)))
+    return len(rows)
+
+
+def _fresh_rows(games: Iterable[dict]) -> Dict[int, int]:
+    return {
+        int(g["appid"]): int(g.get("playtime_forever", 0) or 0)
+        for g in games
+        if g.get("appid") is not None
+    }
+
+
+def sync_library(user_id, games: Iterable[dict]) -> dict:
+    """
+    Delta sync: diff a fresh GetOwnedGames response against the stored library and
+    write only the rows that changed. Returns what changed plus how much it moves
+    the user's vector:
+      {"added": [appids], "removed": [appids], "changed": [appids], "unchanged": int, "total": int,
+       "signal_change": float, "relative_change": float, "vector_dirty": bool}
+    """
+    from .recommender import game_weight  # recommender imports this module
+
+    uid = _oid(user_id)
+    fresh = _fresh_rows(games)
+    coll = OwnedGame._get_collection()
+    stored = {d["appid"]: d.get("playtime_forever", 0) or 0
+              for d in coll.find({"user_id": uid}, {"_id": 0, "appid": 1, "playtime_forever": 1})}
+
+    added = [a for a in fresh if a not in stored]
+    removed = [a for a in stored if a not in fresh]
+    changed = [a for a in fresh if a in stored and fresh[a] != stored[a]]
+
+    ops = [InsertOne({"user_id": uid, "appid": a, "playtime_forever": fresh[a]}) for a in added]
+    ops += [UpdateOne({"user_id": uid, "appid": a}, {"$set": {"playtime_forever": fresh[a]}}) for a in changed]
+    if removed:
+        ops.append(DeleteMany({"user_id": uid, "appid": {"$in": removed}}))
+    for start in range(0, len(ops), WRITE_BATCH):
+        coll.bulk_write(ops[start:start + WRITE_BATCH], ordered=False)
+
+    if added or removed:
+        User.objects(id=uid).update_one(set__game_count=len(fresh))
+    if ops:
+        forget_request_memo(("library", str(uid)), ("owned", str(uid)))
+
+    # Same per-game weights as the user vector: ratings override hours
+    rated = {r.appid: r.rating for r in Rating.objects(user_id=uid).only("appid", "rating")}
+    before = sum(abs(game_weight(m, rated.get(a))) for a, m in stored.items())
+    signal = sum(abs(game_weight(fresh[a], rated.get(a))) for a in added)
+    signal += sum(abs(game_weight(stored[a], rated.get(a))) for a in removed)
+    signal += sum(abs(game_weight(fresh[a], rated.get(a)) - game_weight(stored[a], rated.get(a))) for a in changed)
+    relative = signal / before if before > 0 else (1.0 if signal > 0 else 0.0)
+
+    return {
+        "added": added,
+        "removed": removed,
+        "changed": changed,
+        "unchanged": len(fresh) - len(added) - len(changed),
+        "total": len(fresh),
+        "signal_change": round(float(signal), 4),
+        "relative_change": round(relative, 4),
+        "vector_dirty": relative >= SYNC_SIGNAL_THRESHOLD and signal > 0,
+    }
+
+
+def sync_steam_library(user, steamid64: str, games: List[dict], enrich: bool = True) -> dict:
+    """
+    Apply a freshly fetched Steam library (get_owned_games) to the user as a delta:
+      - only new appids are enriched from the Store API (most played first, capped)
+      - the user doc (steam id, count, last_sync) is saved with a data_version bump, so
+        cached profiles / results and the ALS fold-in refresh
+      - a retrain is queued only if the vector signal moved past SYNC_SIGNAL_THRESHOLD,
+        or new games reached the catalog (their tags can change the vocab)
+    Returns the sync_library() report plus "new_games" and "retrain".
+    """
+    delta = sync_library(user.id, games)
+
+    new_games = []
+    if enrich and delta["added"]:
+        fresh = _fresh_rows(games)
+        most_played = sorted(delta["added"], key=lambda a: fresh[a], reverse=True)
+        new_games = enrich_games(most_played[:SYNC_ENRICH_LIMIT])
+
+    user.steam_id = steamid64  # normalize stored ID to SteamID64
+    user.game_count = delta["total"]
+    user.last_sync = datetime.utcnow()
+    user.save()
+    user.bump_data_version()
+
+    retrain = None
+    if new_games:
+        retrain = "full"
+    elif delta["vector_dirty"]:
+        retrain = "partial"
+    if retrain:
+        retrainer.mark_dirty([user.id], full=retrain == "full")
+
+    delta["new_games"] = len(new_games)
+    delta["retrain"] = retrain
+    return delta
+
+
+def get_library(user_id) -> List[dict]:
+    """
+    [{"appid", "playtime_forever"}, ...] for one user. Read once per request.
+    """
+    def load():
+        cursor = OwnedGame._get_collection().find(
+            {"user_id": _oid(user_id)}, {"_id": 0, "appid": 1, "playtime_forever": 1}
+        )
+        return [{"appid": d["appid"], "playtime_forever": d.get("playtime_forever", 0) or 0} for d in cursor]
+
+    return request_memo(("library", str(user_id)), load)
+
+
+def owned_appids(user_id) -> Set[int]:
+    return request_memo(("owned", str(user_id)), lambda: {g["appid"] for g in get_library(user_id)})
+
+
+def top_played(user_id, n: int = 10) -> List[dict]:
+    """
+    The user's n most played games, most played first.
+    """
+    cursor = (
+        OwnedGame._get_collection()
+        .find({"user_id": _oid(user_id)}, {"_id": 0, "appid": 1, "playtime_forever": 1})
+        .sort([("playtime_forever", -1), ("appid", 1)])
+        .limit(n)
+    )
+    return [{"appid": d["appid"], "playtime_forever": d.get("playtime_forever", 0) or 0} for d in cursor]
+
+
+def load_libraries(user_ids) -> Dict[str, Dict[int, int]]:
+    """
+    Libraries for a batch of users in one query: {user_id_str: {appid: minutes}}.
+    Users with no library are present with an empty dict.
+    """
+    ids = [_oid(u) for u in user_ids]
+    out: Dict[str, Dict[int, int]] = {str(u): {} for u in ids}
+    if not ids:
+        return out
+    cursor = OwnedGame._get_collection().find(
+        {"user_id": {"$in": ids}}, {"_id": 0, "user_id": 1, "appid": 1, "playtime_forever": 1}
+    )
+    for d in cursor:
+        out[str(d["user_id"])][d["appid"]] = d.get("playtime_forever", 0) or 0
+    return out
+
+
+def migrate_embedded_libraries(batch_size: int = 200) -> dict:
+    """
+    One-off move of the old embedded users.owned_games lists into the owned_games collection.
+    Safe to re-run: users are only picked up while they still have the embedded field,
+    and it is unset once their rows are written.
+    """
+    users = User._get_collection()
+    migrated = rows = 0
+    while True:
+        batch = list(users.find({"owned_games": {"$exists": True}}, {"owned_games": 1}).limit(batch_size))
+        if not batch:
+            break
+        for doc in batch:
+            rows += replace_library(doc["_id"], doc.get("owned_games") or [])
+            users.update_one({"_id": doc["_id"]}, {"$unset": {"owned_games": ""}})
+            migrated += 1
+    return {"users_migrated": migrated, "rows_written": rows}
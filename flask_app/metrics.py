@@ -0,0 +1,296 @@
+from __future__ import annotations
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import nullcontext
+from typing import Callable, Dict, Iterable, Tuple
+
+from flask import Response, abort, g, has_request_context, request
+from pymongo import monitoring
+
+log = logging.getLogger(__name__)
+
+# Off by default. When off, timed() returns functions undecorated and stage() /
+# external_call() hand back a shared no-op context, so the cost is one flag check.
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "0") == "1"
+# Requests slower than this get a log line with their per-stage breakdown
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "1000"))
+# Optional bearer token for /metrics
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_NOOP = nullcontext()
+
+
+class Registry:
+    """
+    Process-local counters and histograms, rendered in the Prometheus text format.
+    Each worker exposes its own numbers; the scraper sums them.
+    Collectors are read at render time, for numbers a module already keeps (cache stats).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._help: Dict[str, Tuple[str, str]] = {}
+        self._counters: Dict[str, Dict[tuple, float]] = defaultdict(lambda: defaultdict(float))
+        # name -> labels -> [bucket counts..., sum, count]
+        self._histograms: Dict[str, Dict[tuple, list]] = defaultdict(dict)
+        # each returns [(name, labels, value)]
+        self._collectors: list = []
+
+    def describe(self, name: str, kind: str, text: str) -> None:
+        self._help[name] = (kind, text)
+
+    def inc(self, name: str, labels: dict, value: float = 1.0) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._counters[name][key] += value
+
+    def observe(self, name: str, labels: dict, seconds: float) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            h = self._histograms[name].get(key)
+            if h is None:
+                h = self._histograms[name][key] = [0] * len(BUCKETS) + [0.0, 0]
+            for i, le in enumerate(BUCKETS):
+                if seconds <= le:
+                    h[i] += 1
+            h[-2] += seconds
+            h[-1] += 1
+
+    def collect(self, fn: Callable[[], Iterable[tuple]]) -> None:
+        self._collectors.append(fn)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def render(self) -> str:
+        def fmt(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ""
+            return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+        collected: Dict[str, Dict[tuple, float]] = defaultdict(dict)
+        for fn in self._collectors:
+            try:
+                for name, labels, value in fn():
+                    collected[name][tuple(sorted(labels.items()))] = value
+            except Exception:
+                log.warning("metrics collector failed", exc_info=True)
+
+        lines = []
+        with self._lock:
+            for name in sorted(set(self._counters) | set(self._histograms) | set(collected)):
+                kind, text = self._help.get(name, ("untyped", ""))
+                lines.append(f"# HELP {name} {text}")
+                lines.append(f"# TYPE {name} {kind}")
+                values = {**self._counters.get(name, {}), **collected.get(name, {})}
+                for labels, value in sorted(values.items()):
+                    lines.append(f"{name}{fmt(labels)} {value:g}")
+                for labels, h in sorted(self._histograms.get(name, {}).items()):
+                    for le, n in zip(BUCKETS, h):
+                        lines.append(f"{name}_bucket{fmt(labels, [('le', f'{le:g}')])} {n}")
+                    lines.append(f"{name}_bucket{fmt(labels, [('le', '+Inf')])} {h[-1]}")
+                    lines.append(f"{name}_sum{fmt(labels)} {h[-2]:.6f}")
+                    lines.append(f"{name}_count{fmt(labels)} {h[-1]}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+registry = Registry()
+registry.describe("http_requests_total", "counter", "Requests by endpoint, method and status.")
+registry.describe("http_request_duration_seconds", "histogram", "Request latency by endpoint.")
+registry.describe("app_stage_duration_seconds", "histogram", "Time spent in instrumented app stages.")
+registry.describe("mongo_commands_total", "counter", "MongoDB commands by command name and outcome.")
+registry.describe("mongo_command_duration_seconds", "histogram", "MongoDB command latency by command name.")
+registry.describe("external_requests_total", "counter", "Steam API calls by api, endpoint and outcome.")
+registry.describe("external_request_duration_seconds", "histogram", "Steam API call latency by api and endpoint.")
+registry.describe("app_cache_events_total", "counter", "In-process cache lookups by cache and event (hits, misses, per-tier hits).")
+registry.describe("app_cache_entries", "gauge", "Entries currently held by each in-process cache.")
+
+
+def register_cache(cache: str, stats: Callable[[], dict]) -> None:
+    """
+    Expose a cache's own stats() dict: "size" as app_cache_entries, every other key as an
+    app_cache_events_total event. Cheap to call at import time; only read on GET /metrics.
+    """
+    def samples():
+        for key, value in stats().items():
+            if key == "size":
+                yield "app_cache_entries", {"cache": cache}, value
+            else:
+                yield "app_cache_events_total", {"cache": cache, "event": key}, value
+    registry.collect(samples)
+
+
+# ---- per-request breakdown ----
+
+def _breakdown():
+    """
+    This request's running totals, or None outside a request / before the request hook ran.
+    """
+    return g.get("_metrics") if has_request_context() else None
+
+
+def _add(section: str, name: str, seconds: float) -> None:
+    b = _breakdown()
+    if b is not None:
+        entry = b[section].setdefault(name, [0, 0.0])
+        entry[0] += 1
+        entry[1] += seconds
+
+
+class _Timer:
+    def __init__(self, name: str, api: str = None):
+        self.name = name
+        self.api = api
+
+    def __enter__(self):
+        self.t = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        dt = time.perf_counter() - self.t
+        if self.api is None:
+            registry.observe("app_stage_duration_seconds", {"stage": self.name}, dt)
+            _add("stages", self.name, dt)
+        else:
+            labels = {"api": self.api, "endpoint": self.name}
+            registry.inc("external_requests_total", dict(labels, outcome="error" if exc_type else "ok"))
+            registry.observe("external_request_duration_seconds", labels, dt)
+            _add("external", f"{self.api}.{self.name}", dt)
+        return False
+
+
+def stage(name: str):
+    """
+    with stage("knn.candidates"): ...  -- times a block as an app stage.
+    """
+    return _Timer(name) if METRICS_ENABLED else _NOOP
+
+
+def external_call(api: str, endpoint: str):
+    """
+    with external_call("steam_web", "GetOwnedGames"): ...  -- times one outbound API call.
+    """
+    return _Timer(endpoint, api) if METRICS_ENABLED else _NOOP
+
+
+def record_stage(name: str, seconds: float) -> None:
+    """
+    Report a stage that was already timed elsewhere (e.g. the service's own timings dict).
+    """
+    if METRICS_ENABLED:
+        registry.observe("app_stage_duration_seconds", {"stage": name}, seconds)
+        _add("stages", name, seconds)
+
+
+def timed(name: str):
+    """
+    Decorator form of stage(). Applied at import time, so with metrics off the
+    function is returned as is.
+    """
+    def wrap(fn):
+        if not METRICS_ENABLED:
+            return fn
+
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            with _Timer(name):
+                return fn(*args, **kwargs)
+        return inner
+    return wrap
+
+
+# ---- Mongo ----
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """
+    Counts every command pymongo sends and its server round-trip time. Events fire on
+    the thread that issued the command, so request-thread queries land in that request's breakdown.
+    """
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self._record(event.command_name, event.duration_micros, "ok")
+
+    def failed(self, event):
+        self._record(event.command_name, event.duration_micros, "error")
+
+    def _record(self, command: str, micros: int, outcome: str) -> None:
+        seconds = micros / 1e6
+        registry.inc("mongo_commands_total", {"command": command, "outcome": outcome})
+        registry.observe("mongo_command_duration_seconds", {"command": command}, seconds)
+        _add("mongo", command, seconds)
+
+
+_listener_registered = False
+
+
+# ---- Flask wiring ----
+
+def _before_request():
+    g._metrics = {"start": time.perf_counter(), "stages": {}, "mongo": {}, "external": {}}
+
+
+def _summary(section: dict) -> dict:
+    return {name: {"calls": n, "ms": round(s * 1000, 2)} for name, (n, s) in sorted(section.items())}
+
+
+def _after_request(response):
+    b = g.pop("_metrics", None)
+    if b is None:
+        return response
+    elapsed = time.perf_counter() - b["start"]
+    endpoint = request.endpoint or "unmatched"
+    registry.inc("http_requests_total", {"endpoint": endpoint, "method": request.method,
+                                         "status": str(response.status_code)})
+    registry.observe("http_request_duration_seconds", {"endpoint": endpoint}, elapsed)
+
+    if elapsed * 1000 >= SLOW_REQUEST_MS:
+        mongo = b["mongo"].values()
+        log.warning("slow request %s %s: %s", request.method, request.path, json.dumps({
+            "ms": round(elapsed * 1000, 1),
+            "status": response.status_code,
+            "mongo": {"commands": sum(n for n, _ in mongo), "ms": round(sum(s for _, s in mongo) * 1000, 2)},
+            "mongo_by_command": _summary(b["mongo"]),
+            "stages": _summary(b["stages"]),
+            "external": _summary(b["external"]),
+        }))
+    return response
+
+
+def metrics_view():
+    if METRICS_TOKEN and request.headers.get("Authorization") != f"Bearer {METRICS_TOKEN}":
+        abort(401)
+    return Response(registry.render(), mimetype="text/plain; version=0.0.4")
+
+
+def init_app(app) -> None:
+    """
+    Request hooks, the Mongo command listener and GET /metrics, only when METRICS_ENABLED=1.
+    Must run before the database connects: pymongo only notifies listeners registered
+    before a client is created.
+    """
+    global _listener_registered
+    if not METRICS_ENABLED:
+        return
+    if not _listener_registered:
+        monitoring.register(MongoCommandMetrics())
+        _listener_registered = True
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.add_url_rule("/metrics", "metrics", metrics_view)
@@ -0,0 +1,416 @@
+from __future__ import annotations
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .neighbors import NORM_BLOCK_ROWS, make_index
+from .metrics import stage, timed
+
+# Where trained snapshots live. Each retrain writes a new versioned folder:
+#   <MODEL_STORE_DIR>/v<timestamp>/vectors.f32   raw float32 user x tag matrix
+#   <MODEL_STORE_DIR>/v<timestamp>/norms.f32     float32 row norms (for the neighbor index)
+#   <MODEL_STORE_DIR>/v<timestamp>/meta.json     shape, vocab, user_ids
+#   <MODEL_STORE_DIR>/v<timestamp>/deltas.jsonl  single-user upserts since the snapshot
+#   <MODEL_STORE_DIR>/CURRENT                    name of the live version
+MODEL_STORE_DIR = os.getenv("MODEL_STORE_DIR", os.path.join(tempfile.gettempdir(), "steam_model_store"))
+# Serverless hosts (Vercel, Lambda): no background threads between requests and a
+# temp dir that goes away with the instance
+SERVERLESS = bool(os.getenv("VERCEL") or os.getenv("AWS_LAMBDA_FUNCTION_NAME"))
+KEEP_VERSIONS = 2
+# Once this many upserts piled up on a snapshot, fold them into a new one
+# (keeps the overlay, deltas.jsonl and its replay on load bounded)
+COMPACT_AFTER_DELTAS = int(os.getenv("MODEL_COMPACT_AFTER_DELTAS", "2000"))
+# A compaction lock older than this is assumed to belong to a worker that died
+COMPACT_LOCK_SECONDS = 600
+
+_lock = threading.Lock()
+_model: Optional["UserModel"] = None
+
+
+class UserModel:
+    """
+    In-memory view of one persisted snapshot.
+    The base matrix is memory-mapped (shared between workers by the OS page cache);
+    upserted users live in a small overlay that is searched alongside the base index.
+    An overlay entry of None removes the user (their vector went to zero).
+    """
+
+    def __init__(self, version: str, path: str, vocab: List[str], user_ids: List[str], vectors: np.ndarray,
+                 norms: np.ndarray = None):
+        self.version = version
+        self.path = path
+        self.vocab = vocab
+        self.user_ids = user_ids
+        self.vectors = vectors
+        self.row_of = {uid: i for i, uid in enumerate(user_ids)}
+        self.overlay: Dict[str, Optional[np.ndarray]] = {}
+        self.deltas_offset = 0
+        self.deltas_applied = 0
+        # Overlay stacked for kneighbors, rebuilt on the first query after an upsert
+        self._overlay_ids: List[str] = []
+        self._overlay_matrix: Optional[np.ndarray] = None
+        self._overlay_norms: Optional[np.ndarray] = None
+        self._shadowed = 0  # overlay users that also have a (stale) base row
+
+        # Backend picked by NEIGHBOR_BACKEND (brute | balltree | lsh)
+        self.knn = make_index(vectors, norms=norms) if len(user_ids) > 0 else None
+
+    @property
+    def n_users(self) -> int:
+        removed = sum(1 for u, v in self.overlay.items() if v is None and u in self.row_of)
+        added = sum(1 for u, v in self.overlay.items() if v is not None and u not in self.row_of)
+        return len(self.row_of) - removed + added
+
+    def vector_for(self, user_id: str) -> Optional[np.ndarray]:
+        if user_id in self.overlay:
+            return self.overlay[user_id]
+        i = self.row_of.get(user_id)
+        if i is None:
+            return None
+        return np.asarray(self.vectors[i])
+
+    def upsert(self, user_id: str, vector) -> None:
+        """
+        vector=None removes the user.
+        """
+        if user_id not in self.overlay and user_id in self.row_of:
+            self._shadowed += 1
+        self.overlay[user_id] = None if vector is None else np.asarray(vector, dtype=np.float32)
+        self._overlay_matrix = None
+
+    def _stacked_overlay(self):
+        if self._overlay_matrix is None:
+            self._overlay_ids = [u for u, v in self.overlay.items() if v is not None]
+            self._overlay_matrix = np.stack([self.overlay[u] for u in self._overlay_ids]) if self._overlay_ids \
+                else np.zeros((0, len(self.vocab)), dtype=np.float32)
+            self._overlay_norms = np.linalg.norm(self._overlay_matrix, axis=1)
+        return self._overlay_ids, self._overlay_matrix, self._overlay_norms
+
+    @timed("knn_query")
+    def kneighbors(self, vector, k: int) -> List[Tuple[str, float]]:
+        """
+        Returns up to k (user_id, cosine_distance) pairs, closest first.
+        """
+        q = np.asarray(vector, dtype=np.float32).reshape(1, -1)
+        results = []
+
+        if self.knn is not None:
+            # Ask for a few extra rows in case some of them were overridden by upserts
+            indices, distances = self.knn.query(q[0], k + self._shadowed)
+            for dist, i in zip(distances, indices):
+                uid = self.user_ids[i]
+                if uid not in self.overlay:
+                    results.append((uid, float(dist)))
+
+        if self.overlay:
+            ids, M, norms = self._stacked_overlay()
+            qn = float(np.linalg.norm(q))
+            denom = norms * qn
+            with np.errstate(divide="ignore", invalid="ignore"):
+                dists = np.where(denom > 0, 1.0 - (M @ q[0]) / denom, 1.0)
+            top = np.argsort(dists)[:k]
+            results.extend((ids[i], float(dists[i])) for i in top)
+
+        results.sort(key=lambda x: x[1])
+        return results[:k]
+
+
+def check_store_dir() -> None:
+    """
+    Refuse to start on a serverless host when the store lives in the temp dir: every cold
+    start would come up without a model and queue a full retrain.
+    """
+    tmp = os.path.realpath(tempfile.gettempdir())
+    path = os.path.realpath(MODEL_STORE_DIR)
+    if SERVERLESS and os.path.commonpath([tmp, path]) == tmp:
+        raise RuntimeError(
+            f"MODEL_STORE_DIR ({MODEL_STORE_DIR}) is in the temp dir, which doesn't survive this "
+            "serverless instance. Point it at persistent storage (e.g. an EFS mount).")
+
+
+def _current_file() -> str:
+    return os.path.join(MODEL_STORE_DIR, "CURRENT")
+
+
+def _read_current() -> Optional[str]:
+    try:
+        with open(_current_file()) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+class ModelWriter:
+    """
+    Streams a retrain into a new version folder, a batch of users at a time:
+    rows go straight into a preallocated float32 memmap (vectors.f32), so the whole
+    matrix is never held in memory. commit() truncates the file to the rows actually
+    written (grown if more users showed up than the capacity guessed) and makes it live.
+    """
+
+    def __init__(self, vocab: List[str], capacity: int):
+        self.vocab = list(vocab)
+        self.dim = len(self.vocab)
+        self.capacity = max(int(capacity), 1)
+        self.rows = 0
+        self.user_ids: List[str] = []
+        self.norms: List[np.ndarray] = []
+
+        os.makedirs(MODEL_STORE_DIR, exist_ok=True)
+        self.version = f"v{time.time_ns()}"
+        self.path = os.path.join(MODEL_STORE_DIR, self.version)
+        os.makedirs(self.path)
+        self._file = os.path.join(self.path, "vectors.f32")
+        open(self._file, "wb").close()
+        self._mm = None
+
+    def _map(self, capacity: int) -> None:
+        # r+ extends the file to the new shape; existing rows stay where they are
+        if self._mm is not None:
+            self._mm.flush()
+        self.capacity = capacity
+        self._mm = np.memmap(self._file, dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+
+    def append(self, user_ids: List[str], vectors) -> None:
+        X = np.asarray(vectors, dtype=np.float32).reshape(len(user_ids), self.dim)
+        n = len(user_ids)
+        if n == 0:
+            return
+        if self.dim:
+            if self._mm is None:
+                self._map(max(self.capacity, n))
+            elif self.rows + n > self.capacity:
+                self._map(max(self.capacity * 2, self.rows + n))
+            self._mm[self.rows:self.rows + n] = X
+        self.norms.append(np.linalg.norm(X, axis=1).astype(np.float32))
+        self.user_ids.extend(user_ids)
+        self.rows += n
+
+    def commit(self) -> str:
+        if self._mm is not None:
+            self._mm.flush()
+            self._mm = None
+        os.truncate(self._file, self.rows * self.dim * 4)
+        norms = np.concatenate(self.norms) if self.norms else np.zeros(0, dtype=np.float32)
+        norms.tofile(os.path.join(self.path, "norms.f32"))
+        with open(os.path.join(self.path, "meta.json"), "w") as f:
+            json.dump({"shape": [self.rows, self.dim], "vocab": self.vocab, "user_ids": self.user_ids}, f)
+        _publish(self.version)
+        return self.version
+
+    def abort(self) -> None:
+        self._mm = None
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+def _publish(version: str) -> None:
+    # Atomic switch so readers never see a half-written version
+    tmp = _current_file() + ".tmp"
+    with open(tmp, "w") as f:
+        f.write(version)
+    os.replace(tmp, _current_file())
+    _cleanup_old_versions(version)
+
+
+def save_model(user_ids: List[str], vectors, vocab: List[str]) -> str:
+    """
+    Persist a freshly trained user matrix as a new version and make it live.
+    """
+    writer = ModelWriter(vocab, len(user_ids))
+    writer.append(user_ids, vectors)
+    return writer.commit()
+
+
+def _cleanup_old_versions(live: str) -> None:
+    versions = sorted(d for d in os.listdir(MODEL_STORE_DIR) if d.startswith("v") and d != live)
+    stale = versions[:max(0, len(versions) - (KEEP_VERSIONS - 1))]
+    for old in stale:
+        shutil.rmtree(os.path.join(MODEL_STORE_DIR, old), ignore_errors=True)
+
+
+def _load(version: str) -> Optional[UserModel]:
+    path = os.path.join(MODEL_STORE_DIR, version)
+    try:
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+    except FileNotFoundError:
+        return None
+
+    rows, dim = meta["shape"]
+    norms = None
+    if rows > 0 and dim > 0:
+        vectors = np.memmap(os.path.join(path, "vectors.f32"), dtype=np.float32, mode="r", shape=(rows, dim))
+        # Older snapshots have no norms file; the index computes them then
+        if os.path.exists(os.path.join(path, "norms.f32")):
+            norms = np.memmap(os.path.join(path, "norms.f32"), dtype=np.float32, mode="r", shape=(rows,))
+    else:
+        vectors = np.zeros((rows, dim), dtype=np.float32)
+    return UserModel(version, path, meta["vocab"], meta["user_ids"], vectors, norms)
+
+
+def _apply_deltas(model: UserModel) -> None:
+    """
+    Replay upserts written by any worker since we last looked.
+    """
+    deltas = os.path.join(model.path, "deltas.jsonl")
+    try:
+        size = os.path.getsize(deltas)
+    except OSError:
+        return
+    if size <= model.deltas_offset:
+        return
+
+    with open(deltas) as f:
+        f.seek(model.deltas_offset)
+        for line in f:
+            if not line.endswith("\n"):
+                break  # partially written line, pick it up next time
+            model.deltas_offset += len(line.encode("utf-8"))
+            model.deltas_applied += 1
+            d = json.loads(line)
+            model.upsert(d["user_id"], d.get("vector"))
+
+
+def get_model() -> Optional[UserModel]:
+    """
+    Lazily load (or reload, after a retrain) the live snapshot for this worker.
+    Returns None if nothing has been trained yet.
+    """
+    global _model
+    version = _read_current()
+    if version is None:
+        return None
+
+    with _lock:
+        if _model is None or _model.version != version:
+            with stage("model_load"):
+                loaded = _load(version)
+            if loaded is None:
+                return _model
+            _model = loaded
+        _apply_deltas(_model)
+        return _model
+
+
+def upsert_user(user_id: str, vector) -> None:
+    """
+    Record a single user's new vector without a full retrain.
+    Visible immediately in this worker and on the next get_model() in the others.
+    """
+    model = get_model()
+    if model is None:
+        return
+
+    vec = np.asarray(vector, dtype=np.float32)
+    _append_delta(model, {"user_id": user_id, "vector": vec.tolist()})
+
+
+def remove_user(user_id: str) -> None:
+    """
+    Take a user out of the live model (e.g. their vector went to zero), the way a full
+    retrain leaves out users without signal. No-op if they aren't in it.
+    """
+    model = get_model()
+    if model is None or model.vector_for(user_id) is None:
+        return
+    _append_delta(model, {"user_id": user_id, "vector": None})
+
+
+def _append_delta(model: UserModel, delta: dict) -> None:
+    line = json.dumps(delta) + "\n"
+    with _lock:
+        with open(os.path.join(model.path, "deltas.jsonl"), "a") as f:
+            f.write(line)
+        _apply_deltas(model)
+        compact = model.deltas_applied >= COMPACT_AFTER_DELTAS
+
+    if compact:
+        compact_model(model)
+
+
+def _claim_compaction(model: UserModel) -> bool:
+    """
+    One worker compacts a given snapshot; the others keep appending deltas meanwhile.
+    """
+    lock = os.path.join(model.path, "COMPACTING")
+    try:
+        os.close(os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        return True
+    except FileExistsError:
+        try:
+            if time.time() - os.path.getmtime(lock) < COMPACT_LOCK_SECONDS:
+                return False
+            os.utime(lock)  # stale, take it over
+            return True
+        except OSError:
+            return False
+
+
+@timed("model_compact")
+def compact_model(model: UserModel) -> Optional[str]:
+    """
+    Write base rows + overlay as a new snapshot and make it live, so the overlay and
+    deltas.jsonl start from empty again. Streams the base matrix a block at a time.
+    Returns the new version, or None if another worker is already compacting it.
+    """
+    if not _claim_compaction(model):
+        return None
+
+    with _lock:
+        overlay, offset = dict(model.overlay), model.deltas_offset
+
+    writer = ModelWriter(model.vocab, model.n_users)
+    try:
+        for start in range(0, len(model.user_ids), NORM_BLOCK_ROWS):
+            ids = model.user_ids[start:start + NORM_BLOCK_ROWS]
+            X = np.array(model.vectors[start:start + NORM_BLOCK_ROWS], dtype=np.float32)
+            keep = np.ones(len(ids), dtype=bool)
+            for j, uid in enumerate(ids):
+                if uid in overlay:
+                    if overlay[uid] is None:
+                        keep[j] = False
+                    else:
+                        X[j] = overlay[uid]
+            writer.append([uid for uid, k in zip(ids, keep) if k], X[keep])
+        new = [uid for uid, vec in overlay.items() if vec is not None and uid not in model.row_of]
+        if new:
+            writer.append(new, np.stack([overlay[uid] for uid in new]))
+        version = writer.commit()
+    except Exception:
+        writer.abort()
+        raise
+
+    # Carry over upserts other workers appended to the old snapshot while we wrote
+    try:
+        with open(os.path.join(model.path, "deltas.jsonl")) as f:
+            f.seek(offset)
+            late = [line for line in f if line.endswith("\n")]
+    except FileNotFoundError:
+        late = []
+    if late:
+        with open(os.path.join(MODEL_STORE_DIR, version, "deltas.jsonl"), "a") as f:
+            f.writelines(late)
+    return version
+
+
+def model_status() -> Optional[dict]:
+    """
+    Size of the live snapshot and of its upsert overlay, for /engine/train_status.
+    """
+    model = get_model()
+    if model is None:
+        return None
+    return {
+        "version": model.version,
+        "users": model.n_users,
+        "snapshot_users": len(model.user_ids),
+        "overlay_users": len(model.overlay),
+        "deltas": model.deltas_applied,
+        "compact_after_deltas": COMPACT_AFTER_DELTAS,
+    }
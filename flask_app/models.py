@@ -11,20 +11,58 @@ class User(db.Document, UserMixin):
     friend_steam_id = db.StringField()
 
     steam_id = db.StringField()
-    owned_games = db.ListField(db.DictField(), default=list)   # each dict: {"appid": int, "playtime_forever": int}
+    # The library itself lives in the owned_games collection (see OwnedGame / library.py);
+    # only its size is kept here so pages can show it without loading it.
+    game_count = db.IntField(default=0)
     last_sync = db.DateTimeField()
 
     # This tells MongoEngine which collection name to use (optional but nice)
-    meta = {"collection": "users"}
+    # strict=False: documents not migrated yet still carry the old embedded owned_games list
+    meta = {
+        "collection": "users",
+        "strict": False,
+        "indexes": [
+            {"fields": ["steam_id"], "sparse": True},
+        ]
+    }
 
     pinned_games = db.ListField(db.IntField(), default=list)
 
     calculated_vector = db.ListField(db.FloatField(), default=list)
 
+    # Bumped whenever this user's own data changes (prefs, ratings, pins, library, steam id)
+    # so cached recommendations and cached profiles (user_context.py) are never served stale.
+    data_version = db.IntField(default=0)
+
     def get_id(self):
         # Flask-Login needs a string ID
         return str(self.id)
+
+    def bump_data_version(self) -> int:
+        """
+        Atomic +1 on data_version (what cached results / profiles are keyed on); returns the new value.
+        Call it after save(), never instead of assigning data_version by hand.
+        """
+        doc = User.objects(id=self.id).only("data_version").modify(inc__data_version=1, new=True)
+        # Not through the attribute: that marks the field changed and a later save() would $set it back
+        self._data["data_version"] = doc.data_version
+        return doc.data_version
     
+class OwnedGame(db.Document):
+    # One row per (user, game) in a user's Steam library
+    user_id = db.ObjectIdField(required=True)
+    appid = db.IntField(required=True)
+    playtime_forever = db.IntField(default=0)  # minutes
+
+    meta = {
+        "collection": "owned_games",
+        "indexes": [
+            {"fields": ["user_id", "appid"], "unique": True},
+            {"fields": ["user_id", "-playtime_forever", "appid"]},  # top played
+            "appid",
+        ]
+    }
+
 class Game(db.Document):
     appid = db.IntField(required=True, unique=True)
     name = db.StringField(required=True)
@@ -41,8 +79,49 @@ class Rating(db.Document):
     meta = {
         "collection": "ratings",
         "indexes": [
-            {"fields": ["user_id", "appid"], "unique": True}
+            {"fields": ["user_id", "appid"], "unique": True},
+            {"fields": ["user_id", "-id"]},  # a user's latest ratings
         ]
     }
 
+class AppDetailsCache(db.Document):
+    # Cached Store API appdetails lookups, including misses (found=False) so
+    # delisted / region-locked appids aren't re-fetched on every request.
+    appid = db.IntField(required=True, unique=True)
+    found = db.BooleanField(required=True)
+    name = db.StringField()
+    tags = db.ListField(db.StringField(), default=list)
+    expires_at = db.DateTimeField(required=True)
+
+    meta = {
+        "collection": "app_details_cache",
+        "indexes": [
+            {"fields": ["expires_at"], "expireAfterSeconds": 0}
+        ]
+    }
+
+class CachedRecommendation(db.Document):
+    # Optional persistent tier of result_cache (RESULT_CACHE_PERSIST=1)
+    user_id = db.StringField(required=True)
+    strategy = db.StringField(required=True)
+    version = db.StringField(required=True)
+    result = db.DictField()
+    expires_at = db.DateTimeField(required=True)
+
+    meta = {
+        "collection": "recommendation_cache",
+        "indexes": [
+            {"fields": ["user_id", "strategy"], "unique": True},
+            {"fields": ["expires_at"], "expireAfterSeconds": 0}
+        ]
+    }
+
+class TagVocabulary(db.Document):
+    # The shared tag -> vector column order (see vocab.py). Append-only, so vectors
+    # built against an older version are a prefix of the current layout.
+    name = db.StringField(required=True, unique=True)
+    tags = db.ListField(db.StringField(), default=list)
+    version = db.IntField(default=0)
+    updated_at = db.DateTimeField()
 
+    meta = {"collection": "tag_vocab"}
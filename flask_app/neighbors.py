@@ -0,0 +1,168 @@
+from __future__ import annotations
+import os
+from abc import ABC, abstractmethod
+from typing import Dict, Tuple, Type
+
+import numpy as np
+from sklearn.neighbors import BallTree
+
+# Which backend the model store uses: brute | balltree | lsh
+NEIGHBOR_BACKEND = os.getenv("NEIGHBOR_BACKEND", "brute")
+# Rows per block when computing norms, so a memory-mapped matrix is read a piece at a time
+NORM_BLOCK_ROWS = 65536
+
+
+def row_norms(X: np.ndarray) -> np.ndarray:
+    """
+    L2 norm of every row, in blocks (np.linalg.norm on the whole matrix makes a full-size temporary).
+    """
+    out = np.zeros(len(X), dtype=np.float32)
+    for start in range(0, len(X), NORM_BLOCK_ROWS):
+        out[start:start + NORM_BLOCK_ROWS] = np.linalg.norm(X[start:start + NORM_BLOCK_ROWS], axis=1)
+    return out
+
+
+def _cosine_distances(X: np.ndarray, norms: np.ndarray, q: np.ndarray, rows=None) -> np.ndarray:
+    """
+    1 - cos(q, X[rows]); zero vectors are at distance 1 (same as sklearn).
+    """
+    qn = float(np.linalg.norm(q))
+    if rows is None:
+        dots, n = X @ q, norms
+    else:
+        dots, n = X[rows] @ q, norms[rows]
+    denom = n * qn
+    sims = np.divide(dots, denom, out=np.zeros_like(dots, dtype=np.float64), where=denom > 0)
+    return 1.0 - sims
+
+
+def _top_k(dist: np.ndarray, k: int) -> np.ndarray:
+    k = min(k, len(dist))
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    if k < len(dist):
+        part = np.argpartition(dist, k - 1)[:k]
+    else:
+        part = np.arange(len(dist))
+    return part[np.argsort(dist[part], kind="stable")]
+
+
+class NeighborIndex(ABC):
+    """
+    Cosine nearest-neighbor search over the rows of a (users x tags) matrix.
+    query() returns (row_indices, cosine_distances), closest first.
+    """
+
+    name = "base"
+
+    def __init__(self, vectors: np.ndarray, norms: np.ndarray = None):
+        self.X = vectors
+        # Norms only, so a memory-mapped matrix is never copied (the model store saves them at training time)
+        self.norms = norms if norms is not None else row_norms(vectors)
+
+    def __len__(self) -> int:
+        return len(self.X)
+
+    @abstractmethod
+    def query(self, q, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        ...
+
+
+class BruteForceIndex(NeighborIndex):
+    """
+    Exact: one matrix-vector product against the whole matrix.
+    """
+
+    name = "brute"
+
+    def query(self, q, k):
+        q = np.asarray(q, dtype=np.float32).ravel()
+        dist = _cosine_distances(self.X, self.norms, q)
+        idx = _top_k(dist, k)
+        return idx, dist[idx]
+
+
+class BallTreeIndex(NeighborIndex):
+    """
+    Exact-ish: ball tree over L2-normalized rows (euclidean order == cosine order
+    for unit vectors), then exact cosine re-ranking of the returned rows.
+    Makes a normalized float64 copy of the matrix.
+    """
+
+    name = "balltree"
+
+    def __init__(self, vectors, norms=None, leaf_size: int = 40):
+        super().__init__(vectors, norms)
+        safe = np.where(self.norms > 0, self.norms, 1.0)
+        self.tree = BallTree(np.asarray(vectors, dtype=np.float64) / safe[:, None], leaf_size=leaf_size) if len(vectors) else None
+
+    def query(self, q, k):
+        if self.tree is None:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        q = np.asarray(q, dtype=np.float64).ravel()
+        qn = np.linalg.norm(q)
+        k = min(k, len(self.X))
+        _, rows = self.tree.query((q / qn if qn > 0 else q).reshape(1, -1), k=k)
+        rows = rows[0]
+        dist = _cosine_distances(self.X, self.norms, q.astype(np.float32), rows)
+        order = np.argsort(dist, kind="stable")
+        return rows[order], dist[order]
+
+
+class LSHIndex(NeighborIndex):
+    """
+    Approximate: random-hyperplane LSH (sign of projections) in several tables.
+    A query only scores rows sharing a bucket with it in at least one table
+    (plus 1-bit-flip neighbor buckets), then re-ranks them exactly.
+    Falls back to brute force if the buckets hold fewer than k rows.
+    """
+
+    name = "lsh"
+
+    def __init__(self, vectors, norms=None, n_bits: int = 12, n_tables: int = 8, seed: int = 0):
+        super().__init__(vectors, norms)
+        dim = vectors.shape[1] if vectors.ndim == 2 else 0
+        rng = np.random.default_rng(seed)
+        self.planes = [rng.standard_normal((dim, n_bits)).astype(np.float32) for _ in range(n_tables)]
+        self.weights = (1 << np.arange(n_bits)).astype(np.int64)
+        self.n_bits = n_bits
+
+        self.tables = []
+        for planes in self.planes:
+            codes = ((np.asarray(vectors) @ planes) > 0).astype(np.int64) @ self.weights if len(vectors) else np.zeros(0, dtype=np.int64)
+            order = np.argsort(codes, kind="stable")
+            uniq, starts = np.unique(codes[order], return_index=True)
+            ends = np.append(starts[1:], len(order))
+            self.tables.append({int(c): order[s:e] for c, s, e in zip(uniq, starts, ends)})
+
+    def query(self, q, k):
+        q = np.asarray(q, dtype=np.float32).ravel()
+        found = []
+        for planes, table in zip(self.planes, self.tables):
+            code = int(((q @ planes) > 0).astype(np.int64) @ self.weights)
+            for probe in [code] + [code ^ (1 << b) for b in range(self.n_bits)]:
+                rows = table.get(probe)
+                if rows is not None:
+                    found.append(rows)
+
+        rows = np.unique(np.concatenate(found)) if found else np.zeros(0, dtype=np.int64)
+        if len(rows) < k:
+            return BruteForceIndex.query(self, q, k)
+
+        dist = _cosine_distances(self.X, self.norms, q, rows)
+        idx = _top_k(dist, k)
+        return rows[idx], dist[idx]
+
+
+BACKENDS: Dict[str, Type[NeighborIndex]] = {
+    "brute": BruteForceIndex,
+    "balltree": BallTreeIndex,
+    "lsh": LSHIndex,
+}
+
+
+def make_index(vectors: np.ndarray, backend: str = None, norms: np.ndarray = None) -> NeighborIndex:
+    backend = backend or NEIGHBOR_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown NEIGHBOR_BACKEND {backend!r}; pick one of {sorted(BACKENDS)}")
+    return BACKENDS[backend](vectors, norms)
@@ -1,14 +1,15 @@
 import re
-from flask import Blueprint, render_template, redirect, url_for
+from flask import Blueprint, render_template, redirect, url_for, request
 from flask_login import login_required, current_user
 from .forms import PreferencesForm, FriendCompareForm, SteamIdForm, SyncSteamForm, ManualRateForm, EmptyForm
-from datetime import datetime
 from .steam_api import get_owned_games, resolve_to_steamid64
 from .models import Rating, Game
 from .steam_store_api import fetch_app_details
+from .catalog import save_games
 from bson import ObjectId
-from .train import train_model
-from .recommender import build_tag_vocab, user_to_vector
+from .jobs import retrainer
+from .library import sync_steam_library, top_played
+from .friend_compare import compare_with_friends, parse_steam_inputs
 
 
 profile = Blueprint("profile", __name__, url_prefix="/profile")
@@ -48,7 +49,8 @@ def preferences():
         current_user.favorite_tags = form.favorite_tags.data
         current_user.hated_tags = form.hated_tags.data
         current_user.save()
-        train_model()
+        current_user.bump_data_version()
+        retrainer.mark_dirty([current_user.id])
         return redirect(url_for("profile.preferences"))
 
     return render_template("preferences.html", form=form)
@@ -61,58 +63,25 @@ def friend_compare():
     result = None
 
     if form.validate_on_submit() and form.submit.data:
-        friend_input = form.friend_steam.data.strip()
-
-        try:
-            friend_steamid64 = resolve_to_steamid64(friend_input)
-            friend_games = get_owned_games(friend_steamid64)  # returns list of dicts with appid, playtime_forever, maybe name
-        except Exception:
+        steam_inputs = parse_steam_inputs(form.friend_steam.data)
+        # All friends fetched concurrently and scored together (see friend_compare.py)
+        result = compare_with_friends(current_user, steam_inputs)
+        if not result["ranked"]:
             return redirect(url_for("profile.friend_compare"))
 
-        # Compute overlap (based on appids)
-        my_owned = {g.get("appid") for g in (current_user.owned_games or []) if g.get("appid") is not None}
-        friend_owned = {g.get("appid") for g in friend_games if g.get("appid") is not None}
-
-        overlap = 0.0
-        if my_owned or friend_owned:
-            overlap = (len(my_owned & friend_owned) / len(my_owned | friend_owned)) * 100
-
-        # Compute cosine similarity using vectors
-        vocab = build_tag_vocab()
-        me_vec = user_to_vector(current_user, vocab)
-
-        # Build a "fake user-like object" for friend vector using their owned games only
-        class FriendObj:
-            id = None
-            favorite_tags = []
-            hated_tags = []
-            owned_games = [{"appid": g.get("appid"), "playtime_forever": g.get("playtime_forever", 0)} for g in friend_games]
-
-        friend_vec = user_to_vector(FriendObj(), vocab)
-
-        # cosine similarity (manual, no sklearn needed here)
-        def cos_sim(a, b):
-            import math
-            dot = sum(x*y for x, y in zip(a, b))
-            na = math.sqrt(sum(x*x for x in a))
-            nb = math.sqrt(sum(x*x for x in b))
-            if na == 0 or nb == 0:
-                return 0.0
-            return dot / (na * nb)
-
-        similarity = cos_sim(me_vec, friend_vec)
-
-        result = {
-            "friend_steamid64": friend_steamid64,
-            "overlap_percent": round(overlap, 2),
-            "similarity": round(similarity, 3),
-            "my_count": len(my_owned),
-            "friend_count": len(friend_owned),
-            "shared_count": len(my_owned & friend_owned),
-        }
-
     return render_template("friend_compare.html", form=form, result=result)
 
+@profile.route("/compare")
+@login_required
+def compare_json():
+    """
+    ?steam=<id>&steam=<id>... (or one comma separated value) -> similarity / overlap matrices.
+    """
+    steam_inputs = parse_steam_inputs(",".join(request.args.getlist("steam")))
+    if not steam_inputs:
+        return {"error": "Pass one or more ?steam= Steam IDs, vanity names or profile URLs."}, 400
+    return compare_with_friends(current_user, steam_inputs)
+
 @profile.route("/steam", methods=["GET", "POST"])
 @login_required
 def steam_settings():
@@ -126,6 +95,7 @@ def steam_settings():
     if steam_form.validate_on_submit() and steam_form.submit.data:
         current_user.steam_id = steam_form.steam_id.data.strip()
         current_user.save()
+        current_user.bump_data_version()  # so cached profiles refresh
         return redirect(url_for("profile.steam_settings"))
 
     if sync_form.validate_on_submit() and sync_form.submit.data:
@@ -139,45 +109,21 @@ def steam_settings():
             # Keep it simple (no flash). Just don't sync if invalid.
             return redirect(url_for("profile.steam_settings"))
 
-        current_user.steam_id = steamid64  # normalize stored ID to SteamID64
-        current_user.owned_games = [
-            {
-                "appid": g.get("appid"),
-                "name": g.get("name"),
-                "playtime_forever": g.get("playtime_forever", 0),
-            }
-            for g in games
-            if g.get("appid") is not None
-        ]
-        current_user.last_sync = datetime.utcnow()
-
-        # Enrich Games collection for owned appids (cap to avoid hammering API)
-        owned_appids = [g["appid"] for g in current_user.owned_games[:200]]  # start with 50
-        existing = set(Game.objects(appid__in=owned_appids).scalar("appid"))
-
-        for appid in owned_appids:
-            if appid not in existing:
-                details = fetch_app_details(appid)
-                if details:
-                    Game(appid=details["appid"], name=details["name"], tags=details["tags"], global_rating=0.0).save()
-
-        current_user.save()
-        train_model()
+        # Only writes changed rows, enriches new appids and retrains if the vector moved
+        sync_steam_library(current_user, steamid64, games)
 
         return redirect(url_for("profile.steam_settings"))
 
-    owned = current_user.owned_games or []
-    top_games = sorted(
-        owned,
-        key=lambda x: x.get("playtime_forever", 0),
-        reverse=True
-    )[:10]
+    top_games = top_played(current_user.id, 10)
+    names = {g.appid: g.name for g in Game.objects(appid__in=[g["appid"] for g in top_games]).only("appid", "name")}
+    for g in top_games:
+        g["name"] = names.get(g["appid"])
 
     return render_template(
         "steam.html",
         steam_form=steam_form,
         sync_form=sync_form,
-        owned_count=len(owned),
+        owned_count=current_user.game_count or 0,
         last_sync=current_user.last_sync,
         top_games=top_games,
     )
@@ -195,6 +141,7 @@ def rate_game():
         if appid_int <= 0 or appid_int > 2_147_483_647:
             return redirect(url_for("profile.rate_game"))
 
+        new_game = False
         game = Game.objects(appid=appid_int).first()
         if not game:
             details = fetch_app_details(appid_int)
@@ -202,12 +149,8 @@ def rate_game():
                 # invalid appid (or store API says success=false)
                 return redirect(url_for("profile.rate_game"))
 
-            Game(
-                appid=details["appid"],
-                name=details["name"],
-                tags=details.get("tags", []),
-                global_rating=0.0
-            ).save()
+            save_games([details])
+            new_game = True
 
         # Save rating (works whether user owns it or not)
         Rating.objects(user_id=current_user.id, appid=appid_int).modify(
@@ -215,8 +158,9 @@ def rate_game():
             set__rating=form.rating.data,
             new=True
         )
+        current_user.bump_data_version()
 
-        train_model()
+        retrainer.mark_dirty([current_user.id], full=new_game)
 
         return redirect(url_for("profile.rate_game"))
 
@@ -233,6 +177,7 @@ def rate_game():
 @login_required
 def delete_rating(appid):
     Rating.objects(user_id=current_user.id, appid=appid).delete()
-    train_model()
+    current_user.bump_data_version()
+    retrainer.mark_dirty([current_user.id])
     return redirect(url_for("profile.rate_game"))
 
@@ -0,0 +1,120 @@
+from __future__ import annotations
+from datetime import datetime
+from typing import List, Optional
+
+from bson import ObjectId
+
+from .models import User, Game, Rating, OwnedGame, AppDetailsCache, CachedRecommendation, TagVocabulary
+
+# Every model whose declared indexes the routes depend on
+MODELS = [User, Game, Rating, OwnedGame, AppDetailsCache, CachedRecommendation, TagVocabulary]
+
+
+def _sample() -> dict:
+    """
+    Real values to plug into the queries when the database has data, placeholders otherwise.
+    """
+    user = User._get_collection().find_one({}, {"email": 1, "steam_id": 1}) or {}
+    game = Game._get_collection().find_one({}, {"appid": 1}) or {}
+    return {
+        "user_id": user.get("_id", ObjectId()),
+        "email": user.get("email", "someone@example.com"),
+        "steam_id": user.get("steam_id") or "76561197960287930",
+        "appid": game.get("appid", 620),
+    }
+
+
+def route_queries(sample: dict = None) -> List[tuple]:
+    """
+    (name, model, filter, sort) for each query a request can issue.
+    Batch jobs (training, catalog index builds, migrations) read whole collections
+    on purpose and are not listed; genre pages are served from the catalog index.
+    """
+    s = sample or _sample()
+    uid, appid, now = s["user_id"], s["appid"], datetime.utcnow()
+    return [
+        ("auth: user by email", User, {"email": s["email"]}, None),
+        ("session: user by id", User, {"_id": uid}, None),
+        ("steam: user by steam_id", User, {"steam_id": s["steam_id"]}, None),
+        ("explore: game detail", Game, {"appid": appid}, None),
+        ("hydrate: games by appid", Game, {"appid": {"$in": [appid]}}, None),
+        ("rate: user's rating for a game", Rating, {"user_id": uid, "appid": appid}, None),
+        ("rate: user's latest ratings", Rating, {"user_id": uid}, [("_id", -1)]),
+        ("knn: neighbors' ratings", Rating, {"user_id": {"$in": [uid]}}, None),
+        ("library: one user", OwnedGame, {"user_id": uid}, None),
+        ("library: top played", OwnedGame, {"user_id": uid}, [("playtime_forever", -1), ("appid", 1)]),
+        ("library: batch of users", OwnedGame, {"user_id": {"$in": [uid]}}, None),
+        ("store: cached appdetails", AppDetailsCache, {"appid": {"$in": [appid]}, "expires_at": {"$gt": now}}, None),
+        ("vocab: version check", TagVocabulary, {"name": "tags"}, None),
+        ("results: cached recommendation", CachedRecommendation,
+         {"user_id": str(uid), "strategy": "tags", "version": "v", "expires_at": {"$gt": now}}, None),
+    ]
+
+
+def _stages(plan) -> List[str]:
+    """
+    Every stage name in an explain() plan tree.
+    """
+    out = []
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            out.append(plan["stage"])
+        for key in ("inputStage", "queryPlan"):
+            out += _stages(plan.get(key))
+        for child in plan.get("inputStages", []):
+            out += _stages(child)
+    return out
+
+
+def _static_plan(coll, filt: dict, sort: Optional[list]) -> List[str]:
+    """
+    Approximation of the planner for backends without explain() (mongomock):
+    an index is usable if its first key is filtered on; a sort is free if the index
+    continues with the sort keys after the filtered ones.
+    """
+    eq = [k for k, v in filt.items() if not (isinstance(v, dict) and set(v) - {"$in"})]
+    best = None
+    for info in coll.index_information().values():
+        keys = [k for k, _ in info["key"]]
+        if keys[0] in filt:
+            best = best or keys
+            n = 0
+            while n < len(keys) and keys[n] in eq:
+                n += 1
+            rest = keys[n:]
+            if sort and rest[:len(sort)] == [k for k, _ in sort]:
+                return ["FETCH", "IXSCAN"]
+    if best is None:
+        return ["COLLSCAN"]
+    return (["SORT"] if sort else []) + ["FETCH", "IXSCAN"]
+
+
+def explain_route_queries(ensure_indexes: bool = True) -> List[dict]:
+    """
+    Run every route query through explain() and report the stages of its winning plan.
+    A result with "collscan": True means the query would read the whole collection.
+    """
+    if ensure_indexes:
+        for model in MODELS:
+            model.ensure_indexes()
+
+    results = []
+    for name, model, filt, sort in route_queries():
+        coll = model._get_collection()
+        cursor = coll.find(filt)
+        if sort:
+            cursor = cursor.sort(sort)
+        if hasattr(cursor, "explain"):
+            plan = cursor.explain()["queryPlanner"]["winningPlan"]
+            stages, mode = _stages(plan), "explain"
+        else:
+            stages, mode = _static_plan(coll, filt, sort), "static"
+        results.append({
+            "query": name,
+            "collection": coll.name,
+            "stages": stages,
+            "mode": mode,
+            "collscan": "COLLSCAN" in stages,
+            "in_memory_sort": "SORT" in stages,
+        })
+    return results
@@ -0,0 +1,319 @@
+from __future__ import annotations
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .models import Game, User, Rating
+from .recommender import user_to_vector
+from .catalog import fetch_games_with_deadline
+from .catalog_index import get_catalog_index
+from .model_store import get_model, upsert_user
+from .jobs import retrainer
+from .result_cache import result_cache
+from .library import owned_appids, load_libraries
+from .metrics import record_stage
+
+
+class RecContext:
+    """
+    Everything the generators/scorers need to know about the requesting user,
+    computed once per recommend() call.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self.user_id = str(user.id)
+        self.owned_ids = owned_appids(user.id)
+        self.pinned = set(user.pinned_games or [])
+        self.fav = set(user.favorite_tags or [])
+        self.hate = set(user.hated_tags or [])
+        self.model = None
+        self.training = False  # no snapshot yet, the first full retrain is queued
+        self.neighbors: List[dict] = []
+
+
+class Candidates:
+    """
+    Flat, columnar candidate rows. One row per (source, appid) contribution, so the
+    scorer can work on whole arrays instead of nested loops.
+    """
+
+    def __init__(self, appids, sims=None, hours=None, ratings=None, considered: int = 0):
+        self.appids = np.asarray(appids, dtype=np.int64)
+        n = len(self.appids)
+        self.sims = np.asarray(sims if sims is not None else np.ones(n), dtype=np.float64)
+        self.hours = np.asarray(hours if hours is not None else np.zeros(n), dtype=np.float64)
+        # NaN = no rating
+        self.ratings = np.asarray(ratings if ratings is not None else np.full(n, np.nan), dtype=np.float64)
+        self.considered = considered
+
+
+TRAINING_ERROR = "The recommendation model is still training. Try again in a minute."
+
+
+# ---- candidate generators ----
+
+def _load_model(ctx: RecContext):
+    """
+    Persisted user model. If nothing is stored yet, queues the first full retrain
+    (never trains on the request path) and returns None with ctx.training set.
+    Also resolves the requesting user's vector and nearest neighbors (skipping themselves).
+    """
+    model = get_model()
+    if model is None:
+        retrainer.mark_dirty(full=True)
+        # Already there if the retrainer runs inline (RETRAIN_ASYNC=0)
+        model = get_model()
+        ctx.training = model is None
+    ctx.model = model
+    if model is None or model.n_users < 2:
+        return None
+
+    # Use the stored vector; only users missing from the snapshot get computed (and upserted)
+    vec = model.vector_for(ctx.user_id)
+    if vec is None:
+        vec = user_to_vector(ctx.user, model.vocab)
+        if any(abs(x) > 1e-9 for x in vec):
+            upsert_user(ctx.user_id, vec)
+
+    ctx.neighbors = [
+        {"user_id": uid, "distance": float(dist), "similarity": round(1 - float(dist), 3)}
+        for uid, dist in model.kneighbors(vec, k=min(5, model.n_users))
+        if uid != ctx.user_id
+    ]
+    return model
+
+
+def neighbor_library_candidates(ctx: RecContext) -> Optional[Candidates]:
+    """
+    Games from the nearest neighbors' owned libraries, with hours and the neighbor's rating.
+    """
+    if _load_model(ctx) is None:
+        return None
+
+    neighbor_ids = [n["user_id"] for n in ctx.neighbors]
+    neighbors = list(User.objects(id__in=neighbor_ids).only("steam_id", "pinned_games"))
+    by_id = {str(u.id): u for u in neighbors}
+    libraries = load_libraries([u.id for u in neighbors])
+    for n in ctx.neighbors:
+        u = by_id.get(n["user_id"])
+        n["steam_id"] = u.steam_id if (u and u.steam_id) else None
+
+    # Preload ratings for neighbors to avoid querying inside loops
+    ratings_lookup = {}  # (user_id_str, appid) -> rating_int
+    for r in Rating.objects(user_id__in=[u.id for u in neighbors]).only("user_id", "appid", "rating"):
+        ratings_lookup[(str(r.user_id), r.appid)] = r.rating
+
+    appids, sims, hours, ratings = [], [], [], []
+    for n in ctx.neighbors:
+        u = by_id.get(n["user_id"])
+        if not u:
+            continue
+        for appid, minutes in libraries[n["user_id"]].items():
+            if appid in ctx.owned_ids or appid in ctx.pinned:
+                continue
+            appids.append(appid)
+            sims.append(n["similarity"])
+            hours.append(minutes / 60.0)
+            ratings.append(ratings_lookup.get((n["user_id"], appid), np.nan))
+
+    return Candidates(appids, sims, hours, ratings, considered=len(set(appids)))
+
+
+def neighbor_pin_candidates(ctx: RecContext) -> Optional[Candidates]:
+    """
+    Games the nearest neighbors pinned (simple + demo-friendly).
+    """
+    if _load_model(ctx) is None:
+        return None
+
+    neighbor_ids = [n["user_id"] for n in ctx.neighbors]
+    neighbors = list(User.objects(id__in=neighbor_ids).only("email", "pinned_games"))
+    by_id = {str(u.id): u for u in neighbors}
+    for n in ctx.neighbors:
+        u = by_id.get(n["user_id"])
+        n["email"] = str(u.email) if u else None
+
+    appids = [
+        appid
+        for u in neighbors
+        for appid in (u.pinned_games or [])
+        if appid not in ctx.owned_ids and appid not in ctx.pinned
+    ]
+    return Candidates(appids, considered=len(set(appids)))
+
+
+# ---- scorers ----
+
+def similarity_hours_scorer(c: Candidates) -> np.ndarray:
+    """
+    Similarity-weighted hours (capped so one game doesn't dominate), adjusted by the
+    neighbor's rating when there is one: rating 1..10 -> multiplier 0.68..1.4.
+    """
+    contrib = c.sims * np.minimum(c.hours, 100)
+    factor = np.where(np.isnan(c.ratings), 1.0, 0.6 + np.nan_to_num(c.ratings) / 12.5)
+    return contrib * factor
+
+
+def vote_scorer(c: Candidates) -> np.ndarray:
+    return np.ones(len(c.appids))
+
+
+def _aggregate(appids: np.ndarray, contrib: np.ndarray, k: int):
+    """
+    Sum contributions per appid in one pass and return the top k (appid, score) pairs.
+    Ties keep the order candidates were first seen in.
+    """
+    if len(appids) == 0:
+        return []
+    uniq, first, inverse = np.unique(appids, return_index=True, return_inverse=True)
+    totals = np.bincount(inverse, weights=contrib, minlength=len(uniq))
+    order = np.lexsort((first, -totals))[:k]
+    return [(int(uniq[i]), float(totals[i])) for i in order]
+
+
+# ---- service ----
+
+class Strategy:
+    def __init__(self, generate: Callable, score: Callable, score_field: str = "score",
+                 fetch_missing: bool = False, keep_missing: bool = False):
+        self.generate = generate
+        self.score = score
+        self.score_field = score_field
+        # fetch_missing: look up unknown appids on the Store API
+        # keep_missing: still show appids we couldn't find (as "AppID 123")
+        self.fetch_missing = fetch_missing
+        self.keep_missing = keep_missing
+
+
+class RecommendationService:
+    """
+    One place for every recommender the routes expose. A strategy is a candidate
+    generator plus a batched scorer; the tag strategy scores the whole catalog index.
+    """
+
+    def __init__(self, strategies: Optional[Dict[str, Strategy]] = None):
+        self.strategies = strategies if strategies is not None else {
+            "knn_library": Strategy(neighbor_library_candidates, similarity_hours_scorer,
+                                    fetch_missing=True, keep_missing=True),
+            "knn_pins": Strategy(neighbor_pin_candidates, vote_scorer, score_field="neighbor_votes"),
+        }
+
+    def model_version(self, strategy: str) -> Optional[str]:
+        """
+        Version of the data a strategy's results depend on (for caching results per user).
+        """
+        if strategy == "tags":
+            return f"catalog-{get_catalog_index().version}"
+        model = get_model()
+        # Single-user upserts count as a new version too
+        return f"{model.version}+{model.deltas_offset}" if model else None
+
+    def recommend(self, user, strategy: str = "tags", k: int = 10, use_cache: bool = True) -> dict:
+        """
+        Returns {"recommendations", "neighbors", "considered", "error", "timings"};
+        "training" is set when the KNN strategies have no model yet (the first one is queued).
+        Cached per (user, strategy) until the model version or the user's data_version changes.
+        """
+        version = None
+        if use_cache:
+            model_version = self.model_version(strategy)
+            if model_version is not None:
+                version = f"{model_version}|{user.data_version or 0}|k{k}"
+                cached = result_cache.get(str(user.id), strategy, version)
+                if cached is not None:
+                    return cached
+
+        result = self._recommend(user, strategy, k)
+        for name, seconds in result["timings"].items():
+            record_stage(f"{strategy}.{name}", seconds)
+        # Don't cache placeholders for games still being fetched in the background
+        if version is not None and not result["error"] and not result.get("pending"):
+            result_cache.put(str(user.id), strategy, version, result)
+        return result
+
+    def _recommend(self, user, strategy: str, k: int) -> dict:
+        timings = {}
+        t0 = time.perf_counter()
+        ctx = RecContext(user)
+
+        if strategy == "tags":
+            index = get_catalog_index()
+            recs = index.top_k(ctx.fav, ctx.hate, exclude=ctx.owned_ids, k=k)
+            timings["score"] = time.perf_counter() - t0
+            return {
+                "recommendations": recs,
+                "neighbors": [],
+                "considered": len(index) - len(ctx.owned_ids & index.pos_of.keys()),
+                "error": None,
+                "timings": timings,
+            }
+
+        s = self.strategies[strategy]
+        candidates = s.generate(ctx)
+        timings["candidates"] = time.perf_counter() - t0
+        if candidates is None:
+            return {
+                "recommendations": [],
+                "neighbors": [],
+                "considered": 0,
+                "error": TRAINING_ERROR if ctx.training else "Need at least 2 users with preference data to run KNN.",
+                "training": ctx.training,
+                "users_trained": ctx.model.n_users if ctx.model else 0,
+                "timings": timings,
+            }
+
+        t = time.perf_counter()
+        top = _aggregate(candidates.appids, s.score(candidates), k)
+        timings["score"] = time.perf_counter() - t
+
+        t = time.perf_counter()
+        recs, pending = self._hydrate(top, s)
+        timings["hydrate"] = time.perf_counter() - t
+
+        return {
+            "recommendations": recs,
+            "neighbors": ctx.neighbors,
+            "considered": candidates.considered,
+            "error": None,
+            "pending": pending,
+            "timings": timings,
+        }
+
+    def _hydrate(self, top, s: Strategy) -> Tuple[List[dict], List[int]]:
+        """
+        Attach game details to the top (appid, score) pairs. Returns (recs, pending appids).
+        One bulk lookup for known games; unknown ones are fetched concurrently under a deadline
+        (see catalog.fetch_games_with_deadline) and rendered as placeholders if they're late.
+        """
+        rec_ids = [appid for appid, _ in top]
+        by_game = {
+            g.appid: {"name": g.name, "tags": g.tags, "global_rating": g.global_rating}
+            for g in Game.objects(appid__in=rec_ids).only("appid", "name", "tags", "global_rating")
+        }
+
+        pending = []
+        if s.fetch_missing:
+            missing = [appid for appid in rec_ids if appid not in by_game]
+            if missing:
+                fetched, pending = fetch_games_with_deadline(missing)
+                for appid, d in fetched.items():
+                    by_game[appid] = {"name": d["name"], "tags": d.get("tags", []), "global_rating": 0.0}
+
+        recs = []
+        for appid, score in top:
+            g = by_game.get(appid)
+            if g is None and not s.keep_missing:
+                continue
+            recs.append({
+                "appid": appid,
+                "name": g["name"] if g else f"AppID {appid}",
+                "tags": g["tags"] if g else [],
+                "global_rating": g["global_rating"] if g else 0.0,
+                s.score_field: round(score, 2) if s.score_field == "score" else int(score),
+            })
+        return recs, pending
+
+
+recommendation_service = RecommendationService()
@@ -1,13 +1,25 @@
 from __future__ import annotations
-from collections import defaultdict
-from typing import List, Tuple
-from .models import Game, User, Rating
+import os
+from typing import Iterable, List, Tuple
+import numpy as np
+from scipy import sparse
+from .models import Game, User, Rating, OwnedGame
+from .library import load_libraries
+from .user_context import request_memo
+from .metrics import timed
 
+# Documents per round trip for the raw training cursors
+EXTRACT_BATCH = int(os.getenv("EXTRACT_BATCH", "10000"))
+# Users vectorized per chunk by a full retrain (bounds the dense chunk: users x tags float32)
+TRAIN_CHUNK_USERS = int(os.getenv("TRAIN_CHUNK_USERS", "10000"))
 
+
+@timed("vocab")
 def build_tag_vocab() -> List[str]:
     """
     Build a stable tag vocabulary from your Games collection.
     Keep it deterministic so user vectors line up across users.
+    Full scan; request paths and training use the cached vocab.get_vocab() instead.
     """
     tags = set()
     for g in Game.objects.only("tags"):
@@ -16,7 +28,115 @@ def build_tag_vocab() -> List[str]:
     return sorted(tags)
 
 
-def user_to_vector(user: User, vocab: List[str]) -> List[float]:
+def game_weight(minutes: float, rating: int = None) -> float:
+    """
+    How strongly one owned game pulls on its tags in a user vector.
+    """
+    if rating is not None:
+        # Rating overrides hours: 1..10 -> -1.0..+1.0, as a strong signal
+        return 3.0 * (rating - 5.5) / 4.5
+    # Otherwise use hours as a weak signal
+    return 0.1 * (minutes / 60.0)
+
+
+def game_weights(minutes: np.ndarray, ratings: np.ndarray) -> np.ndarray:
+    """
+    game_weight() over whole arrays; NaN rating = not rated.
+    """
+    return np.where(np.isnan(ratings), 0.1 * (minutes / 60.0), 3.0 * (ratings - 5.5) / 4.5)
+
+
+def _tag_index(vocab) -> dict:
+    """
+    tag -> column. A Vocabulary carries it; a plain list (e.g. a stored model's vocab) doesn't.
+    """
+    columns = getattr(vocab, "columns", None)
+    return columns if columns is not None else {t: i for i, t in enumerate(vocab)}
+
+
+@timed("vectorize")
+def build_user_matrix(users: Iterable[User], vocab: List[str], libraries: List[dict] = None) -> np.ndarray:
+    """
+    Vectorized user_to_vector for a batch of users. Returns a float32 (users x tags) array.
+    libraries: optional {appid: minutes} per user; loaded from owned_games in one query if omitted.
+
+    Same vector definition, but all games and ratings are pulled in two bulk queries:
+      - game tags become a sparse (games x tags) 0/1 matrix G
+      - rating/playtime weights become a sparse (users x games) matrix W
+      - owned-game contribution is then just W @ G, plus +3 / -5 for favorite / hated tags
+    """
+    users = list(users)
+    idx = _tag_index(vocab)
+    n_users, n_tags = len(users), len(vocab)
+    X = np.zeros((n_users, n_tags), dtype=np.float32)
+    if n_users == 0 or n_tags == 0:
+        return X
+
+    # Favorite / hated tags
+    for row, u in enumerate(users):
+        for t in set(u.favorite_tags or []):
+            if t in idx:
+                X[row, idx[t]] += 3.0
+        for t in set(u.hated_tags or []):
+            if t in idx:
+                X[row, idx[t]] -= 5.0
+
+    # appid -> minutes played, per user
+    if libraries is None:
+        by_user = load_libraries([u.id for u in users if u.id is not None])
+        libraries = [by_user.get(str(u.id), {}) if u.id is not None else {} for u in users]
+    owned = libraries
+    all_appids = set()
+    for o in owned:
+        all_appids.update(o.keys())
+    if not all_appids:
+        return X
+
+    # Sparse game x tag matrix (only games we actually have tags for); a tag listed twice
+    # still counts once, same as game_tag_matrix() in the full retrain
+    game_row = {}
+    g_rows, g_cols = [], []
+    for game in Game.objects(appid__in=list(all_appids)).only("appid", "tags"):
+        r = game_row.setdefault(game.appid, len(game_row))
+        for t in set(game.tags or []):
+            if t in idx:
+                g_rows.append(r)
+                g_cols.append(idx[t])
+    if not game_row:
+        return X
+    G = sparse.csr_matrix(
+        (np.ones(len(g_rows), dtype=np.float32), (g_rows, g_cols)),
+        shape=(len(game_row), n_tags),
+    )
+
+    # Manual ratings (only count for owned games, same as before)
+    user_ids = [u.id for u in users if u.id is not None]
+    ratings = {}
+    if user_ids:
+        for r in Rating.objects(user_id__in=user_ids).only("user_id", "appid", "rating"):
+            ratings[(r.user_id, r.appid)] = r.rating
+
+    # Sparse user x game weight matrix
+    w_rows, w_cols, w_vals = [], [], []
+    for row, (u, o) in enumerate(zip(users, owned)):
+        for appid, minutes in o.items():
+            col = game_row.get(appid)
+            if col is None:
+                continue
+            rating = ratings.get((u.id, appid)) if u.id is not None else None
+            w_rows.append(row)
+            w_cols.append(col)
+            w_vals.append(game_weight(minutes, rating))
+    W = sparse.csr_matrix(
+        (np.asarray(w_vals, dtype=np.float32), (w_rows, w_cols)),
+        shape=(n_users, len(game_row)),
+    )
+
+    X += (W @ G).toarray().astype(np.float32)
+    return X
+
+
+def user_to_vector(user: User, vocab: List[str], library: dict = None) -> List[float]:
     """
     Vector definition:
       - Start with zeros for each tag in vocab.
@@ -24,66 +144,207 @@ def user_to_vector(user: User, vocab: List[str]) -> List[float]:
       - Add -5 for each hated tag
       - Add playtime contribution from owned games *if* we have tags for those appids in Games collection
     """
-    idx = {t: i for i, t in enumerate(vocab)}
-    v = [0.0] * len(vocab)
+    if library is not None or user.id is None:
+        return build_user_matrix([user], vocab, None if library is None else [library])[0].tolist()
+    # Same user, same data, same vocab -> same vector for the rest of the request
+    vocab_id = ("v", vocab.version, len(vocab)) if hasattr(vocab, "version") else hash(tuple(vocab))
+    key = ("vector", str(user.id), user.data_version or 0, vocab_id)
+    return request_memo(key, lambda: build_user_matrix([user], vocab)[0].tolist())
 
-    fav = set(user.favorite_tags or [])
-    hate = set(user.hated_tags or [])
 
-    for t in fav:
-        if t in idx:
-            v[idx[t]] += 3.0
+def game_tag_matrix(vocab: List[str]) -> Tuple[np.ndarray, sparse.csr_matrix]:
+    """
+    (sorted appids, CSR games x tags 0/1 matrix in the same row order) for the whole catalog,
+    read with one projected raw cursor.
+    """
+    idx = _tag_index(vocab)
+    appids, indptr, cols = [], [0], []
+    cursor = Game._get_collection().find({}, {"_id": 0, "appid": 1, "tags": 1}).sort("appid", 1)
+    for d in cursor.batch_size(EXTRACT_BATCH):
+        appids.append(d["appid"])
+        cols.extend(idx[t] for t in set(d.get("tags") or []) if t in idx)
+        indptr.append(len(cols))
+    G = sparse.csr_matrix(
+        (np.ones(len(cols), dtype=np.float32), np.asarray(cols, dtype=np.int32), np.asarray(indptr, dtype=np.int64)),
+        shape=(len(appids), len(vocab)),
+    )
+    return np.asarray(appids, dtype=np.int64), G
 
-    for t in hate:
-        if t in idx:
-            v[idx[t]] -= 5.0
 
-    # optional: use owned playtime to strengthen signals (only works where appid exists in Games collection)
-    owned = user.owned_games or []
-    owned_by_appid = {g.get("appid"): g for g in owned if g.get("appid") is not None}
-    owned_appids = list(owned_by_appid.keys())
+def _pair_keys(users: np.ndarray, appids: np.ndarray) -> np.ndarray:
+    # appids fit in 32 bits, so (user row, appid) packs into one sortable int64
+    return (users.astype(np.int64) << 32) | appids.astype(np.int64)
 
-    # Pull manual ratings for this user (appid -> rating 1..10)
-    ratings = {
-        r.appid: r.rating
-        for r in Rating.objects(user_id=user.id, appid__in=owned_appids).only("appid", "rating")
+
+def extract_training_columns(vocab: List[str], users_filter: dict = None, catalog=None) -> dict:
+    """
+    Everything build_user_matrix needs for a full training set, as flat columns:
+      {"user_ids": [ObjectId], "user": int32[], "tag": int32[], "weight": float32[]}
+    One entry per (user, tag) contribution (duplicates sum), so the matrix is just
+    coo_matrix((weight, (user, tag))). Same vector definition as build_user_matrix,
+    but read with raw projected cursors (no Document objects) and combined with array ops:
+      - owned rows are matched to catalog rows with searchsorted, ratings by packed (user, appid) keys
+      - each owned row is expanded over its game's tags straight from the CSR index arrays
+    users_filter restricts the users (and their libraries / ratings) to a subset;
+    catalog is a game_tag_matrix() result to reuse across calls.
+    """
+    idx = _tag_index(vocab)
+    uf = users_filter or {}
+    of = {"user_id": uf["_id"]} if "_id" in uf else {}
+
+    # Users and their favorite / hated tags
+    user_ids, row_of = [], {}
+    prefs = []  # (user row, tag column, weight)
+    cursor = User._get_collection().find(uf, {"favorite_tags": 1, "hated_tags": 1})
+    for d in cursor.batch_size(EXTRACT_BATCH):
+        row = row_of[d["_id"]] = len(user_ids)
+        user_ids.append(d["_id"])
+        prefs += [(row, idx[t], 3.0) for t in set(d.get("favorite_tags") or []) if t in idx]
+        prefs += [(row, idx[t], -5.0) for t in set(d.get("hated_tags") or []) if t in idx]
+
+    prefs = np.asarray(prefs, dtype=np.float64).reshape(-1, 3)
+    out = {
+        "user_ids": user_ids,
+        "user": prefs[:, 0].astype(np.int32),
+        "tag": prefs[:, 1].astype(np.int32),
+        "weight": prefs[:, 2].astype(np.float32),
     }
+    if not user_ids or not vocab:
+        return out
+
+    # Owned games (rows of users outside the set are dropped)
+    o_user, o_appid, o_min = [], [], []
+    cursor = OwnedGame._get_collection().find(of, {"_id": 0, "user_id": 1, "appid": 1, "playtime_forever": 1})
+    for d in cursor.batch_size(EXTRACT_BATCH):
+        row = row_of.get(d["user_id"])
+        if row is not None:
+            o_user.append(row)
+            o_appid.append(d["appid"])
+            o_min.append(d.get("playtime_forever", 0) or 0)
+    o_user = np.asarray(o_user, dtype=np.int64)
+    o_appid = np.asarray(o_appid, dtype=np.int64)
+    o_min = np.asarray(o_min, dtype=np.float64)
+
+    # Only games we have in the catalog count
+    appids, G = catalog if catalog is not None else game_tag_matrix(vocab)
+    g_row = np.searchsorted(appids, o_appid)
+    known = g_row < len(appids)
+    known[known] = appids[g_row[known]] == o_appid[known]
+    o_user, o_appid, o_min, g_row = o_user[known], o_appid[known], o_min[known], g_row[known]
+
+    # Ratings override hours (only for owned games, like build_user_matrix)
+    r_key, r_val = [], []
+    cursor = Rating._get_collection().find(of, {"_id": 0, "user_id": 1, "appid": 1, "rating": 1})
+    for d in cursor.batch_size(EXTRACT_BATCH):
+        row = row_of.get(d["user_id"])
+        if row is not None:
+            r_key.append((row << 32) | d["appid"])
+            r_val.append(d["rating"])
+    ratings = np.full(len(o_user), np.nan)
+    if r_key:
+        r_key = np.asarray(r_key, dtype=np.int64)
+        r_val = np.asarray(r_val, dtype=np.float64)
+        order = np.argsort(r_key)
+        r_key, r_val = r_key[order], r_val[order]
+        keys = _pair_keys(o_user, o_appid)
+        pos = np.minimum(np.searchsorted(r_key, keys), len(r_key) - 1)
+        hit = r_key[pos] == keys
+        ratings[hit] = r_val[pos[hit]]
+    weights = game_weights(o_min, ratings)
+
+    # Expand every owned row over its game's tags
+    starts = G.indptr[g_row]
+    counts = G.indptr[g_row + 1] - starts
+    total = int(counts.sum())
+    offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+    out["user"] = np.concatenate([out["user"], np.repeat(o_user, counts).astype(np.int32)])
+    out["tag"] = np.concatenate([out["tag"], G.indices[np.repeat(starts, counts) + offsets].astype(np.int32)])
+    out["weight"] = np.concatenate([out["weight"], np.repeat(weights, counts).astype(np.float32)])
+    return out
+
+
+def columns_to_matrix(columns: dict, n_tags: int) -> np.ndarray:
+    """
+    Dense float32 (users x tags) matrix from extract_training_columns() output.
+    """
+    n_users = len(columns["user_ids"])
+    X = sparse.coo_matrix(
+        (columns["weight"].astype(np.float64), (columns["user"], columns["tag"])),
+        shape=(n_users, n_tags),
+    ).toarray()
+    return X.astype(np.float32)
+
+
+def _drop_empty(columns: dict, X: np.ndarray) -> Tuple[List[str], np.ndarray]:
+    # skip all-zero vectors
+    keep = np.abs(X).max(axis=1) > 1e-9 if X.shape[1] else np.zeros(len(X), dtype=bool)
+    return [str(u) for u, k in zip(columns["user_ids"], keep) if k], X[keep]
+
 
-    if owned_appids:
-        games = Game.objects(appid__in=owned_appids).only("appid", "tags")
-        for game in games:
-            tags = game.tags or []
-
-            if game.appid in ratings:
-                # Rating overrides hours:
-                # Convert rating 1..10 into a centered weight (-1.0 .. +1.0)
-                # 1 -> -1.0, 5/6 -> around 0, 10 -> +1.0
-                w = (ratings[game.appid] - 5.5) / 4.5
-                # Make ratings a strong signal
-                for t in tags:
-                    if t in idx:
-                        v[idx[t]] += 3.0 * w
-            else:
-                # Otherwise use hours as a weak signal
-                minutes = owned_by_appid.get(game.appid, {}).get("playtime_forever", 0) or 0
-                hours = minutes / 60.0
-                for t in tags:
-                    if t in idx:
-                        v[idx[t]] += 0.1 * hours
-
-    return v
-
-
-def build_training_data(vocab: List[str]) -> Tuple[List[str], List[List[float]]]:
+def iter_training_chunks(vocab: List[str], chunk_users: int = TRAIN_CHUNK_USERS):
+    """
+    Yields (user_ids, vectors) for consecutive _id ranges of chunk_users users, users
+    without signal dropped. Only one chunk's matrix exists at a time; the catalog index
+    is built once and shared by every chunk.
+    """
+    catalog = game_tag_matrix(vocab)
+    coll = User._get_collection()
+    last = None
+    while True:
+        page = coll.find({"_id": {"$gt": last}} if last is not None else {}, {"_id": 1})
+        ids = [d["_id"] for d in page.sort("_id", 1).limit(chunk_users)]
+        if not ids:
+            return
+        last = ids[-1]
+        columns = extract_training_columns(vocab, {"_id": {"$gte": ids[0], "$lte": last}}, catalog)
+        yield _drop_empty(columns, columns_to_matrix(columns, len(vocab)))
+
+
+@timed("training_data")
+def build_training_data(vocab: List[str]) -> Tuple[List[str], np.ndarray]:
     """
     Returns (user_ids, vectors) for users that have at least some signal.
     """
-    user_ids = []
-    vectors = []
-    for u in User.objects.only("favorite_tags", "hated_tags", "owned_games"):
-        vec = user_to_vector(u, vocab)
-        # skip all-zero vectors
-        if any(abs(x) > 1e-9 for x in vec):
-            user_ids.append(str(u.id))
-            vectors.append(vec)
-    return user_ids, vectors
+    columns = extract_training_columns(vocab)
+    return _drop_empty(columns, columns_to_matrix(columns, len(vocab)))
+
+
+def load_interactions():
+    """
+    Columnar dump of every user's library and ratings, for the collaborative models.
+    Returns (user_ids, owned, ratings) where
+      - user_ids: list of user id strings (row index = position)
+      - owned:    dict of arrays {"user": int, "appid": int, "minutes": float}
+      - ratings:  dict of arrays {"user": int, "appid": int, "rating": float}
+    Raw projected cursors, no Document objects.
+    """
+    user_row = {}
+    for d in User._get_collection().find({}, {"_id": 1}).batch_size(EXTRACT_BATCH):
+        user_row.setdefault(d["_id"], len(user_row))
+
+    o_user, o_appid, o_minutes = [], [], []
+    cursor = OwnedGame._get_collection().find({}, {"_id": 0, "user_id": 1, "appid": 1, "playtime_forever": 1})
+    for d in cursor.batch_size(EXTRACT_BATCH):
+        o_user.append(user_row.setdefault(d["user_id"], len(user_row)))
+        o_appid.append(d["appid"])
+        o_minutes.append(d.get("playtime_forever", 0) or 0)
+
+    r_user, r_appid, r_rating = [], [], []
+    cursor = Rating._get_collection().find({}, {"_id": 0, "user_id": 1, "appid": 1, "rating": 1})
+    for d in cursor.batch_size(EXTRACT_BATCH):
+        r_user.append(user_row.setdefault(d["user_id"], len(user_row)))
+        r_appid.append(d["appid"])
+        r_rating.append(d["rating"])
+
+    user_ids = [str(u) for u in user_row]
+    owned = {
+        "user": np.asarray(o_user, dtype=np.int64),
+        "appid": np.asarray(o_appid, dtype=np.int64),
+        "minutes": np.asarray(o_minutes, dtype=np.float64),
+    }
+    ratings = {
+        "user": np.asarray(r_user, dtype=np.int64),
+        "appid": np.asarray(r_appid, dtype=np.int64),
+        "rating": np.asarray(r_rating, dtype=np.float64),
+    }
+    return user_ids, owned, ratings
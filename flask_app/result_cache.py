@@ -0,0 +1,87 @@
+from __future__ import annotations
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Optional
+
+from .models import CachedRecommendation
+from .metrics import register_cache
+
+log = logging.getLogger(__name__)
+
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "2048"))
+# Upper bound on staleness from *other* users' changes (your own changes bump the version)
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", "300"))
+# Also keep results in Mongo so other workers / restarts can reuse them
+RESULT_CACHE_PERSIST = os.getenv("RESULT_CACHE_PERSIST", "0") == "1"
+
+
+class ResultCache:
+    """
+    Per-user recommendation results keyed by (user_id, strategy).
+    An entry is only served if its version string still matches, so bumping the
+    model version or the user's data_version invalidates it without any explicit delete.
+    """
+
+    def __init__(self, maxsize: int = RESULT_CACHE_SIZE, ttl: float = RESULT_CACHE_TTL, persist: bool = RESULT_CACHE_PERSIST):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.persist = persist
+        self.data = OrderedDict()  # (user_id, strategy) -> (version, expires_monotonic, result)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id: str, strategy: str, version: str) -> Optional[dict]:
+        key = (user_id, strategy)
+        with self.lock:
+            entry = self.data.get(key)
+            if entry and entry[0] == version and entry[1] > time.monotonic():
+                self.data.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+
+        if self.persist:
+            doc = CachedRecommendation.objects(
+                user_id=user_id, strategy=strategy, version=version, expires_at__gt=datetime.utcnow()
+            ).first()
+            if doc:
+                self._put_local(key, version, doc.result)
+                with self.lock:
+                    self.hits += 1
+                return doc.result
+
+        with self.lock:
+            self.misses += 1
+        return None
+
+    def put(self, user_id: str, strategy: str, version: str, result: dict) -> None:
+        self._put_local((user_id, strategy), version, result)
+        if self.persist:
+            try:
+                CachedRecommendation.objects(user_id=user_id, strategy=strategy).update_one(
+                    upsert=True,
+                    set__version=version,
+                    set__result=result,
+                    set__expires_at=datetime.utcnow() + timedelta(seconds=self.ttl),
+                )
+            except Exception:
+                log.warning("could not persist recommendation cache entry", exc_info=True)
+
+    def _put_local(self, key, version: str, result: dict) -> None:
+        with self.lock:
+            self.data[key] = (version, time.monotonic() + self.ttl, result)
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"size": len(self.data), "hits": self.hits, "misses": self.misses}
+
+
+result_cache = ResultCache()
+register_cache("recommendations", result_cache.stats)
@@ -1,7 +1,10 @@
+import json
 import os
 import re
 import requests
 
+from .metrics import external_call
+
 STEAM_API_BASE = "https://api.steampowered.com"
 
 def _get_key() -> str:
@@ -10,6 +13,35 @@ def _get_key() -> str:
         raise RuntimeError("STEAM_API_KEY is not set in .env")
     return key
 
+# Offline mode: point STEAM_API_FIXTURES at a folder of recorded responses
+# (<endpoint>_<key>.json) and they are replayed instead of calling Steam.
+# With STEAM_API_RECORD=1 as well, real responses are fetched and saved there.
+def _fixture_path(endpoint: str, key: str):
+    folder = os.getenv("STEAM_API_FIXTURES")
+    if not folder:
+        return None
+    return os.path.join(folder, f"{endpoint}_{re.sub(r'[^A-Za-z0-9_.-]', '_', key)}.json")
+
+def _get_json(endpoint: str, path: str, params: dict, key: str) -> dict:
+    fixture = _fixture_path(endpoint, key)
+    if fixture and os.getenv("STEAM_API_RECORD") != "1":
+        if not os.path.exists(fixture):
+            raise FileNotFoundError(f"No recorded Steam API response at {fixture}")
+        with open(fixture) as f:
+            return json.load(f)
+
+    params = dict(params, key=_get_key())
+    with external_call("steam_web", endpoint):
+        r = requests.get(f"{STEAM_API_BASE}{path}", params=params, timeout=15)
+        r.raise_for_status()
+        data = r.json()
+
+    if fixture:
+        os.makedirs(os.path.dirname(fixture), exist_ok=True)
+        with open(fixture, "w") as f:
+            json.dump(data, f, indent=1)
+    return data
+
 def resolve_to_steamid64(user_input: str) -> str:
     """
     Accepts:
@@ -33,11 +65,7 @@ def resolve_to_steamid64(user_input: str) -> str:
         return s
 
     # Otherwise assume vanity and resolve
-    url = f"{STEAM_API_BASE}/ISteamUser/ResolveVanityURL/v1/"
-    params = {"key": _get_key(), "vanityurl": s}
-    r = requests.get(url, params=params, timeout=15)
-    r.raise_for_status()
-    data = r.json().get("response", {})
+    data = _get_json("ResolveVanityURL", "/ISteamUser/ResolveVanityURL/v1/", {"vanityurl": s}, s).get("response", {})
 
     # success = 1 means resolved
     if data.get("success") == 1 and data.get("steamid"):
@@ -46,13 +74,10 @@ def resolve_to_steamid64(user_input: str) -> str:
     raise ValueError("Could not resolve that Steam ID / vanity URL. Try your full profile link or SteamID64.")
 
 def get_owned_games(steamid64: str) -> list[dict]:
-    url = f"{STEAM_API_BASE}/IPlayerService/GetOwnedGames/v1/"
     params = {
-        "key": _get_key(),
         "steamid": steamid64,
         "include_appinfo": 1,
         "include_played_free_games": 1,
     }
-    r = requests.get(url, params=params, timeout=15)
-    r.raise_for_status()
-    return r.json().get("response", {}).get("games", [])
+    data = _get_json("GetOwnedGames", "/IPlayerService/GetOwnedGames/v1/", params, steamid64)
+    return data.get("response", {}).get("games", [])
@@ -1,18 +1,243 @@
+import logging
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
 import requests
+from pymongo import UpdateOne
+from requests.adapters import HTTPAdapter
+
+from .metrics import external_call, register_cache, timed
+from .models import AppDetailsCache
+from .tags import normalize_tags
+
+log = logging.getLogger(__name__)
+
+# Override the base to point at a local stub server when testing
+STEAM_STORE_API_BASE = os.getenv("STEAM_STORE_API_BASE", "https://store.steampowered.com/api")
+STEAM_STORE_APPDETAILS = f"{STEAM_STORE_API_BASE}/appdetails"
+
+MAX_WORKERS = int(os.getenv("STEAM_STORE_MAX_WORKERS", "8"))
+RATE_PER_SEC = float(os.getenv("STEAM_STORE_RATE", "4"))
+BURST = int(os.getenv("STEAM_STORE_BURST", "10"))
+MAX_RETRIES = int(os.getenv("STEAM_STORE_RETRIES", "3"))
+
+# Cache TTLs (seconds) for found apps and for misses (success: false)
+CACHE_TTL = int(os.getenv("STEAM_STORE_CACHE_TTL", str(7 * 24 * 3600)))
+NEGATIVE_CACHE_TTL = int(os.getenv("STEAM_STORE_NEGATIVE_CACHE_TTL", str(24 * 3600)))
+LRU_SIZE = int(os.getenv("STEAM_STORE_LRU_SIZE", "4096"))
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket shared by every Store API call in this worker.
+    pause() blocks all callers, e.g. after a 429 with Retry-After.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    wait = self.blocked_until - now
+                else:
+                    self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds: float) -> None:
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+_bucket = TokenBucket(RATE_PER_SEC, BURST)
+
+# One pooled session so connections (and TLS handshakes) get reused across calls
+_session = requests.Session()
+_session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=MAX_WORKERS))
+_session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=MAX_WORKERS))
+
+
+def _get_with_retry(url: str, params: dict) -> requests.Response:
+    """
+    Rate-limited GET with exponential backoff on 429 / 5xx / connection errors.
+    """
+    for attempt in range(MAX_RETRIES + 1):
+        _bucket.acquire()
+        try:
+            with external_call("steam_store", "appdetails"):
+                r = _session.get(url, params=params, timeout=15)
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt == MAX_RETRIES:
+                raise
+            time.sleep((2 ** attempt) + random.random())
+            continue
+
+        if r.status_code == 429 or r.status_code >= 500:
+            if attempt == MAX_RETRIES:
+                r.raise_for_status()
+            retry_after = r.headers.get("Retry-After")
+            delay = float(retry_after) if retry_after and retry_after.isdigit() else (2 ** attempt) + random.random()
+            if r.status_code == 429:
+                # Throttled: slow down every worker, not just this one
+                _bucket.pause(delay)
+            time.sleep(delay)
+            continue
+
+        r.raise_for_status()
+        return r
+
+
+class _LRUCache:
+    """
+    Small in-process LRU with per-entry expiry. Values may be None (negative entries).
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.data = OrderedDict()  # appid -> (expires_monotonic, value)
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Returns (hit, value).
+        """
+        with self.lock:
+            entry = self.data.get(key)
+            if entry is None:
+                return False, None
+            if entry[0] < time.monotonic():
+                del self.data[key]
+                return False, None
+            self.data.move_to_end(key)
+            return True, entry[1]
+
+    def put(self, key, value, ttl: float) -> None:
+        with self.lock:
+            self.data[key] = (time.monotonic() + ttl, value)
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.data.clear()
+
+
+_lru = _LRUCache(LRU_SIZE)
+
+_stats_lock = threading.Lock()
+_stats = {"lru_hits": 0, "db_hits": 0, "misses": 0, "negative_hits": 0}
+
+
+def _count(key: str, n: int = 1) -> None:
+    with _stats_lock:
+        _stats[key] += n
 
-STEAM_STORE_APPDETAILS = "https://store.steampowered.com/api/appdetails"
 
+def cache_stats() -> dict:
+    with _stats_lock:
+        return dict(_stats, size=len(_lru.data))
+
+
+register_cache("steam_store", cache_stats)
+
+
+def _ttl_for(details) -> int:
+    return CACHE_TTL if details else NEGATIVE_CACHE_TTL
+
+
+def _lru_lookup(appid: int):
+    hit, value = _lru.get(appid)
+    if hit:
+        _count("lru_hits")
+        if value is None:
+            _count("negative_hits")
+    return hit, value
+
+
+def _db_lookup(appids) -> dict:
+    """
+    Persistent tier: {appid: details or None} for unexpired entries. Promotes hits into the LRU.
+    """
+    found = {}
+    now = datetime.utcnow()
+    for c in AppDetailsCache.objects(appid__in=list(appids), expires_at__gt=now):
+        details = {"appid": c.appid, "name": c.name, "tags": list(c.tags or [])} if c.found else None
+        found[c.appid] = details
+        _lru.put(c.appid, details, min(_ttl_for(details), (c.expires_at - now).total_seconds()))
+    _count("db_hits", len(found))
+    _count("negative_hits", sum(1 for d in found.values() if d is None))
+    return found
+
+
+def _remember(results: dict) -> None:
+    """
+    Store fresh lookups ({appid: details or None}) in both tiers.
+    """
+    if not results:
+        return
+    now = datetime.utcnow()
+    ops = []
+    for appid, details in results.items():
+        ttl = _ttl_for(details)
+        _lru.put(appid, details, ttl)
+        ops.append(UpdateOne(
+            {"appid": appid},
+            {"$set": {
+                "found": details is not None,
+                "name": details["name"] if details else None,
+                "tags": details["tags"] if details else [],
+                "expires_at": now + timedelta(seconds=ttl),
+            }},
+            upsert=True,
+        ))
+    try:
+        AppDetailsCache._get_collection().bulk_write(ops, ordered=False)
+    except Exception:
+        # The cache is best-effort; never fail a lookup because of it
+        log.warning("could not persist appdetails cache", exc_info=True)
+
+
+@timed("fetch_app_details")
 def fetch_app_details(appid: int) -> dict | None:
     """
     Returns a dict with name + genre strings (as tags), or None if not available.
-    Uses Steam Store appdetails endpoint.
-    """
-    r = requests.get(
-        STEAM_STORE_APPDETAILS,
-        params={"appids": appid},
-        timeout=15
-    )
-    r.raise_for_status()
+    Served from the cache when possible (including known misses); otherwise uses
+    the Steam Store appdetails endpoint and caches the answer.
+    """
+    hit, value = _lru_lookup(appid)
+    if hit:
+        return value
+
+    cached = _db_lookup([appid])
+    if appid in cached:
+        return cached[appid]
+
+    _count("misses")
+    details = _fetch_app_details_uncached(appid)
+    _remember({appid: details})
+    return details
+
+
+def _fetch_app_details_uncached(appid: int) -> dict | None:
+    r = _get_with_retry(STEAM_STORE_APPDETAILS, {"appids": appid})
     data = r.json().get(str(appid), {})
     if not data.get("success"):
         return None
@@ -20,9 +245,59 @@ def fetch_app_details(appid: int) -> dict | None:
     app = data.get("data", {})
     name = app.get("name")
     genres = app.get("genres", []) or []
-    tags = [g.get("description") for g in genres if g.get("description")]
+    tags = normalize_tags(g.get("description") for g in genres if g.get("description"))
 
     if not name:
         return None
 
     return {"appid": appid, "name": name, "tags": tags}
+
+
+def lookup_cached(appids):
+    """
+    Cache-only lookup (LRU, then Mongo) for many appids.
+    Returns ({appid: details or None} for known appids, [appids not in either tier]).
+    """
+    appids = list(dict.fromkeys(appids))
+    results = {}
+
+    todo = []
+    for appid in appids:
+        hit, value = _lru_lookup(appid)
+        if hit:
+            results[appid] = value
+        else:
+            todo.append(appid)
+
+    if todo:
+        results.update(_db_lookup(todo))
+        todo = [a for a in todo if a not in results]
+    return results, todo
+
+
+def fetch_many_app_details(appids, max_workers: int = MAX_WORKERS) -> dict:
+    """
+    Concurrent fetch_app_details for many appids (bounded by max_workers and the rate limiter).
+    Returns {appid: details or None}; appids that errored out map to None (and aren't cached).
+    """
+    results, todo = lookup_cached(appids)
+    if not todo:
+        return results
+    _count("misses", len(todo))
+
+    failed = set()
+
+    def one(appid):
+        try:
+            return _fetch_app_details_uncached(appid)
+        except Exception:
+            log.warning("appdetails failed for %s", appid, exc_info=True)
+            failed.add(appid)
+            return None
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(todo))) as pool:
+        fetched = dict(zip(todo, pool.map(one, todo)))
+
+    _remember({a: d for a, d in fetched.items() if a not in failed})
+    results.update(fetched)
+    return results
@@ -0,0 +1,43 @@
+from __future__ import annotations
+from typing import Iterable, List, Optional
+
+from .forms import TAG_CHOICES
+
+# Spellings the app itself uses (preferences form) win over whatever a source sent
+_CANONICAL = {" ".join(t.split()).casefold(): t for t, _ in TAG_CHOICES}
+
+
+def tag_key(tag: str) -> str:
+    """
+    Case- and whitespace-insensitive identity of a tag ("free  to play" == "Free to Play").
+    """
+    return " ".join(str(tag).split()).casefold()
+
+
+def normalize_tag(tag) -> Optional[str]:
+    """
+    Canonical spelling stored at ingest: known tags get the app's spelling, all-lowercase
+    ones get capitalized words, anything else keeps its casing (acronyms, "Free to Play").
+    """
+    t = " ".join(str(tag or "").split())
+    if not t:
+        return None
+    canonical = _CANONICAL.get(t.casefold())
+    if canonical:
+        return canonical
+    if t.islower():
+        return " ".join(w[:1].upper() + w[1:] for w in t.split())
+    return t
+
+
+def normalize_tags(tags: Iterable) -> List[str]:
+    """
+    Normalized tags in their original order, without case-insensitive duplicates.
+    """
+    out, seen = [], set()
+    for t in tags or []:
+        n = normalize_tag(t)
+        if n and tag_key(n) not in seen:
+            seen.add(tag_key(n))
+            out.append(n)
+    return out
@@ -1,12 +1,123 @@
-from .recommender import build_tag_vocab, build_training_data, user_to_vector
+import time
+import numpy as np
+from bson import ObjectId
+from pymongo import UpdateOne
+from .recommender import build_user_matrix, iter_training_chunks
+from .vocab import get_vocab
 from .models import User
+from .model_store import ModelWriter, get_model, remove_user, upsert_user
+from .item_similarity import build_item_similarity
+from .als import train_als
+from .metrics import timed
 
-def train_model():
-    vocab = build_tag_vocab()
-    user_ids, _ = build_training_data(vocab)
+@timed("train_model")
+def train_model() -> dict:
+    """
+    Full retrain of the tag vectors: vocab -> per chunk of users (columnar extraction +
+    vectorize -> bulk write -> append to the model store's on-disk matrix) -> publish the new version.
+    Memory stays bounded by TRAIN_CHUNK_USERS whatever the user count; each vector is
+    computed exactly once. Returns a report with per-stage timings (seconds).
+    """
+    timings = {"vocab": 0.0, "vectorize": 0.0, "write": 0.0, "store": 0.0}
 
-    for uid in user_ids:
-        u = User.objects(id=uid).first()
-        if u:
-            u.calculated_vector = user_to_vector(u, vocab)
-            u.save()
+    t = time.perf_counter()
+    vocab = get_vocab(fresh=True)  # pick up tags other workers appended
+    timings["vocab"] = time.perf_counter() - t
+
+    # Rows go straight into the new version's memmap; the KNN routes query that file
+    writer = ModelWriter(vocab, User._get_collection().estimated_document_count())
+    try:
+        chunks = iter_training_chunks(vocab)
+        while True:
+            # Raw cursors straight into (user, tag, weight) columns, users without signal dropped
+            t = time.perf_counter()
+            chunk = next(chunks, None)
+            timings["vectorize"] += time.perf_counter() - t
+            if chunk is None:
+                break
+            user_ids, X = chunk
+
+            t = time.perf_counter()
+            ops = [
+                UpdateOne({"_id": ObjectId(uid)}, {"$set": {"calculated_vector": X[n].tolist()}})
+                for n, uid in enumerate(user_ids)
+            ]
+            if ops:
+                User._get_collection().bulk_write(ops, ordered=False)
+            timings["write"] += time.perf_counter() - t
+
+            t = time.perf_counter()
+            writer.append(user_ids, X)
+            timings["store"] += time.perf_counter() - t
+
+        t = time.perf_counter()
+        writer.commit()
+        timings["store"] += time.perf_counter() - t
+    except BaseException:
+        writer.abort()
+        raise
+
+    return {
+        "tags_in_vocab": len(vocab),
+        "vocab_version": vocab.version,
+        "users_trained": writer.rows,
+        "timings": {k: round(v, 4) for k, v in timings.items()},
+    }
+
+
+@timed("train_collaborative")
+def train_collaborative() -> dict:
+    """
+    The collaborative models, built from owned_games / ratings only (not the tag vectors):
+    the item-item table for "similar games" / "because you played" and the ALS factors
+    for /engine/als. Much slower than a vector retrain, so the retrainer runs it as its
+    own, rate-limited job instead of inside train_model().
+    """
+    timings = {}
+
+    t = time.perf_counter()
+    items = build_item_similarity()
+    timings["items"] = time.perf_counter() - t
+
+    t = time.perf_counter()
+    factors = train_als()
+    timings["als"] = time.perf_counter() - t
+
+    return {
+        "games_in_item_table": items["games"],
+        "als_users": factors["users"],
+        "als_games": factors["games"],
+        "timings": {k: round(v, 4) for k, v in timings.items()},
+    }
+
+
+@timed("retrain_users")
+def retrain_users(user_ids) -> dict:
+    """
+    Partial retrain for a handful of users whose own data changed (prefs, ratings).
+    Uses the live model's vocab so the new vectors line up with everyone else's,
+    and upserts them into the model store instead of rebuilding it. Users whose vector
+    came out all zero are taken out of the model, as a full retrain would leave them out.
+    """
+    model = get_model()
+    if model is None:
+        return train_model()
+
+    t = time.perf_counter()
+    users = list(User.objects(id__in=list(user_ids)).only("favorite_tags", "hated_tags"))
+    X = build_user_matrix(users, model.vocab)
+
+    ops = [UpdateOne({"_id": u.id}, {"$set": {"calculated_vector": X[i].tolist()}}) for i, u in enumerate(users)]
+    if ops:
+        User._get_collection().bulk_write(ops, ordered=False)
+    for i, u in enumerate(users):
+        if np.abs(X[i]).max(initial=0) > 1e-9:
+            upsert_user(str(u.id), X[i])
+        else:
+            remove_user(str(u.id))
+
+    return {
+        "tags_in_vocab": len(model.vocab),
+        "users_trained": len(users),
+        "timings": {"partial": round(time.perf_counter() - t, 4)},
+    }
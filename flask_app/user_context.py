@@ -0,0 +1,161 @@
+from __future__ import annotations
+import copy
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+
+from bson import ObjectId
+from flask import g, has_request_context
+from flask_login import UserMixin
+
+from .models import User
+from .metrics import register_cache
+
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "1024"))
+# Profiles are re-checked against data_version on every request, so the TTL only
+# bounds how long an entry can sit around unused
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "60"))
+
+# Read on every request; everything else is loaded on first access
+AUTH_FIELDS = ("email", "data_version")
+# Never needed by a page (written by training only)
+HEAVY_FIELDS = ("calculated_vector",)
+
+
+class ProfileCache:
+    """
+    Raw profile documents per user, kept for USER_CACHE_TTL seconds and only served
+    while the stored data_version matches the one read for this request.
+    """
+
+    def __init__(self, maxsize: int = USER_CACHE_SIZE, ttl: float = USER_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.data = OrderedDict()  # user_id -> (data_version, expires_monotonic, son)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id: str, data_version: int) -> Optional[User]:
+        with self.lock:
+            entry = self.data.get(user_id)
+            if entry and entry[0] == data_version and entry[1] > time.monotonic():
+                self.data.move_to_end(user_id)
+                self.hits += 1
+                son = entry[2]
+            else:
+                self.misses += 1
+                return None
+        # Fresh document per request so route mutations never leak into the cache
+        return User._from_son(copy.deepcopy(son))
+
+    def put(self, user: User) -> None:
+        son = user.to_mongo().to_dict()
+        with self.lock:
+            self.data[str(user.id)] = (user.data_version or 0, time.monotonic() + self.ttl, son)
+            self.data.move_to_end(str(user.id))
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def evict(self, user_id: str) -> None:
+        with self.lock:
+            self.data.pop(user_id, None)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"size": len(self.data), "hits": self.hits, "misses": self.misses}
+
+
+profile_cache = ProfileCache()
+register_cache("profiles", profile_cache.stats)
+
+
+class UserContext(UserMixin):
+    """
+    What Flask-Login hands out as current_user.
+    Only the auth fields are read per request; the full profile (a real User document,
+    so routes can mutate and save() it as before) is loaded on first access of any other field.
+    """
+
+    def __init__(self, auth: dict):
+        object.__setattr__(self, "_auth", auth)
+        object.__setattr__(self, "_doc", None)
+
+    @property
+    def id(self) -> ObjectId:
+        return self._auth["_id"]
+
+    def get_id(self):
+        return str(self._auth["_id"])
+
+    @property
+    def document(self) -> User:
+        if self._doc is None:
+            user_id = self.get_id()
+            version = self._auth.get("data_version") or 0
+            doc = profile_cache.get(user_id, version)
+            if doc is None:
+                doc = User.objects(id=self.id).exclude(*HEAVY_FIELDS).first()
+                if doc is not None:
+                    profile_cache.put(doc)
+            object.__setattr__(self, "_doc", doc)
+        return self._doc
+
+    def __getattr__(self, name):
+        # Only called for attributes not found on the context itself
+        if name.startswith("_"):
+            raise AttributeError(name)
+        if self._doc is None and name in AUTH_FIELDS:
+            return self._auth.get(name)
+        return getattr(self.document, name)
+
+    def __setattr__(self, name, value):
+        setattr(self.document, name, value)
+
+    def save(self, *args, **kwargs):
+        self.document.save(*args, **kwargs)
+        profile_cache.evict(self.get_id())
+        self._auth["data_version"] = self.document.data_version
+        return self
+
+    def bump_data_version(self) -> int:
+        doc = User.objects(id=self.id).only("data_version").modify(inc__data_version=1, new=True)
+        self._auth["data_version"] = doc.data_version
+        if self._doc is not None:
+            self._doc._data["data_version"] = doc.data_version
+        return doc.data_version
+
+
+def load_user_context(user_id: str) -> Optional[UserContext]:
+    """
+    Flask-Login user_loader: one small projected read per request.
+    """
+    try:
+        oid = ObjectId(user_id)
+    except Exception:
+        return None
+    auth = User._get_collection().find_one({"_id": oid}, {f: 1 for f in AUTH_FIELDS})
+    return UserContext(auth) if auth else None
+
+
+def request_memo(key, compute: Callable):
+    """
+    Compute something derived from the user's data once per request (owned appids,
+    vectors, ...). Outside a request it just computes. Callers must not mutate the result.
+    """
+    if not has_request_context():
+        return compute()
+    memo = g.setdefault("_user_memo", {})
+    if key not in memo:
+        memo[key] = compute()
+    return memo[key]
+
+
+def forget_request_memo(*keys) -> None:
+    if has_request_context():
+        memo = g.get("_user_memo")
+        if memo:
+            for key in keys:
+                memo.pop(key, None)
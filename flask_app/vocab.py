@@ -0,0 +1,133 @@
+from __future__ import annotations
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Iterable, Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from .models import Game, TagVocabulary
+
+# How often a worker checks whether another worker extended the vocab (seconds).
+# In between, get_vocab() is a plain in-memory lookup.
+VOCAB_CHECK_SECONDS = float(os.getenv("VOCAB_CHECK_SECONDS", "30"))
+
+VOCAB_NAME = "tags"
+
+
+class Vocabulary(tuple):
+    """
+    Tags in vector column order, plus tag -> column (`columns`) and the stored `version`.
+    Usable anywhere a plain list of tags is expected.
+    """
+
+    def __new__(cls, tags: Iterable[str] = (), version: int = 0):
+        vocab = super().__new__(cls, tags)
+        vocab.version = version
+        vocab.columns = {t: i for i, t in enumerate(vocab)}
+        return vocab
+
+
+_lock = threading.Lock()
+_vocab: Optional[Vocabulary] = None
+_checked_at = 0.0
+
+
+def _coll():
+    return TagVocabulary._get_collection()
+
+
+def _from_doc(doc: dict) -> Vocabulary:
+    return Vocabulary(doc.get("tags") or [], doc.get("version", 0))
+
+
+def _load_or_create() -> Vocabulary:
+    """
+    The stored vocab; the first time ever it is seeded from the tags already in the catalog.
+    """
+    doc = _coll().find_one({"name": VOCAB_NAME})
+    if doc is not None:
+        return _from_doc(doc)
+    seed = sorted(t for t in Game._get_collection().distinct("tags") if t)
+    try:
+        doc = _coll().find_one_and_update(
+            {"name": VOCAB_NAME},
+            {"$setOnInsert": {"tags": seed, "version": 1, "updated_at": datetime.utcnow()}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+    except DuplicateKeyError:
+        # Another worker seeded it first
+        doc = _coll().find_one({"name": VOCAB_NAME})
+    return _from_doc(doc)
+
+
+def get_vocab(fresh: bool = False) -> Vocabulary:
+    """
+    The current tag vocabulary, from this worker's cache. Re-reads the stored copy at most
+    every VOCAB_CHECK_SECONDS (or now, with fresh=True), and only its version unless that changed.
+    """
+    global _vocab, _checked_at
+    with _lock:
+        now = time.monotonic()
+        if _vocab is None:
+            _vocab, _checked_at = _load_or_create(), now
+        elif fresh or now - _checked_at > VOCAB_CHECK_SECONDS:
+            head = _coll().find_one({"name": VOCAB_NAME}, {"version": 1})
+            if head is None or head.get("version") != _vocab.version:
+                _vocab = _load_or_create()
+            _checked_at = now
+        return _vocab
+
+
+def extend_vocab(tags: Iterable[str]) -> Vocabulary:
+    """
+    Append tags that aren't in the vocab yet (in first-seen order). Existing tags keep
+    their column, so every vector built before stays aligned. No write if nothing is new.
+    """
+    global _vocab, _checked_at
+    vocab = get_vocab()
+    new = [t for t in dict.fromkeys(tags) if t and t not in vocab.columns]
+    if not new:
+        return vocab
+
+    # $addToSet keeps appends from concurrent workers free of duplicates
+    doc = _coll().find_one_and_update(
+        {"name": VOCAB_NAME},
+        {"$addToSet": {"tags": {"$each": new}}, "$inc": {"version": 1},
+         "$set": {"updated_at": datetime.utcnow()}},
+        return_document=ReturnDocument.AFTER,
+    )
+    with _lock:
+        _vocab, _checked_at = _from_doc(doc), time.monotonic()
+        return _vocab
+
+
+def rebuild_vocab() -> Vocabulary:
+    """
+    Replace the vocab with exactly the tags in the catalog, sorted (drops tags no game has
+    any more, e.g. old spellings after normalize-tags). Column positions change, so the
+    caller has to run a full retrain.
+    """
+    global _vocab, _checked_at
+    tags = sorted(t for t in Game._get_collection().distinct("tags") if t)
+    doc = _coll().find_one_and_update(
+        {"name": VOCAB_NAME},
+        {"$set": {"tags": tags, "updated_at": datetime.utcnow()}, "$inc": {"version": 1}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    with _lock:
+        _vocab, _checked_at = _from_doc(doc), time.monotonic()
+        return _vocab
+
+
+def forget_vocab() -> None:
+    """
+    Drop this worker's cached copy (next get_vocab() re-reads it).
+    """
+    global _vocab
+    with _lock:
+        _vocab = None
@@ -0,0 +1,43 @@
+"""
+Offline test setup: the app's models talk to an in-memory mongomock database and the
+model store lives in a temp dir, so nothing here needs a Mongo server or the Steam API.
+"""
+import os
+import tempfile
+
+import mongoengine
+import mongomock
+import mongomock.collection
+import pytest
+
+os.environ.setdefault("MODEL_STORE_DIR", tempfile.mkdtemp(prefix="steam_test_store_"))
+os.environ.setdefault("RETRAIN_ASYNC", "0")
+
+# pymongo 4.9+ passes sort= to bulk updates, mongomock 4.3 doesn't accept it
+_add_update = mongomock.collection.BulkOperationBuilder.add_update
+mongomock.collection.BulkOperationBuilder.add_update = (
+    lambda self, *a, sort=None, **kw: _add_update(self, *a, **kw)
+)
+
+FIXTURES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "fixtures")
+
+
+@pytest.fixture(scope="session", autouse=True)
+def _connection():
+    mongoengine.connect("steam_test", host="mongodb://localhost", mongo_client_class=mongomock.MongoClient)
+    yield
+    mongoengine.disconnect()
+
+
+@pytest.fixture(autouse=True)
+def db():
+    """
+    An empty database (and no cached vocab) for every test.
+    """
+    from flask_app.vocab import forget_vocab
+
+    database = mongoengine.get_db()
+    for name in database.list_collection_names():
+        database.drop_collection(name)
+    forget_vocab()
+    return database
@@ -0,0 +1,65 @@
+"""
+The batched ALS solve must match solving every row on its own.
+"""
+import numpy as np
+import pytest
+from scipy import sparse
+
+from flask_app import als
+
+
+def per_row(Y, P, C1, reg):
+    YtY = Y.T @ Y
+    out = np.zeros((P.shape[0], Y.shape[1]), dtype=np.float32)
+    for r in range(P.shape[0]):
+        lo, hi = P.indptr[r], P.indptr[r + 1]
+        out[r] = als._solve_row(Y, YtY, P.indices[lo:hi], C1.data[lo:hi], P.data[lo:hi], reg)
+    return out
+
+
+@pytest.mark.parametrize("block_nnz", [1, 64, 8192])
+def test_batched_solve_matches_per_row(monkeypatch, block_nnz):
+    monkeypatch.setattr(als, "ALS_BLOCK_NNZ", block_nnz)
+    rng = np.random.default_rng(0)
+    users, games, factors = 300, 120, 8
+
+    # Skewed library sizes, some empty rows, one user owning everything
+    sizes = np.minimum(rng.zipf(1.6, users) * 2, games)
+    sizes[::17] = 0
+    sizes[5] = games
+    rows = np.repeat(np.arange(users), sizes)
+    cols = np.concatenate([rng.choice(games, size=n, replace=False) for n in sizes])
+    prefs = (rng.random(len(rows)) < 0.8).astype(np.float32)  # explicit zeros = dislikes
+    conf = (rng.random(len(rows)) * 10).astype(np.float32)
+
+    order = np.lexsort((cols, rows))
+    indptr = np.concatenate([[0], np.cumsum(sizes)])
+    P = sparse.csr_matrix((prefs[order], cols[order], indptr), shape=(users, games))
+    C1 = sparse.csr_matrix((conf[order], cols[order].copy(), indptr.copy()), shape=(users, games))
+    Y = (rng.standard_normal((games, factors)) * 0.1).astype(np.float32)
+
+    np.testing.assert_allclose(als._solve_all(Y, P, C1, 0.1), per_row(Y, P, C1, 0.1), atol=1e-4)
+
+
+def test_fold_in_cache_keeps_latest_version_per_user(monkeypatch):
+    monkeypatch.setattr(als, "ALS_FOLD_CACHE_SIZE", 2)
+    model = als.ALSModel({"user_ids": np.array([], dtype=str), "user_versions": np.array([], dtype=np.int64),
+                          "appids": np.array([10]), "user_factors": np.zeros((0, 2), dtype=np.float32),
+                          "item_factors": np.ones((1, 2), dtype=np.float32), "reg": 0.1, "alpha": 10.0}, 0.0)
+    calls = []
+    monkeypatch.setattr(model, "fold_in", lambda user: calls.append((user.id, user.data_version)) or np.zeros(2))
+
+    class U:
+        def __init__(self, id, data_version):
+            self.id, self.data_version = id, data_version
+
+    model.user_vector(U("a", 1))
+    model.user_vector(U("a", 1))
+    model.user_vector(U("a", 2))
+    assert calls == [("a", 1), ("a", 2)]
+    assert list(model.folded) == ["a"] and model.folded["a"][0] == 2
+
+    model.user_vector(U("b", 0))
+    model.user_vector(U("a", 2))  # a is now most recent, so b goes first
+    model.user_vector(U("c", 0))
+    assert list(model.folded) == ["a", "c"]
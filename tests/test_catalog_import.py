@@ -0,0 +1,34 @@
+"""
+Streaming JSON reader and resumable catalog import.
+"""
+import json
+
+from flask_app import catalog_import
+from flask_app.models import Game
+
+
+def test_iter_json_across_small_chunks(tmp_path, monkeypatch):
+    monkeypatch.setattr(catalog_import, "READ_CHUNK", 7)
+    records = [{"appid": i, "name": f"Game {i}", "tags": ["RPG"] * (i % 3), "positive": 12345} for i in range(1, 40)]
+    path = tmp_path / "dump.json"
+    path.write_text(json.dumps(records, indent=1))
+    assert list(catalog_import.iter_json(str(path))) == records
+
+    path.write_text(json.dumps({str(r["appid"]): {"name": r["name"]} for r in records}))
+    assert [r["appid"] for r in catalog_import.iter_json(str(path))] == [str(r["appid"]) for r in records]
+
+
+def test_resumed_import_invalidates_catalog_index(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(catalog_import, "invalidate_catalog_index", lambda: calls.append(1))
+    path = tmp_path / "dump.jsonl"
+    path.write_text("".join(json.dumps({"appid": i, "name": f"Game {i}"}) + "\n" for i in range(1, 5)))
+
+    catalog_import.import_catalog(str(path), batch_size=2)
+    assert Game.objects.count() == 4 and len(calls) == 1
+
+    # Crashed after the last bulk_write but before its checkpoint: the rerun changes nothing
+    catalog_import._write_checkpoint(str(path), 2)
+    stats = catalog_import.import_catalog(str(path), batch_size=2)
+    assert stats["resumed_at"] == 2 and stats["upserted"] == stats["modified"] == 0
+    assert len(calls) == 2
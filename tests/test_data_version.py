@@ -0,0 +1,64 @@
+"""
+data_version keys the result and profile caches, so every bump has to land, even when
+two requests change the same user at once.
+"""
+from flask_app.models import User
+from flask_app.user_context import UserContext
+
+
+def test_concurrent_bumps_both_count():
+    User(email="a@example.com", password_hash="x").save()
+    first, second = User.objects.get(email="a@example.com"), User.objects.get(email="a@example.com")
+
+    assert first.bump_data_version() == 1
+    assert second.bump_data_version() == 2
+    assert User.objects.get(email="a@example.com").data_version == 2
+
+
+def test_save_after_bump_does_not_write_a_stale_version():
+    User(email="a@example.com", password_hash="x").save()
+    first, second = User.objects.get(email="a@example.com"), User.objects.get(email="a@example.com")
+
+    first.favorite_tags = ["RPG"]
+    first.save()
+    first.bump_data_version()
+    second.bump_data_version()
+    # A later save of the first copy must not $set data_version back to its own value
+    first.hated_tags = ["Horror"]
+    first.save()
+
+    stored = User.objects.get(email="a@example.com")
+    assert stored.data_version == 2 and stored.favorite_tags == ["RPG"] and stored.hated_tags == ["Horror"]
+
+
+def test_user_context_bump_tracks_the_stored_version():
+    user = User(email="a@example.com", password_hash="x").save()
+    ctx = UserContext({"_id": user.id, "email": user.email, "data_version": 0})
+    user.bump_data_version()  # another request
+
+    assert ctx.bump_data_version() == 2
+    assert ctx.data_version == 2
+    ctx.pinned_games = [10]
+    ctx.save()
+    assert User.objects.get(id=user.id).data_version == 2
+
+
+def test_profile_cache_follows_data_version_and_reports_its_hit_rate(monkeypatch):
+    from flask_app.metrics import registry
+    from flask_app.user_context import ProfileCache, profile_cache
+
+    monkeypatch.setattr(profile_cache, "hits", 0)
+    monkeypatch.setattr(profile_cache, "misses", 0)
+    monkeypatch.setattr(profile_cache, "data", ProfileCache().data)
+    user = User(email="a@example.com", password_hash="x", favorite_tags=["RPG"]).save()
+
+    assert profile_cache.get(str(user.id), 0) is None
+    profile_cache.put(user)
+    assert profile_cache.get(str(user.id), 0).favorite_tags == ["RPG"]
+    user.bump_data_version()
+    assert profile_cache.get(str(user.id), 1) is None  # stale entry isn't served
+
+    text = registry.render()
+    assert 'app_cache_events_total{cache="profiles",event="hits"} 1' in text
+    assert 'app_cache_events_total{cache="profiles",event="misses"} 2' in text
+    assert 'app_cache_entries{cache="profiles"} 1' in text
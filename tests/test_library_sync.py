@@ -0,0 +1,162 @@
+"""
+Replays the recorded day1 -> day2 -> day3 snapshots of one Steam library through the
+delta sync and checks what changed and which retrain each sync asks for.
+
+day1: 8 games, first sync
+day2: 381210 removed, 1145360 added, 413150 played a bit more (enough to move the vector)
+day3: 570 played 5 more minutes (not enough to move the vector)
+"""
+import os
+
+import pytest
+
+from flask_app import catalog
+from flask_app.jobs import retrainer
+from flask_app.library import sync_library, sync_steam_library
+from flask_app.models import Game, OwnedGame, User
+from flask_app.steam_api import get_owned_games, resolve_to_steamid64
+
+from conftest import FIXTURES
+
+STEAMID = "76561197960287930"
+DAY1 = {440, 570, 620, 730, 105600, 292030, 381210, 413150}
+
+
+def owned_games(monkeypatch, day: int) -> list:
+    monkeypatch.setenv("STEAM_API_FIXTURES", os.path.join(FIXTURES, "steam_api", f"day{day}"))
+    return get_owned_games(resolve_to_steamid64("gaben"))
+
+
+@pytest.fixture
+def user():
+    return User(email="gaben@example.com", password_hash="x").save()
+
+
+@pytest.fixture
+def retrains(monkeypatch):
+    """
+    (user_ids, full) for every retrain a sync queues, instead of running it.
+    """
+    calls = []
+    monkeypatch.setattr(retrainer, "mark_dirty", lambda user_ids=(), full=False: calls.append(
+        ([str(u) for u in user_ids], full)))
+    return calls
+
+
+@pytest.fixture
+def store_api(monkeypatch):
+    """
+    Stand-in for the Store API: every looked-up appid exists, with one tag.
+    """
+    looked_up = []
+
+    def fetch_many(appids, max_workers=None):
+        looked_up.extend(appids)
+        return {a: {"appid": a, "name": f"Game {a}", "tags": ["Action"]} for a in appids}
+
+    monkeypatch.setattr(catalog, "fetch_many_app_details", fetch_many)
+    return looked_up
+
+
+def stored(user) -> dict:
+    return {d.appid: d.playtime_forever for d in OwnedGame.objects(user_id=user.id)}
+
+
+def test_resolves_vanity_from_fixtures(monkeypatch):
+    monkeypatch.setenv("STEAM_API_FIXTURES", os.path.join(FIXTURES, "steam_api", "day1"))
+    assert resolve_to_steamid64("gaben") == STEAMID
+
+
+def test_day1_adds_whole_library(monkeypatch, user):
+    games = owned_games(monkeypatch, 1)
+    report = sync_library(user.id, games)
+
+    assert set(report["added"]) == DAY1
+    assert report["removed"] == [] and report["changed"] == []
+    assert report["unchanged"] == 0 and report["total"] == 8
+    assert report["vector_dirty"]
+    assert stored(user) == {g["appid"]: g["playtime_forever"] for g in games}
+    assert User.objects.get(id=user.id).game_count == 8
+
+
+def test_day2_delta(monkeypatch, user):
+    sync_library(user.id, owned_games(monkeypatch, 1))
+    report = sync_library(user.id, owned_games(monkeypatch, 2))
+
+    assert report["added"] == [1145360]
+    assert report["removed"] == [381210]
+    assert report["changed"] == [413150]
+    assert report["unchanged"] == 6 and report["total"] == 8
+    # 780 + 610 + 95 minutes against ~46k stored: ~3%, past the 2% threshold
+    assert report["relative_change"] == pytest.approx(0.032, abs=0.001)
+    assert report["vector_dirty"]
+
+    games = stored(user)
+    assert 381210 not in games
+    assert games[1145360] == 780 and games[413150] == 4805
+
+
+def test_day3_small_playtime_change_is_not_dirty(monkeypatch, user):
+    for day in (1, 2):
+        sync_library(user.id, owned_games(monkeypatch, day))
+    report = sync_library(user.id, owned_games(monkeypatch, 3))
+
+    assert report["added"] == [] and report["removed"] == []
+    assert report["changed"] == [570]
+    assert 0 < report["relative_change"] < 0.02
+    assert not report["vector_dirty"]
+    assert stored(user)[570] == 15425
+
+
+def test_same_snapshot_twice_writes_nothing(monkeypatch, user):
+    sync_library(user.id, owned_games(monkeypatch, 1))
+    report = sync_library(user.id, owned_games(monkeypatch, 1))
+
+    assert report["added"] == report["removed"] == report["changed"] == []
+    assert report["unchanged"] == 8
+    assert report["signal_change"] == 0 and not report["vector_dirty"]
+
+
+def test_retrain_kind_per_day(monkeypatch, user, retrains, store_api):
+    uid = str(user.id)
+
+    # day1: every game is new to the catalog -> enriched, full retrain
+    report = sync_steam_library(user, STEAMID, owned_games(monkeypatch, 1))
+    assert set(store_api) == DAY1
+    assert report["new_games"] == 8 and report["retrain"] == "full"
+    assert retrains == [([uid], True)]
+
+    # day2: 1145360 is new to the catalog too -> full again, and only it is looked up
+    report = sync_steam_library(user, STEAMID, owned_games(monkeypatch, 2))
+    assert store_api[8:] == [1145360]
+    assert report["new_games"] == 1 and report["retrain"] == "full"
+    assert retrains[-1] == ([uid], True)
+
+    # day3: below the signal threshold -> nothing queued
+    report = sync_steam_library(user, STEAMID, owned_games(monkeypatch, 3))
+    assert report["new_games"] == 0 and report["retrain"] is None
+    assert len(retrains) == 2
+
+    saved = User.objects.get(id=user.id)
+    assert saved.steam_id == STEAMID and saved.data_version == 3 and saved.last_sync is not None
+
+
+def test_known_games_only_retrain_the_user(monkeypatch, user, retrains, store_api):
+    # Catalog already has every game, so day2 only moves this user's vector
+    for appid in DAY1 | {1145360}:
+        Game(appid=appid, name=str(appid), tags=["Action"]).save()
+
+    sync_steam_library(user, STEAMID, owned_games(monkeypatch, 1))
+    report = sync_steam_library(user, STEAMID, owned_games(monkeypatch, 2))
+
+    assert store_api == []
+    assert report["new_games"] == 0 and report["retrain"] == "partial"
+    assert retrains == [([str(user.id)], False), ([str(user.id)], False)]
+
+
+def test_no_enrich_never_calls_store_api(monkeypatch, user, retrains, store_api):
+    report = sync_steam_library(user, STEAMID, owned_games(monkeypatch, 1), enrich=False)
+
+    assert store_api == []
+    assert report["new_games"] == 0 and report["retrain"] == "partial"
+    assert Game.objects.count() == 0
@@ -0,0 +1,128 @@
+"""
+Model store overlay: upserts are searched next to the snapshot and compacted into a
+new snapshot once enough of them piled up.
+"""
+import os
+
+import numpy as np
+import pytest
+
+from flask_app import model_store
+from flask_app.model_store import compact_model, get_model, model_status, remove_user, save_model, upsert_user
+
+
+@pytest.fixture(autouse=True)
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(model_store, "MODEL_STORE_DIR", str(tmp_path))
+    monkeypatch.setattr(model_store, "_model", None)
+    return tmp_path
+
+
+def base_model(n=50, dim=6, seed=0):
+    rng = np.random.default_rng(seed)
+    vectors = rng.random((n, dim)).astype(np.float32)
+    ids = [f"u{i}" for i in range(n)]
+    save_model(ids, vectors, [f"t{j}" for j in range(dim)])
+    return ids, vectors
+
+
+def brute_force(vectors: dict, q, k):
+    q = np.asarray(q, dtype=np.float64)
+    dists = {u: 1 - float(np.dot(v, q) / (np.linalg.norm(v) * np.linalg.norm(q))) for u, v in vectors.items()}
+    return sorted(dists, key=dists.get)[:k]
+
+
+def test_overlay_is_searched_with_the_snapshot():
+    ids, vectors = base_model()
+    rng = np.random.default_rng(1)
+    expected = dict(zip(ids, vectors))
+    for uid in ["u3", "u7", "new1", "new2"]:
+        vec = rng.random(6).astype(np.float32)
+        upsert_user(uid, vec)
+        expected[uid] = vec
+
+    q = rng.random(6)
+    got = [uid for uid, _ in get_model().kneighbors(q, 10)]
+    assert got == brute_force(expected, q, 10)
+
+
+def test_compaction_folds_the_overlay_into_a_new_snapshot(monkeypatch):
+    ids, vectors = base_model()
+    monkeypatch.setattr(model_store, "COMPACT_AFTER_DELTAS", 5)
+    first = get_model().version
+
+    rng = np.random.default_rng(2)
+    expected = dict(zip(ids, vectors))
+    for uid in ["u0", "u1", "new1", "new2"]:
+        expected[uid] = rng.random(6).astype(np.float32)
+        upsert_user(uid, expected[uid])
+    assert model_status()["overlay_users"] == 4 and get_model().version == first
+
+    expected["new3"] = rng.random(6).astype(np.float32)
+    upsert_user("new3", expected["new3"])
+
+    model = get_model()
+    assert model.version != first
+    assert model.overlay == {} and model_status()["deltas"] == 0
+    assert model.n_users == len(ids) + 3
+    for uid, vec in expected.items():
+        np.testing.assert_allclose(model.vector_for(uid), vec)
+
+
+def test_compaction_keeps_upserts_that_arrive_meanwhile(monkeypatch):
+    base_model()
+    model = get_model()
+    upsert_user("a", np.ones(6))
+
+    # Another worker appends to the old snapshot's log after this one snapshotted it
+    real_writer = model_store.ModelWriter
+
+    class LateWriter(real_writer):
+        def commit(self):
+            with open(os.path.join(model.path, "deltas.jsonl"), "a") as f:
+                f.write('{"user_id": "b", "vector": [1, 0, 0, 0, 0, 0]}\n')
+            return super().commit()
+
+    monkeypatch.setattr(model_store, "ModelWriter", LateWriter)
+    compact_model(model)
+
+    fresh = get_model()
+    assert "a" in fresh.row_of and "b" in fresh.overlay
+
+
+def test_only_one_worker_compacts_a_snapshot():
+    base_model()
+    model = get_model()
+    upsert_user("a", np.ones(6))
+    assert compact_model(model) is not None
+    assert compact_model(model) is None
+
+
+def test_removed_users_drop_out_of_search_and_compaction(monkeypatch):
+    ids, vectors = base_model()
+    upsert_user("new1", np.ones(6))
+    remove_user("u0")
+    remove_user("new1")
+    remove_user("nobody")  # not in the model, nothing written
+
+    model = get_model()
+    assert model.vector_for("u0") is None and model.vector_for("new1") is None
+    assert model.n_users == len(ids) - 1 and model_status()["deltas"] == 3
+    found = [uid for uid, _ in model.kneighbors(vectors[0], len(ids))]
+    assert "u0" not in found and "new1" not in found and len(found) == len(ids) - 1
+
+    compact_model(model)
+    fresh = get_model()
+    assert "u0" not in fresh.row_of and "new1" not in fresh.row_of
+    assert len(fresh.user_ids) == len(ids) - 1
+
+
+def test_store_dir_in_temp_dir_is_refused_on_serverless(monkeypatch, tmp_path):
+    monkeypatch.setattr(model_store, "MODEL_STORE_DIR", str(tmp_path / "store"))
+    model_store.check_store_dir()  # fine off serverless
+
+    monkeypatch.setattr(model_store, "SERVERLESS", True)
+    with pytest.raises(RuntimeError, match="persistent storage"):
+        model_store.check_store_dir()
+    monkeypatch.setattr(model_store, "MODEL_STORE_DIR", "/mnt/efs/steam_model_store")
+    model_store.check_store_dir()
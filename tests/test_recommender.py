@@ -0,0 +1,44 @@
+"""
+The full retrain (columnar extraction) and the per-user path (build_user_matrix, used by
+partial retrains and friend compare) must produce the same vectors.
+"""
+import numpy as np
+
+from flask_app.models import Game, OwnedGame, Rating, User
+from flask_app.recommender import build_user_matrix, columns_to_matrix, extract_training_columns
+
+
+def test_both_vector_paths_agree():
+    vocab = ["Action", "Indie", "RPG", "Strategy"]
+    Game(appid=1, name="a", tags=["RPG", "Indie"]).save()
+    # Raw catalog data can repeat a tag; it still counts once
+    Game._get_collection().insert_one({"appid": 2, "name": "b", "tags": ["Action", "Action", "Strategy"]})
+    Game(appid=3, name="c", tags=["Unknown"]).save()
+
+    users = [
+        User(email="a@example.com", password_hash="x", favorite_tags=["RPG"], hated_tags=["Strategy"]).save(),
+        User(email="b@example.com", password_hash="x").save(),
+        User(email="c@example.com", password_hash="x", favorite_tags=["Action", "Action"]).save(),
+    ]
+    for u, library in zip(users, [{1: 600, 2: 120}, {2: 6000, 3: 60}, {1: 0}]):
+        for appid, minutes in library.items():
+            OwnedGame(user_id=u.id, appid=appid, playtime_forever=minutes).save()
+    Rating(user_id=users[0].id, appid=2, rating=9).save()
+
+    columns = extract_training_columns(vocab)
+    full = columns_to_matrix(columns, len(vocab))
+    rows = {str(uid): i for i, uid in enumerate(columns["user_ids"])}
+    partial = build_user_matrix(users, vocab)
+
+    for i, u in enumerate(users):
+        np.testing.assert_allclose(full[rows[str(u.id)]], partial[i], atol=1e-5)
+    # Game 2's duplicated "Action" is counted once: 100 hours * 0.1
+    assert partial[1][0] == np.float32(10.0)
+
+
+def test_vocabulary_keeps_tuple_index():
+    from flask_app.vocab import Vocabulary
+
+    vocab = Vocabulary(["RPG", "Indie"], version=3)
+    assert vocab.index("Indie") == 1
+    assert vocab.columns == {"RPG": 0, "Indie": 1}
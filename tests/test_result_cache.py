@@ -0,0 +1,30 @@
+"""
+Per-user result cache: versioned entries, and hit rates visible on /metrics.
+"""
+from flask_app.metrics import registry
+from flask_app.result_cache import ResultCache, result_cache
+
+
+def test_entries_only_served_for_the_same_version():
+    cache = ResultCache(maxsize=4, ttl=60, persist=False)
+    cache.put("u1", "tags", "v1|0", {"recommendations": [1]})
+
+    assert cache.get("u1", "tags", "v1|0") == {"recommendations": [1]}
+    assert cache.get("u1", "tags", "v1|1") is None  # the user's data changed
+    assert cache.stats() == {"size": 1, "hits": 1, "misses": 1}
+
+
+def test_stats_are_exported_as_metrics(monkeypatch):
+    monkeypatch.setattr(result_cache, "persist", False)
+    monkeypatch.setattr(result_cache, "hits", 0)
+    monkeypatch.setattr(result_cache, "misses", 0)
+    monkeypatch.setattr(result_cache, "data", type(result_cache.data)())
+
+    result_cache.put("u1", "tags", "v", {})
+    result_cache.get("u1", "tags", "v")
+    result_cache.get("u2", "tags", "v")
+
+    text = registry.render()
+    assert 'app_cache_events_total{cache="recommendations",event="hits"} 1' in text
+    assert 'app_cache_events_total{cache="recommendations",event="misses"} 1' in text
+    assert 'app_cache_entries{cache="recommendations"} 1' in text
@@ -0,0 +1,213 @@
+"""
+Store API client against a scripted session and a fake clock: retries / backoff on
+429 and 5xx, the shared token bucket, and the LRU -> Mongo -> network cache tiers.
+"""
+import json
+from datetime import datetime, timedelta
+
+import pytest
+import requests
+
+from flask_app import steam_store_api as store
+from flask_app.models import AppDetailsCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(round(seconds, 3))
+        self.now += seconds
+
+
+class FakeSession:
+    """
+    Answers GETs from a script: a status code, (status, headers), or an exception to raise.
+    With no script for an appid, the app exists and is named after it.
+    """
+
+    def __init__(self):
+        self.scripts = {}
+        self.calls = []
+
+    def get(self, url, params=None, timeout=None):
+        appid = params["appids"]
+        self.calls.append(appid)
+        script = self.scripts.get(appid)
+        step = script.pop(0) if script else 200
+        if isinstance(step, Exception):
+            raise step
+        status, headers = step if isinstance(step, tuple) else (step, {})
+        return response(appid, status, headers)
+
+
+def response(appid, status=200, headers=None, success=True):
+    r = requests.Response()
+    r.status_code = status
+    r.headers.update(headers or {})
+    r.url = store.STEAM_STORE_APPDETAILS
+    body = {str(appid): {"success": success, "data": {
+        "name": f"Game {appid}", "genres": [{"description": "Action"}, {"description": "Indie"}]}}}
+    if appid >= 900:
+        body = {str(appid): {"success": False}}  # delisted apps
+    r._content = json.dumps(body).encode()
+    return r
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(store.time, "monotonic", clock.monotonic)
+    monkeypatch.setattr(store.time, "sleep", clock.sleep)
+    monkeypatch.setattr(store.random, "random", lambda: 0.0)
+    return clock
+
+
+@pytest.fixture
+def session(monkeypatch, clock):
+    session = FakeSession()
+    monkeypatch.setattr(store, "_session", session)
+    monkeypatch.setattr(store, "_bucket", store.TokenBucket(rate=100, burst=100))
+    monkeypatch.setattr(store, "_lru", store._LRUCache(16))
+    monkeypatch.setattr(store, "_stats", dict.fromkeys(store._stats, 0))
+    return session
+
+
+# ---- retries ----
+
+def test_429_honours_retry_after_and_pauses_every_caller(session, clock):
+    session.scripts[10] = [(429, {"Retry-After": "7"}), 200]
+
+    assert store.fetch_app_details(10) == {"appid": 10, "name": "Game 10", "tags": ["Action", "Indie"]}
+    assert session.calls == [10, 10]
+    assert 7 in clock.sleeps
+    # The bucket was blocked for everyone, not just this thread
+    assert store._bucket.blocked_until == pytest.approx(7)
+
+
+def test_5xx_backs_off_exponentially(session, clock):
+    session.scripts[10] = [500, 502, 503, 200]
+
+    assert store.fetch_app_details(10)["name"] == "Game 10"
+    assert clock.sleeps == [1, 2, 4]
+    assert store._bucket.blocked_until == 0  # only 429s throttle the whole worker
+
+
+def test_connection_errors_are_retried(session, clock):
+    session.scripts[10] = [requests.ConnectionError(), requests.Timeout(), 200]
+
+    assert store.fetch_app_details(10)["name"] == "Game 10"
+    assert clock.sleeps == [1, 2]
+
+
+def test_gives_up_after_max_retries(session, monkeypatch):
+    monkeypatch.setattr(store, "MAX_RETRIES", 2)
+    session.scripts[10] = [503] * 3
+
+    with pytest.raises(requests.HTTPError):
+        store.fetch_app_details(10)
+    assert len(session.calls) == 3
+    # Errors aren't cached: the next call goes to the network again
+    store.fetch_app_details(10)
+    assert len(session.calls) == 4
+
+
+def test_4xx_is_not_retried(session):
+    session.scripts[10] = [404]
+
+    with pytest.raises(requests.HTTPError):
+        store.fetch_app_details(10)
+    assert session.calls == [10]
+
+
+# ---- rate limiter ----
+
+def test_token_bucket_allows_a_burst_then_paces(clock):
+    bucket = store.TokenBucket(rate=2, burst=3)
+    for _ in range(5):
+        bucket.acquire()
+
+    # 3 from the burst, then one token every 1/rate seconds
+    assert clock.sleeps == [0.5, 0.5]
+    assert clock.now == pytest.approx(1.0)
+
+
+def test_token_bucket_pause_blocks_until_it_expires(clock):
+    bucket = store.TokenBucket(rate=10, burst=10)
+    bucket.pause(5)
+    bucket.acquire()
+    assert clock.now == pytest.approx(5)
+
+
+# ---- cache tiers ----
+
+def test_lru_then_db_then_network(session):
+    store.fetch_app_details(10)
+    assert store.cache_stats()["misses"] == 1 and session.calls == [10]
+
+    store.fetch_app_details(10)
+    assert store.cache_stats()["lru_hits"] == 1 and session.calls == [10]
+
+    # Another worker (empty LRU) finds it in Mongo, and keeps it in its own LRU
+    store._lru.clear()
+    assert store.fetch_app_details(10)["name"] == "Game 10"
+    assert store.fetch_app_details(10)["name"] == "Game 10"
+    assert store.cache_stats() == {"lru_hits": 2, "db_hits": 1, "misses": 1, "negative_hits": 0, "size": 1}
+    assert session.calls == [10]
+
+
+def test_misses_are_cached_too(session):
+    assert store.fetch_app_details(901) is None
+    assert store.fetch_app_details(901) is None
+    store._lru.clear()
+    assert store.fetch_app_details(901) is None
+
+    assert session.calls == [901]
+    assert store.cache_stats()["negative_hits"] == 2
+    assert AppDetailsCache.objects.get(appid=901).found is False
+
+
+def test_expired_entries_are_refetched(session, clock):
+    store.fetch_app_details(901)
+
+    # Past the negative TTL in this worker's LRU...
+    clock.now += store.NEGATIVE_CACHE_TTL + 1
+    # ...and in Mongo
+    AppDetailsCache.objects(appid=901).update(set__expires_at=datetime.utcnow() - timedelta(seconds=1))
+
+    store.fetch_app_details(901)
+    assert session.calls == [901, 901]
+
+
+def test_fetch_many_mixes_tiers_and_skips_caching_failures(session):
+    store.fetch_app_details(10)       # will be in the LRU
+    store.fetch_app_details(20)
+    store._lru.clear()
+    store.fetch_app_details(10)       # back in the LRU; 20 only in Mongo
+    session.calls.clear()
+    session.scripts[40] = [404]
+
+    results = store.fetch_many_app_details([10, 20, 30, 40, 10])
+
+    assert sorted(session.calls) == [30, 40]
+    assert results[10]["name"] == "Game 10" and results[20]["name"] == "Game 20"
+    assert results[30]["name"] == "Game 30" and results[40] is None
+    # 30 is cached now; 40 failed, so it isn't (not even as a miss)
+    assert AppDetailsCache.objects(appid=30).count() == 1
+    assert AppDetailsCache.objects(appid=40).count() == 0
+
+
+def test_cache_stats_are_exported_as_metrics(session):
+    from flask_app.metrics import registry
+
+    store.fetch_app_details(10)
+    store.fetch_app_details(10)
+    text = registry.render()
+    assert 'app_cache_events_total{cache="steam_store",event="lru_hits"} 1' in text
+    assert 'app_cache_events_total{cache="steam_store",event="misses"} 1' in text
+    assert 'app_cache_entries{cache="steam_store"} 1' in text
@@ -0,0 +1,39 @@
+"""
+Partial retrains have to agree with what a full retrain would produce.
+"""
+import pytest
+
+from flask_app import model_store
+from flask_app.models import Game, User
+from flask_app.train import retrain_users, train_model
+
+
+@pytest.fixture(autouse=True)
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(model_store, "MODEL_STORE_DIR", str(tmp_path))
+    monkeypatch.setattr(model_store, "_model", None)
+
+
+def test_user_without_signal_leaves_the_model():
+    Game(appid=1, name="a", tags=["RPG"]).save()
+    Game(appid=2, name="b", tags=["Action"]).save()
+    a = User(email="a@example.com", password_hash="x", favorite_tags=["RPG"]).save()
+    User(email="b@example.com", password_hash="x", favorite_tags=["Action"]).save()
+    User(email="c@example.com", password_hash="x", favorite_tags=["RPG", "Action"]).save()
+    train_model()
+    assert model_store.get_model().n_users == 3
+
+    # Clearing every preference leaves an all-zero vector: a full retrain would drop it
+    a.favorite_tags = []
+    a.save()
+    retrain_users([a.id])
+
+    model = model_store.get_model()
+    assert model.vector_for(str(a.id)) is None and model.n_users == 2
+    assert str(a.id) not in [uid for uid, _ in model.kneighbors([1.0, 1.0], 3)]
+
+    # And comes back once it has signal again
+    a.favorite_tags = ["RPG"]
+    a.save()
+    retrain_users([a.id])
+    assert model_store.get_model().vector_for(str(a.id)) is not None